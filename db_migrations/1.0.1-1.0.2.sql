@@ -0,0 +1,60 @@
+CREATE TABLE bug_snapshot (
+    tracker_id INTEGER NOT NULL,
+    bug_id VARCHAR NOT NULL,
+    project_id INTEGER,
+    owner VARCHAR,
+    reporter VARCHAR,
+    status VARCHAR NOT NULL,
+    changeddate TIMESTAMP WITHOUT TIME ZONE,
+    data BYTEA NOT NULL,
+    synced_ts TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (tracker_id, bug_id),
+    FOREIGN KEY(tracker_id) REFERENCES tracker (id),
+    FOREIGN KEY(project_id) REFERENCES project (id)
+);
+CREATE INDEX ix_bug_snapshot_project_id ON bug_snapshot (project_id);
+CREATE INDEX ix_bug_snapshot_owner ON bug_snapshot (owner);
+CREATE INDEX ix_bug_snapshot_status ON bug_snapshot (status);
+CREATE INDEX ix_bug_snapshot_changeddate ON bug_snapshot (changeddate);
+
+CREATE TABLE bug_sync_state (
+    tracker_id INTEGER NOT NULL,
+    watermark TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    synced_ts TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    extra_data BYTEA,
+    PRIMARY KEY (tracker_id),
+    FOREIGN KEY(tracker_id) REFERENCES tracker (id)
+);
+
+-- add bugzilla_rpc to tracker.type
+BEGIN;
+ALTER type tracker_type_enum RENAME to old__tracker_type_enum;
+CREATE type tracker_type_enum as enum ('bugzilla', 'trac', 'cookie_trac', 'igozilla', 'bitbucket', 'rockzilla', 'pivotaltracker', 'harvest', 'unfuddle', 'github', 'jira', 'bugzilla_rpc');
+ALTER TABLE tracker ALTER COLUMN type TYPE tracker_type_enum USING type::text::tracker_type_enum;
+DROP type old__tracker_type_enum;
+COMMIT;
+
+-- time_rollup, ticket_id has the same type as in time_entry
+CREATE TABLE time_rollup AS
+    SELECT project_id, ticket_id, user_id, date, time
+    FROM time_entry
+    WITH NO DATA;
+ALTER TABLE time_rollup
+    ADD COLUMN id SERIAL PRIMARY KEY,
+    ALTER COLUMN project_id SET NOT NULL,
+    ALTER COLUMN user_id SET NOT NULL,
+    ALTER COLUMN date SET NOT NULL,
+    ALTER COLUMN time SET NOT NULL,
+    ADD FOREIGN KEY(project_id) REFERENCES project (id),
+    ADD FOREIGN KEY(user_id) REFERENCES "user" (id);
+CREATE INDEX ix_time_rollup_project_id ON time_rollup (project_id);
+CREATE INDEX ix_time_rollup_ticket_id ON time_rollup (ticket_id);
+CREATE INDEX ix_time_rollup_date ON time_rollup (date);
+CREATE INDEX ix_time_rollup_user_id_date ON time_rollup (user_id, date);
+CREATE UNIQUE INDEX ix_time_rollup_key
+    ON time_rollup (project_id, COALESCE(CAST(ticket_id AS VARCHAR), ''), user_id, date);
+INSERT INTO time_rollup (project_id, ticket_id, user_id, date, time)
+    SELECT project_id, ticket_id, user_id, date, SUM(time)
+    FROM time_entry
+    WHERE deleted = FALSE
+    GROUP BY project_id, ticket_id, user_id, date;
@@ -118,6 +118,7 @@ def main(global_config, **settings):
     jinja2_env.filters['parse_datetime_to_miliseconds'] = filters.parse_datetime_to_miliseconds
     jinja2_env.filters['parse_user_email'] = filters.parse_user_email
     jinja2_env.filters['timedelta_to_minutes'] = filters.timedelta_to_minutes
+    jinja2_env.filters['timesince'] = filters.timesince
     jinja2_env.filters['format_time'] = filters.format_time
     jinja2_env.filters['dictsort2'] = filters.do_dictsort
     jinja2_env.filters['tojson'] = filters.tojson
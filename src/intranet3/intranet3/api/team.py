@@ -9,7 +9,7 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy import func
 
 from intranet3.utils.views import ApiView
-from intranet3.models import Team as Team_m, TeamMember, User, Sprint, Project, Client, TimeEntry
+from intranet3.models import Team as Team_m, TeamMember, User, Sprint, Project, Client, TimeRollup
 from intranet3.schemas.team import TeamAddSchema, TeamUpdateSchema
 from intranet3.utils.decorators import has_perm
 from intranet3 import helpers as h
@@ -23,14 +23,14 @@ class Teams(ApiView):
     def get(self):
         def get_worked_hours(startDate, endDate, projects_ids):
             worked_hours = DBSession.query(
-                TimeEntry.project_id,
-                func.sum(TimeEntry.time)
+                TimeRollup.project_id,
+                func.sum(TimeRollup.time)
             )
             return worked_hours\
-                .filter(TimeEntry.project_id.in_(projects_ids))\
-                .filter(TimeEntry.date >= startDate)\
-                .filter(TimeEntry.date <= endDate)\
-                .group_by(TimeEntry.project_id)
+                .filter(TimeRollup.project_id.in_(projects_ids))\
+                .filter(TimeRollup.date >= startDate)\
+                .filter(TimeRollup.date <= endDate)\
+                .group_by(TimeRollup.project_id)
 
         def get_project_worked_hours(project_id, worked_hours):
             worked_hours = filter(lambda x: x[0] == project_id, worked_hours)
@@ -1,4 +1,5 @@
 from .bugzilla import BugzillaFetcher
+from .bugzilla_rpc import BugzillaRPCFetcher
 from .rockzilla import RockzillaFetcher
 from .pivotaltracker import PivotalTrackerFetcher
 from .unfuddle import UnfuddleFetcher
@@ -7,16 +8,19 @@ from .trac import TracFetcher
 from .fake import FakeFetcher
 from .jira import JiraFetcher
 from .igozilla import IgozillaFetcher
+from .mirror import MirrorFetcher, sync_tracker
 
 from .base import (
     FetchException,
     FetcherTimeout,
     FetcherBaseException,
     FetcherBadDataError,
+    FetcherUnavailable,
 )
 
 FETCHERS = {
     'bugzilla': BugzillaFetcher,
+    'bugzilla_rpc': BugzillaRPCFetcher,
     'rockzilla': RockzillaFetcher,
     'pivotaltracker': PivotalTrackerFetcher,
     'unfuddle': UnfuddleFetcher,
@@ -28,7 +32,16 @@ FETCHERS = {
 }
 
 
-def get_fetcher(tracker, credentials, user, login_mapping):
+def get_fetcher(tracker, credentials, user, login_mapping, mirror=False):
+    """
+    With mirror=True bugs are read from local bug mirror
+    if the tracker was already synchronized
+    """
     type = tracker.type
     fetcher_class = FETCHERS[type]
-    return fetcher_class(tracker, credentials, user, login_mapping)
+    fetcher = fetcher_class(tracker, credentials, user, login_mapping)
+    if mirror and fetcher_class.SUPPORTS_MIRROR:
+        state = MirrorFetcher.get_state(tracker)
+        if state is not None:
+            return MirrorFetcher(fetcher, state)
+    return fetcher
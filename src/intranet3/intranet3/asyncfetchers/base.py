@@ -1,6 +1,9 @@
 import codecs
+import time
+import datetime
 import functools
 import csv
+import itertools
 
 import gevent
 from requests.auth import HTTPBasicAuth, _basic_auth_str
@@ -9,7 +12,12 @@ from intranet3 import memcache
 from intranet3.helpers import decoded_dict
 from intranet3.log import DEBUG_LOG, ERROR_LOG
 
-from .request import RPC
+from .request import RPC, SESSIONS, closing_rpcs
+from . import cache
+from .health import UNTRACKED, get_health
+from .limiter import QueueTimeout
+from . import metrics
+from .metrics import METRICS
 from .greenlet import Greenlet
 
 DEBUG = DEBUG_LOG(__name__)
@@ -28,6 +36,11 @@ class FetcherTimeout(FetcherBaseException):
     pass
 
 
+class FetcherUnavailable(FetcherBaseException):
+    """ Tracker circuit is open, the tracker was not queried """
+    pass
+
+
 class FetcherBadDataError(FetcherBaseException):
     """
     Exception that indicates that is misconfigurated,
@@ -39,10 +52,17 @@ class FetcherBadDataError(FetcherBaseException):
 class FetcherMeta(type):
     """
     Metaclass for Fetcher classes.
-    It does three things:
+    It does five things:
     1. Spawns greenlets when one of mcs.FETCHERS method is called
     2. Generates self._memcache_key
-    3. Decides if use cached data from memcached.
+    3. Decides if use cached data from memcached, stale data is returned
+       immediately and refreshed in background greenlet, fetchers with
+       refresh_ahead set refetch entries that are about to go stale.
+    4. Coalesces identical in-flight fetches, later callers join the greenlet
+       of the first one instead of querying the tracker again.
+    5. Doesn't query trackers with open circuit (see health module).
+    Concurrency of requests to a tracker host is bounded in RPC
+    (see limiter module), outcomes are counted in metrics module.
     """
 
     MEMCACHED_KEY = '{tracker_id}-{login}-{method_name}-{args}-{kwargs}'
@@ -51,8 +71,13 @@ class FetcherMeta(type):
         'fetch_all_tickets',
         'fetch_bugs_for_query',
         'fetch_scrum',
+        'fetch_sprint',
+        'fetch_updated_tickets',
     ]
 
+    # memcached key -> fetcher that owns the fetch (per process)
+    _in_flight = {}
+
     @classmethod
     def _gen_memcached_key(mcs, tracker_id, login, method_name, args, kwargs):
         """
@@ -68,7 +93,7 @@ class FetcherMeta(type):
         @functools.wraps(f)
         def func(*args, **kwargs):
             self = args[0]
-            self._memcached_key = mcs._gen_memcached_key(
+            key = self._memcached_key = mcs._gen_memcached_key(
                 self.tracker.id,
                 self.login,
                 f.func_name,
@@ -77,20 +102,73 @@ class FetcherMeta(type):
             )
             # clear fetcher
             self._parsed_data = []
-            cached = memcache.get(self._memcached_key)
-
-            if cached is not None:
-                DEBUG(u"Bugs found in cache for key %s" % self._memcached_key)
-                self._parsed_data = cached
-            else:
-                # start greenlet
-                DEBUG(u"Bugs not in cache for key %s" % self._memcached_key)
-                self._greenlet = Greenlet.spawn(self.before_fetch)
-                self._greenlet.join(self.MAX_TIMEOUT)
-                if self._greenlet.successful():
-                    self._greenlet = Greenlet.spawn(f, *args, **kwargs)
+            self._leader = None
+            self._unavailable = False
+            self._fetch_method = method = f.func_name
+            entry = cache.get(key)
+            if entry is not None and self.refresh_ahead is not None and \
+                    entry.is_stale(self.CACHE_TIMEOUT - self.refresh_ahead):
+                # cache warmer refetches entries before they go stale
+                DEBUG(u"Refreshing bugs ahead for key %s" % key)
+                entry = None
+
+            if entry is not None:
+                DEBUG(u"Bugs found in cache for key %s" % key)
+                self._parsed_data = entry.data
+                self._fetched_at = entry.fetched_at
+                if entry.is_stale(self.CACHE_TIMEOUT):
+                    METRICS.inc(self.tracker, method, metrics.CACHE_STALE)
+                    mcs._revalidate(self, f, args[1:], kwargs)
+                else:
+                    METRICS.inc(self.tracker, method, metrics.CACHE_HIT)
+                return
+
+            leader = mcs._in_flight.get(key)
+            if leader is not None:
+                DEBUG(u"Joining in-flight fetch for key %s" % key)
+                METRICS.inc(self.tracker, method, metrics.COALESCED)
+                self._leader = leader
+                self._greenlet = leader._greenlet
+                return
+
+            if not self.health.allow_request():
+                DEBUG(u"Circuit of tracker %s is open, not fetching %s" % (
+                    self.tracker.name, key,
+                ))
+                METRICS.inc(self.tracker, method, metrics.UNAVAILABLE)
+                self._greenlet = None
+                self._unavailable = True
+                return
+
+            # start greenlet
+            DEBUG(u"Bugs not in cache for key %s" % key)
+            METRICS.inc(self.tracker, method, metrics.CACHE_MISS)
+            self._greenlet = Greenlet.spawn(
+                self._single_flight, f, args, kwargs,
+            )
+            mcs._in_flight[key] = self
+            self._greenlet.link(lambda g: mcs._in_flight.pop(key, None))
         return func
 
+    @classmethod
+    def _revalidate(mcs, fetcher, f, args, kwargs):
+        """
+        Refreshes stale entry using a copy of the fetcher,
+        so data already handed to the caller is not modified.
+        """
+        key = fetcher._memcached_key
+        if key in mcs._in_flight or not fetcher.health.allow_request():
+            return
+        DEBUG(u"Refreshing stale bugs for key %s" % key)
+        refresher = fetcher.copy()
+        refresher._memcached_key = key
+        refresher._fetch_method = fetcher._fetch_method
+        refresher._greenlet = Greenlet.spawn(
+            refresher._single_flight, f, (refresher,) + args, kwargs, False,
+        )
+        mcs._in_flight[key] = refresher
+        refresher._greenlet.link(lambda g: mcs._in_flight.pop(key, None))
+
     def __new__(mcs, name, bases, attrs):
         for attr_name in mcs.FETCHERS:
             if attr_name in attrs:
@@ -103,13 +181,29 @@ class BaseFetcher(object):
     __metaclass__ = FetcherMeta
     BUG_PRODUCER_CLASS = None
     get_converter = None
-    CACHE_TIMEOUT = 3 * 60  # 3 minutes
+    CACHE_TIMEOUT = 3 * 60  # 3 minutes, after that data is stale
+    CACHE_HARD_TIMEOUT = 30 * 60  # stale data is not served after 30 minutes
     SPRINT_REGEX = 's=%s(?!\S)'
     MAX_TIMEOUT = 30  # DON'T WAIT LONGER THAN DEFINED TIMEOUT
+    # bug statuses (as in produced Bug.status) returned by fetch_* methods
+    # for resolved=False/True, used when querying the local bug mirror
+    UNRESOLVED_STATUSES = ()
+    RESOLVED_STATUSES = ()
+    # read response body incrementally, see parse_response
+    STREAM_RESPONSE = False
+    LOCK_TIMEOUT = MAX_TIMEOUT  # cross-worker fetch lock
+    LOCK_POLL_INTERVAL = 0.5
+    # fetch_sprint queries many projects of a sprint at once
+    MULTI_PROJECT_SPRINT = False
+    # fetch_updated_tickets is implemented, bugs can be mirrored locally
+    SUPPORTS_MIRROR = False
 
     def __init__(self, tracker, credentials, user, login_mapping,
                  timeout=MAX_TIMEOUT):
         self._greenlet = None
+        # subclasses may alter the attributes, keep originals for self.copy()
+        self._init_args = (tracker, credentials, user, login_mapping)
+        self._init_kwargs = dict(timeout=timeout)
         self.tracker = tracker
         self.login = credentials.login
         self.password = credentials.password
@@ -124,6 +218,20 @@ class BaseFetcher(object):
         self._parsed_data = []
         # _memcached_data is set by metaclass
         self._memcached_key = None
+        # fetcher which fetch we joined, set by metaclass
+        self._leader = None
+        # when _parsed_data was fetched from tracker (unix timestamp)
+        self._fetched_at = None
+        # set by metaclass when tracker circuit is open
+        self._unavailable = False
+        # name of called fetch_* method, set by metaclass (for metrics)
+        self._fetch_method = None
+        # seconds, entries that go stale sooner are fetched again
+        # instead of served from cache (used by the cache warmer)
+        self.refresh_ahead = None
+        # background fetches (bug mirror sync) set False, they wait full
+        # timeout and neither depend on nor count in tracker health
+        self.track_health = True
 
         self.traceback = None
         self.fetch_error = None
@@ -150,6 +258,97 @@ class BaseFetcher(object):
         """
         return None
 
+    def copy(self):
+        """ Returns new fetcher for the same tracker and credentials """
+        return self.__class__(*self._init_args, **self._init_kwargs)
+
+    @property
+    def health(self):
+        if not self.track_health:
+            return UNTRACKED
+        return get_health(self.tracker)
+
+    def get_timeout(self):
+        """ Timeout adapted to observed tracker latency """
+        return self.health.timeout(self.timeout)
+
+    @property
+    def fetched_at(self):
+        """ Datetime of the tracker response bugs come from """
+        if self._fetched_at is None:
+            return None
+        return datetime.datetime.fromtimestamp(self._fetched_at)
+
+    @property
+    def is_stale(self):
+        if self._fetched_at is None:
+            return False
+        return time.time() - self._fetched_at > self.CACHE_TIMEOUT
+
+    def _single_flight(self, f, args, kwargs, wait=True):
+        """
+        Runs before_fetch and fetch_* method guarded by short-lived memcache
+        lock, so only one uWSGI worker queries tracker for given key.
+        Other workers wait for the result to show up in memcache
+        (or give up at once when wait is False).
+        """
+        lock_key = '%s-lock' % self._memcached_key
+        owns_lock = memcache.add(lock_key, 1, self.LOCK_TIMEOUT)
+        if not owns_lock:
+            if not wait:
+                return
+            DEBUG(u"Waiting for other worker to fetch %s" % self._memcached_key)
+            entry, owns_lock = self._wait_for_other_worker(lock_key)
+            if entry is not None:
+                self._parsed_data = entry.data
+                self._fetched_at = entry.fetched_at
+                return
+        started = time.time()
+        try:
+            self.before_fetch()
+            f(*args, **kwargs)
+        except FetcherBadDataError as e:
+            # tracker answered, it is our query that is wrong
+            self._record_fetch(started)
+            METRICS.error(self.tracker, self._fetch_method, e)
+            raise
+        except QueueTimeout as e:
+            # our own queue is full, the tracker is not to blame
+            METRICS.error(self.tracker, self._fetch_method, e)
+            raise FetcherTimeout(unicode(e))
+        except Exception as e:
+            self.health.record_failure()
+            METRICS.error(self.tracker, self._fetch_method, e)
+            raise
+        else:
+            self._record_fetch(started)
+        finally:
+            if owns_lock:
+                memcache.delete(lock_key)
+
+    def _record_fetch(self, started):
+        # slow fetches are sampled too, so the adaptive timeout can grow
+        latency = time.time() - started
+        METRICS.observe(
+            self.tracker, self._fetch_method, 'fetch_seconds', latency,
+        )
+        self.health.record_success(latency)
+
+    def _wait_for_other_worker(self, lock_key):
+        """
+        Returns (cache_entry, owns_lock),
+        takes over the lock when the other worker gives up without result
+        """
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while time.time() < deadline:
+            gevent.sleep(self.LOCK_POLL_INTERVAL)
+            entry = cache.get(self._memcached_key)
+            if entry is not None:
+                return entry, False
+            if memcache.add(lock_key, 1, self.LOCK_TIMEOUT):
+                return None, True
+        return None, False
+
     def apply_auth(self, rpc_or_session):
         if isinstance(rpc_or_session, RPC):
             session = rpc_or_session.s
@@ -160,8 +359,13 @@ class BaseFetcher(object):
             self._auth_data = self.get_auth()
         self.set_auth(session, self._auth_data)
 
+    def get_session_key(self):
+        """ Key under which keep-alive sessions are pooled """
+        return SESSIONS.make_key(self.tracker.url, self.login, self.password)
+
     def get_rpc(self):
-        rpc = RPC()
+        rpc = RPC(session_key=self.get_session_key())
+        rpc.timeout = self.get_timeout()
         self.apply_auth(rpc)
         return rpc
 
@@ -169,25 +373,61 @@ class BaseFetcher(object):
         if not isinstance(rpcs, list):
             rpcs = [rpcs]
 
+        with closing_rpcs(rpcs):
+            for rpc in rpcs:
+                self.start_rpc(rpc)
+
+            for rpc in rpcs:
+                self._parsed_data.extend(self.read_rpc(rpc))
+
+        self.finish_consume()
+
+    def start_rpc(self, rpc):
+        """ Starts rpc with pooled session and fetcher's auth """
         if not self._auth_data:
             self._auth_data = self.get_auth()
 
-        for rpc in rpcs:
-            self.set_auth(rpc.s, self._auth_data)
-            self.add_data(rpc.s)
-            rpc.start()
-
-        for rpc in rpcs:
-            response = rpc.get_result()
+        rpc.borrow(self.get_session_key())
+        self.set_auth(rpc.s, self._auth_data)
+        self.add_data(rpc.s)
+        if self.STREAM_RESPONSE:
+            rpc.kwargs['stream'] = True
+        rpc.timeout = self.get_timeout()
+        return rpc.start()
+
+    def read_rpc(self, rpc):
+        """ Waits for started rpc and returns list of bug dicts """
+        response = rpc.get_result()
+        try:
             self.check_if_failed(response)
-            self._parsed_data.extend(self.parse(response.text))
+            started = time.time()
+            data = list(self.parse_response(response))
+            self.observe_response(response, started)
+        finally:
+            # streamed body may be left unread, give the host slot back
+            response.close()
+        return data
+
+    def observe_response(self, response, parse_started):
+        """ Records size of parsed response and time spent parsing it """
+        method = self._fetch_method
+        METRICS.observe(
+            self.tracker, method, 'parse_seconds', time.time() - parse_started,
+        )
+        METRICS.observe(
+            self.tracker, method, 'response_bytes',
+            metrics.response_size(response),
+        )
 
+    def finish_consume(self):
+        """ Post-processes fetched data and stores it in cache """
         self._parsed_data = self.after_parsing(self._parsed_data)
-        memcache.set(
+        entry = cache.set(
             self._memcached_key,
             self._parsed_data,
-            self.CACHE_TIMEOUT,
+            self.CACHE_HARD_TIMEOUT,
         )
+        self._fetched_at = entry.fetched_at
 
     def check_if_failed(self, response):
         code = response.status_code
@@ -197,26 +437,51 @@ class BaseFetcher(object):
             reason = u'Received response %s' % code
             raise FetchException(reason)
 
-    def get_result(self):
+    def get_raw_result(self):
+        """ Waits for the fetch and returns parsed (not produced) data """
+        if self._unavailable:
+            raise FetcherUnavailable(
+                u'Tracker %s is not responding' % self.tracker.name
+            )
+
         if self._greenlet is not None:
-            self._greenlet.join(self.MAX_TIMEOUT)
+            self._greenlet.join(self.get_timeout())
 
             if not self._greenlet.ready():
+                if self._leader is None:
+                    # fetchers that joined it don't count the timeout again
+                    self.health.record_failure()
+                METRICS.error(self.tracker, self._fetch_method, FetcherTimeout())
                 raise FetcherTimeout()
 
             self._greenlet.reraise_exc()
 
+        if self._leader is not None:
+            # producers don't modify raw data so it can be shared
+            self._parsed_data = self._leader._parsed_data
+            self._extra_data = self._leader._extra_data
+            self._fetched_at = self._leader._fetched_at
+
+        return self._parsed_data
+
+    def produce(self, parsed_data, extra_data=None):
+        """ Yields (bug_desc, bug) pairs """
         bug_producer = self.BUG_PRODUCER_CLASS(
             self.tracker,
             self.login_mapping,
-            self._extra_data,
+            self._extra_data if extra_data is None else extra_data,
         )
+        for bug_desc in parsed_data:
+            yield bug_desc, bug_producer(bug_desc)
+
+    def get_result(self):
         bugs = {}
-        for bug_desc in self._parsed_data:
-            bug = bug_producer(
-                bug_desc,
-            )
-            bugs[bug.id] = bug
+        parsed_data = self.get_raw_result()
+        method = self._fetch_method
+        with METRICS.timer(self.tracker, method, 'produce_seconds'):
+            for bug_desc, bug in self.produce(parsed_data):
+                bugs[bug.id] = bug
+        METRICS.observe(self.tracker, method, 'bugs', len(bugs))
 
         return bugs.values()
 
@@ -225,6 +490,13 @@ class BaseFetcher(object):
     def after_parsing(self, parsed_data):
         return parsed_data
 
+    def parse_response(self, response):
+        """
+        Returns iterable of bug dicts,
+        fetchers with STREAM_RESPONSE may read response incrementally here
+        """
+        return self.parse(response.text)
+
     def parse(self, data):
         raise NotImplementedError()
 
@@ -248,6 +520,44 @@ class BaseFetcher(object):
     def fetch_scrum(self, sprint_name, project_id, component_id=None):
         raise NotImplementedError()
 
+    def fetch_sprint(self, sprint_name, selectors):
+        """
+        Start fetching sprint tickets of many projects with one combined
+        query, `selectors` is a tuple of (project_selector,
+        component_selector) pairs. Query may return tickets of other
+        projects too, caller maps tickets to projects with selector mapping.
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def split_selectors(selectors):
+        """
+        Returns sorted (projects, components) of sprint selectors,
+        components are empty when some project takes all its components
+        """
+        projects = set()
+        components = set()
+        whole_project = False
+        for project_selector, component_selector in selectors:
+            projects.add(project_selector)
+            if component_selector:
+                components.update(
+                    c.strip() for c in component_selector.split(',')
+                )
+            else:
+                whole_project = True
+        if whole_project:
+            components = set()
+        return sorted(projects), sorted(components)
+
+    def fetch_updated_tickets(self, since):
+        """
+        Start fetching all tickets (in every state) visible to the user
+        and changed after `since` datetime, used by bug mirror sync.
+        With `since` None all open tickets are fetched (first sync).
+        """
+        raise NotImplementedError()
+
 
 class BasicAuthMixin(object):
 
@@ -271,20 +581,30 @@ class CSVParserMixin(object):
     # CSV delimited
     delimiter = ','
 
-    def parse(self, data):
-        if codecs.BOM_UTF8 == data[:3]:
-            data = data.decode('utf-8-sig')
-        else:
-            data = data.encode('utf-8')
-
-        if '\r\n' in data:
-            data = data.split('\r\n')
-        else:
-            data = data.split('\n')
-
-        reader = csv.DictReader(data,  delimiter=self.delimiter)
-        result = []
+    # CSV is parsed line by line while it is downloaded,
+    # so the body is never held in memory as a whole
+    STREAM_RESPONSE = True
+    CHUNK_SIZE = 64 * 1024
+
+    def parse_response(self, response):
+        lines = response.iter_lines(chunk_size=self.CHUNK_SIZE)
+        return self.parse_lines(lines)
+
+    def parse_lines(self, lines):
+        """ Yields bug dicts from iterable of encoded CSV lines """
+        lines = iter(lines)
+        first_line = next(lines, '')
+        if first_line.startswith(codecs.BOM_UTF8):
+            first_line = first_line[len(codecs.BOM_UTF8):]
+
+        reader = csv.DictReader(
+            itertools.chain([first_line], lines),
+            delimiter=self.delimiter,
+        )
         for bug_desc in reader:
-            bug_desc = decoded_dict(bug_desc, encoding=self.encoding)
-            result.append(bug_desc)
-        return result
+            yield decoded_dict(bug_desc, encoding=self.encoding)
+
+    def parse(self, data):
+        if isinstance(data, unicode):
+            data = data.encode(self.encoding)
+        return list(self.parse_lines(data.splitlines()))
@@ -3,23 +3,28 @@ from intranet3.models.project import SelectorMapping
 from intranet3.priorities import PRIORITIES
 
 
+_MISSING = object()
+
+
 class ToDictMixin(object):
+    """
+    Public attributes are listed in FIELDS,
+    so serialization doesn't need to look them up on every object
+    """
+    __slots__ = ()
+
+    FIELDS = ()
 
     def get_attrs(self):
-        result = []
-        for attr in dir(self):
-            if attr.startswith('_'):
-                continue
-            value = getattr(self, attr)
-            if hasattr(value, '__call__'):
-                continue
-            result.append(attr)
-        return result
+        return self.FIELDS
 
     def to_dict(self):
         result = {}
-        for attr in self.get_attrs():
-            value = getattr(self, attr)
+        for attr in self.FIELDS:
+            value = getattr(self, attr, _MISSING)
+            if value is _MISSING:
+                # optional attribute that was never set
+                continue
             if hasattr(value, 'to_dict'):
                 value = value.to_dict()
             if isinstance(value, (list, tuple, set)):
@@ -32,6 +37,9 @@ class ToDictMixin(object):
 
 
 class Scrum(ToDictMixin):
+    FIELDS = ('points', 'velocity', 'color')
+    __slots__ = FIELDS
+
     def __init__(self):
         self.points = None
         self.velocity = 0.0
@@ -39,6 +47,18 @@ class Scrum(ToDictMixin):
 
 
 class Bug(ToDictMixin):
+    # attributes filled by bug producer
+    PRODUCED_FIELDS = (
+        'id', 'time', 'desc', 'reporter', 'owner', 'priority',
+        'priority_number', 'severity', 'severity_number', 'status',
+        'resolution', 'project_name', 'component_name', 'version',
+        'project_id', 'project', 'deadline', 'opendate', 'changeddate',
+        'dependson', 'blocked', 'url', 'labels',
+    )
+    # attributes set later on, by lib.bugs and views
+    FIELDS = PRODUCED_FIELDS + ('scrum', 'sprint_time', 'danger')
+    __slots__ = FIELDS + ('_tracker_type', '_tracker_name')
+
     def __init__(self, tracker):
         self._tracker_type = tracker.type
         self._tracker_name = tracker.name
@@ -76,7 +96,28 @@ class Bug(ToDictMixin):
         )
 
 
+class ProducerMeta(type):
+    """
+    Compiles attribute -> getter plan of producer class once,
+    getter is `get_{attr}` method of the producer or None
+    (value is then taken from parsed data)
+    """
+    def __init__(cls, name, bases, attrs):
+        super(ProducerMeta, cls).__init__(name, bases, attrs)
+        product_class = getattr(cls, cls._PRODUCT_CLASS_ATTR)
+        fields = getattr(
+            product_class, 'PRODUCED_FIELDS', product_class.FIELDS,
+        )
+        cls._plan = tuple(
+            (attr, getattr(cls, 'get_%s' % attr, None))
+            for attr in fields
+        )
+
+
 class BaseScrumProducer(object):
+    __metaclass__ = ProducerMeta
+    _PRODUCT_CLASS_ATTR = 'SCRUM_CLASS'
+
     SCRUM_CLASS = Scrum
 
     def __init__(self, tracker, login_mapping, extra_data):
@@ -90,11 +131,9 @@ class BaseScrumProducer(object):
         data = (bug, self.tracker, self.login_mapping, parsed_data)
 
         attrs = self.get_attrs(*data)
-        for attr in scrum.get_attrs():
-            getter_name = 'get_%s' % attr
-            if hasattr(self, getter_name):
-                getter = getattr(self, getter_name)
-                value = getter(*data)
+        for attr, getter in self._plan:
+            if getter is not None:
+                value = getter(self, *data)
             elif attr in attrs:
                 value = attrs[attr]
             else:
@@ -107,6 +146,9 @@ class BaseScrumProducer(object):
 
 
 class BaseBugProducer(object):
+    __metaclass__ = ProducerMeta
+    _PRODUCT_CLASS_ATTR = 'BUG_CLASS'
+
     BUG_CLASS = Bug
     SCRUM_PRODUCER_CLASS = BaseScrumProducer
 
@@ -119,6 +161,7 @@ class BaseBugProducer(object):
             login_mapping,
             extra_data,
         )
+        self._selector_mapping = None
 
     def __call__(self, raw_data):
         parsed_data = self.parse(self.tracker, self.login_mapping, raw_data)
@@ -127,14 +170,12 @@ class BaseBugProducer(object):
 
         bug = self.BUG_CLASS(self.tracker)
 
-        for attr in bug.get_attrs():
+        for attr, getter in self._plan:
             # 2 ways of getting attribute value:
             # 1. from get_{attr} method if exists
             # 2. from parsed_data
-            getter_name = 'get_%s' % attr
-            if hasattr(self, getter_name):
-                getter = getattr(self, getter_name)
-                value = getter(*data)
+            if getter is not None:
+                value = getter(self, *data)
             elif attr in parsed_data:
                 value = parsed_data[attr]
             else:
@@ -189,8 +230,14 @@ class BaseBugProducer(object):
         """
         return raw_data
 
+    @property
+    def selector_mapping(self):
+        if self._selector_mapping is None:
+            self._selector_mapping = SelectorMapping.for_tracker(self.tracker)
+        return self._selector_mapping
+
     def get_project_id_(self, tracker, bug):
-        return SelectorMapping(tracker).match(
+        return self.selector_mapping.match(
             bug.id,
             bug.project_name,
             bug.component_name,
@@ -1,16 +1,19 @@
-import requests
+import itertools
 from dateutil.parser import parse
 from xml.etree import ElementTree as ET
 
+from intranet3 import memcache
 from intranet3 import helpers as h
 from intranet3.models import User
-from .request import RPC
+from .request import RPC, closing_rpcs
 from .base import BaseFetcher, BasicAuthMixin, CSVParserMixin, FetcherBadDataError
 from .bug import BaseBugProducer, ToDictMixin, BaseScrumProducer
 from .utils import parse_whiteboard
 
 
 class BlockedOrDependson(ToDictMixin):
+    FIELDS = ('id', 'status', 'desc', 'resolved', 'url', 'owner')
+
     def __init__(self, bug_id, status, description, tracker):
         self.id = bug_id
         self.status = status
@@ -78,32 +81,75 @@ class BugzillaBugProducer(BaseBugProducer):
         return labels
 
 
-class FetchBlockedAndDependsonMixin(object):
+class _ChunksReader(object):
+    """ File-like object reading from an iterable of string chunks """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return result
+
 
-    def pre_parse(self, data):
+class FetchBlockedAndDependsonMixin(object):
+    # ids sent in a single show_bug.cgi request
+    DEPENDENCY_CHUNK_SIZE = 100
+    # show_bug.cgi requests run at the same time
+    DEPENDENCY_CONCURRENCY = 4
+    XML_CHUNK_SIZE = 16 * 1024
+
+    # statuses of blocked/dependson bugs are shared by all fetchers of tracker
+    DEPENDENCY_CACHE_KEY = 'bugzilla-dependency-%s-%s'
+    DEPENDENCY_CACHE_TIMEOUT = 3 * 60
+
+    def pre_parse(self, chunks):
+        """ Returns file-like object with XML from iterable of chunks """
+        chunks = iter(chunks)
+        head = ''
+        for chunk in chunks:
+            head += chunk
+            if '?>' in head:  # whole XML declaration read
+                break
         # igozilla returns iso-8859-2, but does not declare it
-        data = data.replace(
+        head = head.replace(
             '<?xml version="1.0" standalone="yes"?>',
             '<?xml version="1.0" encoding="iso-8859-2" standalone="yes"?>'
         )
-        #data = data.decode(self.encoding)
-        xml = ET.fromstring(data)
-        return xml
-
-    def parse_ids(self, data):
-        xml = self.pre_parse(data)
+        return _ChunksReader(itertools.chain([head], chunks))
+
+    def iter_bugs(self, chunks):
+        """ Yields <bug> elements, each one is cleared once processed """
+        source = self.pre_parse(chunks)
+        root = None
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event == 'end' and element.tag == 'bug':
+                yield element
+                element.clear()
+                root.clear()
+
+    def parse_ids(self, chunks):
         result = {}
-        for bug in xml.findall('bug'):
+        for bug in self.iter_bugs(chunks):
             bug_id = bug.find('bug_id').text
             blocked = [el.text for el in bug.findall('blocked')]
             dependson = [el.text for el in bug.findall('dependson')]
             result[bug_id] = (blocked, dependson)
         return result
 
-    def parse_statuses(self, data):
-        xml = self.pre_parse(data)
+    def parse_statuses(self, chunks):
         result = {}
-        for bug in xml.findall('bug'):
+        for bug in self.iter_bugs(chunks):
             bug_id = bug.find('bug_id').text
             status = getattr(bug.find('bug_status'), 'text', None)
             description = getattr(bug.find('short_desc'), 'text', None)
@@ -114,54 +160,101 @@ class FetchBlockedAndDependsonMixin(object):
             }
         return result
 
+    def _show_bug_rpc(self, ids, fields):
+        rpc = self.get_rpc()
+        rpc.url = '%s/show_bug.cgi' % self.tracker.url
+        rpc.method = 'POST'
+        rpc.kwargs = dict(
+            data=dict(ctype='xml', id=ids, field=fields),
+            stream=True,
+        )
+        return rpc
+
+    def _fetch_xml(self, ids, fields, parse):
+        """
+        Fetches bugs by chunks of ids, DEPENDENCY_CONCURRENCY chunks at a time,
+        and merges results of parse
+        """
+        ids = sorted(ids)
+        size = self.DEPENDENCY_CHUNK_SIZE
+        chunks = [ids[i:i + size] for i in xrange(0, len(ids), size)]
+        result = {}
+        for i in xrange(0, len(chunks), self.DEPENDENCY_CONCURRENCY):
+            rpcs = [
+                self._show_bug_rpc(chunk, fields).start()
+                for chunk in chunks[i:i + self.DEPENDENCY_CONCURRENCY]
+            ]
+            with closing_rpcs(rpcs):
+                for rpc in rpcs:
+                    response = rpc.get_result()
+                    try:
+                        result.update(parse(
+                            response.iter_content(chunk_size=self.XML_CHUNK_SIZE)
+                        ))
+                    finally:
+                        response.close()
+        return result
+
     def get_ids(self, ids):
-        url = '%s/show_bug.cgi' % self.tracker.url
-        data = dict(
-            ctype='xml',
-            id=ids,
-            field=['blocked', 'dependson', 'bug_id']
+        return self._fetch_xml(
+            ids, ['blocked', 'dependson', 'bug_id'], self.parse_ids,
         )
-        s = requests.Session()
-        self.set_auth(s)
-        result = s.request('POST', url, data=data, verify=False)
 
-        return self.parse_ids(result.content)
+    def fetch_statuses(self, ids):
+        return self._fetch_xml(
+            ids, ['bug_status', 'bug_id', 'short_desc'], self.parse_statuses,
+        )
 
     def get_statuses(self, ids):
-        url = '%s/show_bug.cgi' % self.tracker.url
-        data = dict(
-            ctype='xml',
-            id=ids,
-            field=['bug_status', 'bug_id', 'short_desc']
+        key = lambda bug_id: self.DEPENDENCY_CACHE_KEY % (
+            self.tracker.id, bug_id,
         )
-        s = requests.Session()
-        self.set_auth(s)
-        result = s.request('POST', url, data=data, verify=False)
+        ids = list(ids)
+        cached = memcache.get_dict(*[key(bug_id) for bug_id in ids]) \
+            if ids else {}
+        result = {}
+        missing = []
+        for bug_id in ids:
+            status = cached.get(key(bug_id))
+            if status is None:
+                missing.append(bug_id)
+            else:
+                result[bug_id] = status
+
+        if missing:
+            fetched = self.fetch_statuses(missing)
+            memcache.set_many(
+                dict((key(bug_id), status) for bug_id, status in fetched.iteritems()),
+                timeout=self.DEPENDENCY_CACHE_TIMEOUT,
+            )
+            result.update(fetched)
+        return result
 
-        return self.parse_statuses(result.content)
+    def get_dependencies(self, parsed_data):
+        """ Returns bug id -> (blocked ids, dependson ids) """
+        ids = [bug['bug_id'] for bug in parsed_data]
+        return self.get_ids(ids) if ids else {}
 
     def after_parsing(self, parsed_data):
-        ids = [bug['bug_id'] for bug in parsed_data]
-        blocked_and_dependson = self.get_ids(ids)
-        blocked_and_dependson_ids = []
+        blocked_and_dependson = self.get_dependencies(parsed_data)
+        blocked_and_dependson_ids = set()
         for blocked, dependson in blocked_and_dependson.itervalues():
-            blocked_and_dependson_ids.extend(blocked)
-            blocked_and_dependson_ids.extend(dependson)
+            blocked_and_dependson_ids.update(blocked)
+            blocked_and_dependson_ids.update(dependson)
 
-        bad_statuses = self.get_statuses(
-            set(blocked_and_dependson_ids)
-        )
+        bad_statuses = self.get_statuses(blocked_and_dependson_ids)
 
         for bug_data in parsed_data:
             bug_id = bug_data['bug_id']
             blocked, dependson = blocked_and_dependson.get(bug_id, ([], []))
+            # bugs we are not allowed to see are not returned by bugzilla
             bug_data['blocked'] = [
                 bad_statuses[bug_id]
-                for bug_id in blocked
+                for bug_id in blocked if bug_id in bad_statuses
             ]
             bug_data['dependson'] = [
                 bad_statuses[bug_id]
-                for bug_id in dependson
+                for bug_id in dependson if bug_id in bad_statuses
             ]
 
         return parsed_data
@@ -180,18 +273,24 @@ class BugzillaFetcher(FetchBlockedAndDependsonMixin,
 
     COLUMNS_COOKIE = "%20".join(COLUMNS)
     SPRINT_REGEX = '[[:<:]]s=%s[[:>:]]'
+    MULTI_PROJECT_SPRINT = True
+    SUPPORTS_MIRROR = True
+
+    UNRESOLVED_STATUSES = (
+        'NEW', 'ASSIGNED', 'REOPENED', 'UNCONFIRMED', 'CONFIRMED', 'WAITING',
+    )
+    RESOLVED_STATUSES = ('RESOLVED', 'VERIFIED')
 
     def common_url_params(self):
         return dict(
-            bug_status=['NEW', 'ASSIGNED', 'REOPENED', 'UNCONFIRMED',
-                        'CONFIRMED', 'WAITING'],
+            bug_status=list(self.UNRESOLVED_STATUSES),
             ctype='csv',
             emailassigned_to1='1'
         )
 
     def resolved_common_url_params(self):
         return {
-            'bug_status': ['RESOLVED', 'VERIFIED'],
+            'bug_status': list(self.RESOLVED_STATUSES),
             'ctype': 'csv',
             'emailreporter1': '1',
             'field0-0-0': 'resolution',
@@ -212,8 +311,10 @@ class BugzillaFetcher(FetchBlockedAndDependsonMixin,
         )
 
     def check_if_failed(self, response):
-        #ugly hack, I know
-        if response.content.startswith("<!DOCTYPE html PUBLIC"):
+        # bugzilla answers with login page instead of CSV for wrong
+        # credentials, check only headers so streamed body is not read here
+        content_type = response.headers.get('content-type', '')
+        if content_type.startswith('text/html'):
             msg = 'Wrong credentials for tracker %s' % self.tracker.name
             raise FetcherBadDataError(msg)
         super(BugzillaFetcher, self).check_if_failed(response)
@@ -224,8 +325,8 @@ class BugzillaFetcher(FetchBlockedAndDependsonMixin,
             create_cookie('COLUMNLIST', self.COLUMNS_COOKIE)
         )
 
-    def fetch_scrum(self, sprint_name, project_id=None, component_id=None):
-        params = dict(
+    def _scrum_params(self, sprint_name):
+        return dict(
             ctype='csv',
             status_whiteboard_type='regexp',
             status_whiteboard=self.SPRINT_REGEX % sprint_name,
@@ -241,54 +342,53 @@ class BugzillaFetcher(FetchBlockedAndDependsonMixin,
                 'CLOSED'
             ],
         )
-        url = '%s/buglist.cgi' % self.tracker.url
 
+    def buglist(self, params):
+        """ Fetches bugs from buglist.cgi CSV """
+        url = '%s/buglist.cgi' % self.tracker.url
         body = h.serialize_url('', **params)
         rpc = RPC(url=url, method='POST', data=body)
         self.consume(rpc)
 
-    def fetch_user_tickets(self, resolved=False):
+    def _sprint_params(self, sprint_name, selectors):
+        params = self._scrum_params(sprint_name)
+        # bugzilla ORs values of the same field
+        products, components = self.split_selectors(selectors)
+        params['product'] = products
+        if components:
+            params['component'] = components
+        return params
+
+    def _updated_params(self, since):
+        if since is None:
+            return dict(ctype='csv', bug_status=list(self.UNRESOLVED_STATUSES))
+        return dict(
+            ctype='csv',
+            chfieldfrom=since.strftime('%Y-%m-%d %H:%M'),
+            chfieldto='Now',
+            bug_status=list(
+                self.UNRESOLVED_STATUSES + self.RESOLVED_STATUSES + ('CLOSED',)
+            ),
+        )
+
+    def _user_params(self, resolved):
         params = self.resolved_common_url_params() \
             if resolved else self.common_url_params()
         params.update(self.single_user_params())
+        return params
 
-        url = '%s/buglist.cgi' % self.tracker.url
-        body = h.serialize_url('', **params)
-        rpc = RPC(url=url, method='POST', data=body)
-        self.consume(rpc)
-
-    def fetch_all_tickets(self, resolved=False):
+    def _all_params(self, resolved):
         params = self.resolved_common_url_params() \
             if resolved else self.common_url_params()
         params.update(self.all_users_params())
+        return params
 
-        url = '%s/buglist.cgi' % self.tracker.url
-        body = h.serialize_url('', **params)
-        rpc = RPC(url=url, method='POST', data=body)
-        self.consume(rpc)
-
-    def fetch_bugs_for_query(self, ticket_ids=None, project_selector=None,
-                             component_selector=None, version=None,
-                             resolved=False):
-        super(BugzillaFetcher, self).fetch_bugs_for_query(
-            ticket_ids,
-            project_selector,
-            component_selector,
-            version,
-            resolved,
-        )
-
+    def _query_params(self, ticket_ids, project_selector, component_selector,
+                      resolved):
         if resolved:
-            bug_status = ['RESOLVED', 'VERIFIED']
+            bug_status = list(self.RESOLVED_STATUSES)
         else:
-            bug_status = [
-                'NEW',
-                'ASSIGNED',
-                'REOPENED',
-                'UNCONFIRMED',
-                'CONFIRMED',
-                'WAITING',
-            ]
+            bug_status = list(self.UNRESOLVED_STATUSES)
 
         params = dict(
             ctype='csv'
@@ -300,7 +400,33 @@ class BugzillaFetcher(FetchBlockedAndDependsonMixin,
             params.update(product=project_selector)
             if component_selector:
                 params.update(component=component_selector)
-        url = '%s/buglist.cgi' % self.tracker.url
-        body = h.serialize_url('', **params)
-        rpc = RPC(url=url, method='POST', data=body)
-        self.consume(rpc)
+        return params
+
+    def fetch_scrum(self, sprint_name, project_id=None, component_id=None):
+        self.buglist(self._scrum_params(sprint_name))
+
+    def fetch_sprint(self, sprint_name, selectors):
+        self.buglist(self._sprint_params(sprint_name, selectors))
+
+    def fetch_updated_tickets(self, since):
+        self.buglist(self._updated_params(since))
+
+    def fetch_user_tickets(self, resolved=False):
+        self.buglist(self._user_params(resolved))
+
+    def fetch_all_tickets(self, resolved=False):
+        self.buglist(self._all_params(resolved))
+
+    def fetch_bugs_for_query(self, ticket_ids=None, project_selector=None,
+                             component_selector=None, version=None,
+                             resolved=False):
+        super(BugzillaFetcher, self).fetch_bugs_for_query(
+            ticket_ids,
+            project_selector,
+            component_selector,
+            version,
+            resolved,
+        )
+        self.buglist(self._query_params(
+            ticket_ids, project_selector, component_selector, resolved,
+        ))
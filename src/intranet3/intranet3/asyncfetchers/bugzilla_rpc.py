@@ -0,0 +1,356 @@
+"""
+Bugzilla fetcher using JSON-RPC Bug.search instead of buglist.cgi CSV.
+
+Only fields the producer needs are requested (include_fields),
+statuses, users, products and last change time are filtered by Bugzilla,
+results are paged with limit/offset. Ids of blocked and dependson bugs
+come with the bugs, their statuses with a single Bug.get.
+Bugs are converted to buglist.cgi columns, so BugzillaBugProducer and
+the bug mirror see the same data as from BugzillaFetcher.
+
+Bugzillas without JSON-RPC (older versions or disabled) are queried
+with buglist.cgi CSV as BugzillaFetcher does.
+"""
+import calendar
+import datetime
+import json
+import re
+import time
+
+from dateutil.parser import parse
+from dateutil.tz import tzutc
+
+from intranet3 import memcache
+from intranet3.log import INFO_LOG
+from .base import FetchException, FetcherBadDataError
+from .bugzilla import BugzillaFetcher
+from .request import RPC, closing_rpcs
+from .utils import to_utc
+
+LOG = INFO_LOG(__name__)
+
+
+class JSONRPCUnsupported(FetchException):
+    """ Tracker has no JSON-RPC interface, buglist.cgi has to be used """
+
+
+class BugzillaRPCFetcher(BugzillaFetcher):
+
+    # Bug.search field -> buglist.cgi column
+    FIELDS = {
+        'id': 'bug_id',
+        'severity': 'bug_severity',
+        'assigned_to': 'assigned_to',
+        'version': 'version',
+        'status': 'bug_status',
+        'resolution': 'resolution',
+        'product': 'product',
+        'op_sys': 'op_sys',
+        'summary': 'short_desc',
+        'creator': 'reporter',
+        'creation_time': 'opendate',
+        'last_change_time': 'changeddate',
+        'component': 'component',
+        'deadline': 'deadline',
+        'priority': 'priority',
+        'whiteboard': 'status_whiteboard',
+    }
+    DATE_FIELDS = ('creation_time', 'last_change_time')
+    DEPENDENCY_FIELDS = ('blocks', 'depends_on')
+
+    # bugs per Bug.search page
+    SEARCH_PAGE_SIZE = 500
+    # search pages fetched at the same time
+    SEARCH_CONCURRENCY = 4
+    # ids per Bug.get of blocked/dependson statuses
+    STATUSES_CHUNK_SIZE = 500
+
+    # JSON-RPC error codes
+    METHOD_NOT_FOUND = -32601
+    LOGIN_ERRORS = (300, 301, 305, 410)
+
+    # trackers without JSON-RPC are not asked again for a while
+    UNSUPPORTED_CACHE_KEY = 'bugzilla-rpc-unsupported-%s'
+    UNSUPPORTED_CACHE_TIMEOUT = 60 * 60
+
+    def __init__(self, *args, **kwargs):
+        super(BugzillaRPCFetcher, self).__init__(*args, **kwargs)
+        # set when tracker has no JSON-RPC, data comes from buglist.cgi
+        self.csv_fallback = False
+
+    @property
+    def rpc_url(self):
+        return '%s/jsonrpc.cgi' % self.tracker.url
+
+    def call_rpc(self, method, params):
+        params = dict(
+            params,
+            Bugzilla_login=self.login,
+            Bugzilla_password=self.password,
+        )
+        body = json.dumps(dict(method=method, params=[params], id=1))
+        return RPC(
+            url=self.rpc_url,
+            method='POST',
+            data=body,
+            headers={'Content-Type': 'application/json'},
+        )
+
+    def read_result(self, rpc):
+        """
+        Waits for started rpc and returns JSON-RPC result,
+        only missing jsonrpc.cgi or method means the tracker has no JSON-RPC
+        """
+        response = rpc.get_result()
+        try:
+            if response.status_code in (404, 501):
+                raise JSONRPCUnsupported(
+                    u'Received response %s' % response.status_code
+                )
+            self.check_if_failed(response)
+            started = time.time()
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise FetchException(
+                    u'Invalid JSON-RPC response (%s): %s' % (
+                        response.headers.get('content-type', ''), e,
+                    )
+                )
+            self.observe_response(response, started)
+        finally:
+            response.close()
+
+        error = data.get('error')
+        if error:
+            code = error.get('code')
+            if code == self.METHOD_NOT_FOUND:
+                raise JSONRPCUnsupported(error.get('message'))
+            if code in self.LOGIN_ERRORS:
+                raise FetcherBadDataError(
+                    u'Wrong credentials for tracker %s' % self.tracker.name
+                )
+            raise FetchException(
+                u'Bugzilla error %s: %s' % (code, error.get('message'))
+            )
+        return data['result']
+
+    def search(self, query, csv_params, matches=None):
+        """
+        Fetches all pages of Bug.search with query, first page is fetched
+        alone, remaining SEARCH_CONCURRENCY at a time while pages are full.
+        `matches` filters bugs further on our side,
+        csv_params are used for buglist.cgi if tracker has no JSON-RPC.
+        """
+        unsupported_key = self.UNSUPPORTED_CACHE_KEY % self.tracker.id
+        if memcache.get(unsupported_key):
+            return self.fallback(csv_params)
+
+        query = dict(
+            query,
+            include_fields=sorted(self.FIELDS) + list(self.DEPENDENCY_FIELDS),
+        )
+        size = self.SEARCH_PAGE_SIZE
+        try:
+            bugs = self.read_page(self.start_page(query, 0))
+            offset = size
+            page_bugs = bugs
+            while len(page_bugs) == size:
+                rpcs = [
+                    self.start_page(query, offset + i * size)
+                    for i in xrange(self.SEARCH_CONCURRENCY)
+                ]
+                # pages after the last one are not read
+                with closing_rpcs(rpcs):
+                    for rpc in rpcs:
+                        page_bugs = self.read_page(rpc)
+                        bugs.extend(page_bugs)
+                        if len(page_bugs) < size:
+                            break
+                offset += self.SEARCH_CONCURRENCY * size
+        except JSONRPCUnsupported as e:
+            LOG(u'Tracker %s has no JSON-RPC, using buglist.cgi: %s' % (
+                self.tracker.name, e,
+            ))
+            memcache.set(unsupported_key, 1, self.UNSUPPORTED_CACHE_TIMEOUT)
+            return self.fallback(csv_params)
+
+        if matches is not None:
+            bugs = [bug for bug in bugs if matches(bug)]
+        self._parsed_data.extend(self.convert(bug) for bug in bugs)
+        self.finish_consume()
+
+    def start_page(self, query, offset):
+        query = dict(query, limit=self.SEARCH_PAGE_SIZE, offset=offset)
+        return self.start_rpc(self.call_rpc('Bug.search', query))
+
+    def read_page(self, rpc):
+        return self.read_result(rpc)['bugs']
+
+    def fallback(self, csv_params):
+        self.csv_fallback = True
+        self.buglist(csv_params)
+
+    @staticmethod
+    def _local_time(value):
+        """ Bugzilla returns UTC times, buglist.cgi local ones """
+        date = parse(value)
+        if date.tzinfo is not None:
+            date = date.astimezone(tzutc()).replace(tzinfo=None)
+        local = datetime.datetime.fromtimestamp(
+            calendar.timegm(date.timetuple())
+        )
+        return local.strftime('%Y-%m-%d %H:%M:%S')
+
+    def convert(self, bug):
+        """ Converts Bug.search bug to buglist.cgi row """
+        row = {}
+        for field, column in self.FIELDS.iteritems():
+            value = bug.get(field)
+            if value is None:
+                value = ''
+            elif field in self.DATE_FIELDS:
+                value = self._local_time(value)
+            elif not isinstance(value, basestring):
+                value = unicode(value)
+            row[column] = value
+        # replaced with statuses in after_parsing
+        row['blocked'] = [str(bug_id) for bug_id in bug.get('blocks', [])]
+        row['dependson'] = [
+            str(bug_id) for bug_id in bug.get('depends_on', [])
+        ]
+        return row
+
+    def get_dependencies(self, parsed_data):
+        if self.csv_fallback:
+            return super(BugzillaRPCFetcher, self).get_dependencies(parsed_data)
+        return dict(
+            (bug['bug_id'], (bug['blocked'], bug['dependson']))
+            for bug in parsed_data
+        )
+
+    def fetch_statuses(self, ids):
+        if self.csv_fallback:
+            return super(BugzillaRPCFetcher, self).fetch_statuses(ids)
+        ids = sorted(ids)
+        size = self.STATUSES_CHUNK_SIZE
+        rpcs = [
+            self.start_rpc(self.call_rpc('Bug.get', dict(
+                ids=ids[i:i + size],
+                include_fields=['id', 'status', 'summary'],
+                # bugs we are not allowed to see are skipped
+                permissive=True,
+            )))
+            for i in xrange(0, len(ids), size)
+        ]
+        result = {}
+        with closing_rpcs(rpcs):
+            for rpc in rpcs:
+                for bug in self.read_result(rpc)['bugs']:
+                    bug_id = str(bug['id'])
+                    result[bug_id] = {
+                        'bug_id': bug_id,
+                        'status': bug['status'],
+                        'description': bug['summary'],
+                    }
+        return result
+
+    def _status_query(self, resolved):
+        statuses = self.RESOLVED_STATUSES if resolved \
+            else self.UNRESOLVED_STATUSES
+        return dict(status=list(statuses))
+
+    @staticmethod
+    def _not_later(bug):
+        # buglist.cgi query excludes resolution LATER for resolved bugs
+        return bug.get('resolution') != 'LATER'
+
+    def _sprint_matches(self, sprint_name):
+        # Bug.search matches whiteboard by substring only
+        regex = re.compile(r'(?<!\S)s=%s(?!\S)' % re.escape(sprint_name))
+        return lambda bug: regex.search(bug.get('whiteboard') or '')
+
+    def _scrum_query(self, sprint_name):
+        return dict(
+            whiteboard='s=%s' % sprint_name,
+            status=list(
+                self.UNRESOLVED_STATUSES + self.RESOLVED_STATUSES + ('CLOSED',)
+            ),
+        )
+
+    def fetch_scrum(self, sprint_name, project_id=None, component_id=None):
+        self.search(
+            self._scrum_query(sprint_name),
+            self._scrum_params(sprint_name),
+            self._sprint_matches(sprint_name),
+        )
+
+    def fetch_sprint(self, sprint_name, selectors):
+        query = self._scrum_query(sprint_name)
+        products, components = self.split_selectors(selectors)
+        query['product'] = products
+        if components:
+            query['component'] = components
+        self.search(
+            query,
+            self._sprint_params(sprint_name, selectors),
+            self._sprint_matches(sprint_name),
+        )
+
+    def fetch_updated_tickets(self, since):
+        if since is None:
+            query = self._status_query(resolved=False)
+        else:
+            query = dict(
+                last_change_time=to_utc(since).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                status=list(
+                    self.UNRESOLVED_STATUSES + self.RESOLVED_STATUSES + ('CLOSED',)
+                ),
+            )
+        self.search(query, self._updated_params(since))
+
+    def fetch_user_tickets(self, resolved=False):
+        query = self._status_query(resolved)
+        if resolved:
+            query['creator'] = self.login
+        else:
+            query['assigned_to'] = self.login
+        self.search(
+            query,
+            self._user_params(resolved),
+            self._not_later if resolved else None,
+        )
+
+    def fetch_all_tickets(self, resolved=False):
+        query = self._status_query(resolved)
+        logins = sorted(self.login_mapping.keys())
+        if resolved:
+            query['creator'] = logins
+        else:
+            query['assigned_to'] = logins
+        self.search(
+            query,
+            self._all_params(resolved),
+            self._not_later if resolved else None,
+        )
+
+    def fetch_bugs_for_query(self, ticket_ids=None, project_selector=None,
+                             component_selector=None, version=None,
+                             resolved=False):
+        if not ticket_ids and not project_selector:
+            raise TypeError(
+                'fetch_bugs_for_query takes ticket_ids or project_selector'
+            )
+        query = self._status_query(resolved)
+        if ticket_ids:
+            query['id'] = [int(bug_id) for bug_id in ticket_ids]
+        else:
+            query['product'] = project_selector
+            if component_selector:
+                query['component'] = component_selector
+        self.search(
+            query,
+            self._query_params(
+                ticket_ids, project_selector, component_selector, resolved,
+            ),
+        )
@@ -0,0 +1,177 @@
+"""
+Memcache storage for parsed tracker data.
+
+Every entry remembers when it was fetched, so readers can tell fresh data
+(younger than fetcher's soft timeout) from stale data that may still be
+served while it is refreshed in the background (younger than hard timeout,
+which is the memcache expiry).
+
+Data is stored columnar and compressed: list of bug dicts becomes field
+names kept once plus one value column per field (columns with few distinct
+values as distinct values and their indexes), pickled and zlib-compressed.
+Entries bigger than CHUNK_SIZE are split across several memcache keys,
+the first chunk is stored with the entry header.
+"""
+import __builtin__
+import cPickle as pickle
+import time
+import datetime
+import zlib
+from array import array
+from operator import itemgetter
+
+from intranet3 import memcache
+
+FORMAT = 'z1'
+# memcache refuses items over 1 MB, leave room for key and header
+CHUNK_SIZE = 1000 * 1000 - 4 * 1024
+CHUNK_KEY = '{key}-{token}-{index}'
+COMPRESS_LEVEL = 6
+PLAIN, COLUMNS = 0, 1
+
+# builtin set, the name is taken by set() storing entries
+_set = __builtin__.set
+
+
+class CacheEntry(object):
+
+    def __init__(self, data, fetched_at):
+        self.data = data
+        self.fetched_at = fetched_at  # unix timestamp
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def is_stale(self, soft_timeout):
+        return self.age > soft_timeout
+
+    @property
+    def fetched_at_datetime(self):
+        return datetime.datetime.fromtimestamp(self.fetched_at)
+
+
+class _Missing(object):
+    """ Column value of a row without the field """
+
+
+def _encode_column(values):
+    """
+    Columns with few distinct values (statuses, priorities, projects...)
+    are stored as distinct values plus array of their indexes
+    """
+    distinct = {}  # (type, value) -> index, so that 1 and True differ
+    indexes = array('B')
+    try:
+        for value in values:
+            index = distinct.setdefault((type(value), value), len(distinct))
+            if index > 255:
+                return values
+            indexes.append(index)
+    except TypeError:  # unhashable values
+        return values
+    if len(distinct) > len(values) / 2:
+        return values
+    uniques = [value for (t, value), i in sorted(distinct.items(), key=itemgetter(1))]
+    return uniques, indexes.tostring()
+
+
+def _decode_column(column):
+    if isinstance(column, list):
+        return column
+    uniques, indexes = column
+    return [uniques[i] for i in array('B', indexes)]
+
+
+def encode(data):
+    """
+    Returns compressed representation of data,
+    list of dicts is stored as (field names, value columns)
+    """
+    if isinstance(data, list) and data and \
+            all(type(row) is dict for row in data):
+        names = []
+        seen = _set()
+        for row in data:
+            for name in row:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+        columns = [
+            _encode_column([row.get(name, _Missing) for row in data])
+            for name in names
+        ]
+        encoded = (COLUMNS, len(data), names, columns)
+    else:
+        encoded = (PLAIN, data)
+    return zlib.compress(
+        pickle.dumps(encoded, pickle.HIGHEST_PROTOCOL), COMPRESS_LEVEL,
+    )
+
+
+def decode(blob):
+    encoded = pickle.loads(zlib.decompress(blob))
+    if encoded[0] == PLAIN:
+        return encoded[1]
+    kind, length, names, columns = encoded
+    rows = [{} for i in xrange(length)]
+    for name, column in zip(names, columns):
+        for row, value in zip(rows, _decode_column(column)):
+            if value is not _Missing:
+                row[name] = value
+    return rows
+
+
+def _chunk_keys(key, token, count):
+    return [
+        CHUNK_KEY.format(key=key, token=token, index=index)
+        for index in xrange(1, count)
+    ]
+
+
+def get(key):
+    value = memcache.get(key)
+    if value is None:
+        return None
+    if isinstance(value, list):
+        # entry written before timestamps were stored, treat as fresh
+        return CacheEntry(value, time.time())
+    if len(value) == 2:
+        # entry written before compression
+        fetched_at, data = value
+        return CacheEntry(data, fetched_at)
+
+    format, fetched_at, token, count, blob = value
+    if format != FORMAT:
+        return None
+    if count > 1:
+        chunks = memcache.get_many(*_chunk_keys(key, token, count))
+        if any(chunk is None for chunk in chunks):
+            # some chunk was evicted, the entry is lost
+            return None
+        blob = ''.join([blob] + chunks)
+        if '%08x' % (zlib.crc32(blob) & 0xffffffff) != token:
+            return None
+    return CacheEntry(decode(blob), fetched_at)
+
+
+def set(key, data, hard_timeout):
+    fetched_at = time.time()
+    blob = encode(data)
+    chunks = [
+        blob[i:i + CHUNK_SIZE] for i in xrange(0, len(blob), CHUNK_SIZE)
+    ] or ['']
+    # chunks of different writes of the same key never mix
+    token = '%08x' % (zlib.crc32(blob) & 0xffffffff)
+    if len(chunks) > 1:
+        # chunks go first, so the header never points to missing ones
+        memcache.set_many(
+            dict(zip(_chunk_keys(key, token, len(chunks)), chunks[1:])),
+            hard_timeout,
+        )
+    memcache.set(
+        key,
+        (FORMAT, fetched_at, token, len(chunks), chunks[0]),
+        hard_timeout,
+    )
+    return CacheEntry(data, fetched_at)
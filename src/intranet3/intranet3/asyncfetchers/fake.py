@@ -3,6 +3,7 @@ class FakeFetcher(object):
     """
     Used i.e. in Harvest tracker when we need credentials but don't fetcher
     """
+    SUPPORTS_MIRROR = False
 
     def __init__(self, *args, **kwargs):
         pass
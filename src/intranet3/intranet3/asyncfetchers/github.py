@@ -1,17 +1,23 @@
 # coding: utf-8
+import hashlib
 import json
 import re
+import time
+import urlparse
 from dateutil.parser import parse
 
+from intranet3 import memcache
 from intranet3.helpers import serialize_url
-from intranet3.log import INFO_LOG, EXCEPTION_LOG
+from intranet3.log import INFO_LOG, EXCEPTION_LOG, DEBUG_LOG
 
 from .base import BaseFetcher, BasicAuthMixin, FetcherBadDataError
 from .bug import BaseBugProducer, BaseScrumProducer
 from .request import RPC
+from .utils import to_utc
 
 LOG = INFO_LOG(__name__)
 EXCEPTION = EXCEPTION_LOG(__name__)
+DEBUG = DEBUG_LOG(__name__)
 
 
 class GithubScrumProducer(BaseScrumProducer):
@@ -51,38 +57,150 @@ class GithubBugProducer(BaseBugProducer):
 
 class GithubFetcher(BasicAuthMixin, BaseFetcher):
     BUG_PRODUCER_CLASS = GithubBugProducer
+    UNRESOLVED_STATUSES = ('open', )
 
     #klucz do mapowania nazwa_milestonea -> numer milestonea
     MILESTONES_KEY = 'milestones_map'
     MILESTONES_TIMEOUT = 60*3
 
+    PER_PAGE = 100  # github maximum
+    # pages (after the first one) fetched at the same time
+    PAGES_CONCURRENCY = 4
+    MULTI_PROJECT_SPRINT = True
+    SUPPORTS_MIRROR = True
+
+    # url -> ETag/Last-Modified and parsed data of the last 200 response,
+    # unchanged pages are answered with 304 that doesn't count to rate limit
+    CONDITIONAL_CACHE_KEY = 'github-page-{tracker_id}-{digest}'
+    CONDITIONAL_CACHE_TIMEOUT = 24 * 60 * 60
+
     def __init__(self, *args, **kwargs):
         super(GithubFetcher, self).__init__(*args, **kwargs)
 
-    def fetch_milestones(self, url):
-        url = str(url)
-        rpc = self.get_rpc()
-        rpc.url = url
-        rpc.start()
+    def page_url(self, url, page):
+        separator = '&' if '?' in url else '?'
+        if url.endswith('?'):
+            separator = ''
+        return '%s%sper_page=%s&page=%s' % (
+            url, separator, self.PER_PAGE, page,
+        )
+
+    def _conditional_cache_key(self, url):
+        key = u'%s\0%s' % (self.login, url)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.CONDITIONAL_CACHE_KEY.format(
+            tracker_id=self.tracker.id,
+            digest=digest,
+        )
+
+    def start_page(self, url):
+        """ Starts conditional request for a single page """
+        rpc = RPC(url=url)
+        cached = memcache.get(self._conditional_cache_key(url))
+        if cached is not None:
+            headers = {}
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+            rpc.kwargs['headers'] = headers
+        self.start_rpc(rpc)
+        return url, rpc, cached
+
+    def read_page(self, page):
+        """ Returns (data, last page number) of started page """
+        url, rpc, cached = page
         response = rpc.get_result()
-        return self.parse_milestones(response.content)
+        if response.status_code == 304 and cached is not None:
+            DEBUG(u'Page %s not modified' % url)
+            return cached['data'], cached['last_page']
+        self.check_if_failed(response)
+
+        started = time.time()
+        data = self.parse(response.text)
+        self.observe_response(response, started)
+        last_url = response.links.get('last', {}).get('url')
+        if last_url:
+            query = urlparse.parse_qs(urlparse.urlparse(last_url).query)
+            last_page = int(query.get('page', ['1'])[0])
+        else:
+            last_page = 1
+
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        if etag or last_modified:
+            memcache.set(
+                self._conditional_cache_key(url),
+                dict(
+                    etag=etag,
+                    last_modified=last_modified,
+                    data=data,
+                    last_page=last_page,
+                ),
+                self.CONDITIONAL_CACHE_TIMEOUT,
+            )
+        return data, last_page
+
+    def fetch_pages(self, urls):
+        """
+        Returns concatenated data of all pages of given urls,
+        first pages tell (by Link header) how many pages there are,
+        remaining pages are fetched PAGES_CONCURRENCY at a time
+        """
+        pages = self.fetch_pages_per_url(urls)
+        return [item for url in urls for item in pages[url]]
+
+    def fetch_pages_per_url(self, urls):
+        """ Like fetch_pages but returns url -> data of its pages """
+        first_pages = [
+            (url, self.start_page(self.page_url(url, 1))) for url in urls
+        ]
+        result = {}
+        remaining = []
+        for url, page in first_pages:
+            data, last_page = self.read_page(page)
+            result[url] = list(data)
+            remaining.extend(
+                (url, self.page_url(url, number))
+                for number in xrange(2, last_page + 1)
+            )
+
+        for i in xrange(0, len(remaining), self.PAGES_CONCURRENCY):
+            pages = [
+                (url, self.start_page(page_url))
+                for url, page_url in remaining[i:i + self.PAGES_CONCURRENCY]
+            ]
+            for url, page in pages:
+                result[url].extend(self.read_page(page)[0])
+        return result
+
+    def consume_pages(self, urls):
+        self._parsed_data.extend(self.fetch_pages(urls))
+        self.finish_consume()
 
-    def parse_milestones(self, data):
+    def fetch_milestones(self, url):
+        return self.parse_milestones(self.fetch_pages([str(url)]))
+
+    def parse_milestones(self, milestones):
         milestone_map = {}
-        json_data = json.loads(data)
-        for milestone in json_data:
+        for milestone in milestones:
             milestone_map[milestone['title']] = str(milestone['number'])
 
         return milestone_map
 
+    def _repo_url(self, owner, repo):
+        return '%srepos/%s/%s/' % (self.tracker.url, owner, repo)
+
+    def _sprint_urls(self, base_url, milestone):
+        issues_url = ''.join((base_url, 'issues?'))
+        return [
+            serialize_url(issues_url, milestone=milestone, state=state)
+            for state in ('open', 'closed')
+        ]
+
     def fetch_scrum(self, sprint_name, project_id=None, component_id=None):
-        base_url = '%srepos/%s/%s/' % (
-            self.tracker.url,
-            project_id,
-            component_id,
-        )
+        base_url = self._repo_url(project_id, component_id)
         milestones_url = ''.join((base_url, 'milestones'))
-        issues_url = ''.join((base_url, 'issues?'))
 
         milestones = self.fetch_milestones(
             milestones_url,
@@ -91,24 +209,38 @@ class GithubFetcher(BasicAuthMixin, BaseFetcher):
         if sprint_name not in milestones:
             raise FetcherBadDataError('There is no %s milestone' % sprint_name)
 
-        opened_bugs_url = serialize_url(
-            issues_url,
-            **dict(
-                milestone=milestones.get(sprint_name),
-                state='open'
-            )
+        self.consume_pages(
+            self._sprint_urls(base_url, milestones.get(sprint_name))
         )
 
-        closed_bugs_url = serialize_url(
-            issues_url,
-            **dict(
-                milestone=milestones.get(sprint_name),
-                state='closed'
-            )
+    def fetch_sprint(self, sprint_name, selectors):
+        """
+        Fans out to every repository (project selector is the owner,
+        component selector the repository), milestones of all
+        repositories are fetched at once and then all their issues
+        """
+        base_urls = sorted(set(
+            self._repo_url(owner, repo) for owner, repo in selectors
+        ))
+        milestones_urls = dict(
+            (base_url, str(''.join((base_url, 'milestones'))))
+            for base_url in base_urls
         )
+        milestones = self.fetch_pages_per_url(milestones_urls.values())
 
-        self.consume(RPC(url=opened_bugs_url))
-        self.consume(RPC(url=closed_bugs_url))
+        urls = []
+        for base_url in base_urls:
+            repo_milestones = self.parse_milestones(
+                milestones[milestones_urls[base_url]]
+            )
+            if sprint_name in repo_milestones:
+                urls.extend(
+                    self._sprint_urls(base_url, repo_milestones[sprint_name])
+                )
+        if not urls:
+            raise FetcherBadDataError('There is no %s milestone' % sprint_name)
+
+        self.consume_pages(urls)
 
     @staticmethod
     def common_url_params():
@@ -136,7 +268,7 @@ class GithubFetcher(BasicAuthMixin, BaseFetcher):
         params.update(self.single_user_params())
         url = serialize_url(self.tracker.url + 'issues?', **params)
 
-        self.consume(RPC(url=url))
+        self.consume_pages([url])
 
     def fetch_all_tickets(self, resolved=False):
         if resolved:
@@ -145,7 +277,20 @@ class GithubFetcher(BasicAuthMixin, BaseFetcher):
         params.update(self.all_users_params())
         url = serialize_url(self.tracker.url + 'issues?', **params)
 
-        self.consume(RPC(url=url))
+        self.consume_pages([url])
+
+    def fetch_updated_tickets(self, since):
+        params = self.all_users_params()
+        if since is None:
+            params.update(state='open')
+        else:
+            params.update(
+                state='all',
+                since=to_utc(since).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            )
+        url = serialize_url(self.tracker.url + 'issues?', **params)
+
+        self.consume_pages([url])
 
     def fetch_bugs_for_query(self, ticket_ids=None, project_selector=None,
                              component_selector=None, version=None,
@@ -171,7 +316,7 @@ class GithubFetcher(BasicAuthMixin, BaseFetcher):
             )
             url = serialize_url(uri, **params)
 
-            self.consume(RPC(url=url))
+            self.consume_pages([url])
 
     def parse(self, data):
         json_data = json.loads(data)
@@ -0,0 +1,149 @@
+"""
+Per-tracker health, kept in process memory.
+
+Every fetch reports its latency and outcome to the `TrackerHealth` of its
+tracker. After FAILURE_THRESHOLD consecutive failures the circuit opens
+and fetchers don't query the tracker at all (stale cached data is still
+served). After OPEN_TIMEOUT seconds the circuit is half-open and a single
+fetch is let through to probe whether the tracker recovered.
+
+Fetch timeouts are derived from observed latency (p99), so a healthy
+tracker that answers in a second is not waited on for half a minute.
+Background fetches (bug mirror sync) use `UNTRACKED` instead, they are
+never blocked by the circuit and don't affect it.
+"""
+import time
+from collections import deque
+
+from intranet3.log import WARN_LOG, INFO_LOG
+
+WARN = WARN_LOG(__name__)
+LOG = INFO_LOG(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of non-empty sequence """
+    values = sorted(values)
+    index = int(round(p / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class TrackerHealth(object):
+
+    WINDOW = 100  # remembered fetches
+    FAILURE_THRESHOLD = 5  # consecutive failures that open the circuit
+    OPEN_TIMEOUT = 30  # seconds before the circuit is half-open
+
+    MIN_SAMPLES = 10  # successful fetches needed to adapt the timeout
+    TIMEOUT_FACTOR = 2.0  # timeout = p99 * TIMEOUT_FACTOR
+    MIN_TIMEOUT = 5
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = deque(maxlen=self.WINDOW)  # of successful fetches
+        self.outcomes = deque(maxlen=self.WINDOW)  # True for success
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = None
+        self.probe_started_at = None
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - float(sum(self.outcomes)) / len(self.outcomes)
+
+    def latency(self, p):
+        if not self.latencies:
+            return None
+        return percentile(self.latencies, p)
+
+    def timeout(self, max_timeout):
+        """ Seconds to wait for a fetch, never more than max_timeout """
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return max_timeout
+        timeout = self.latency(99) * self.TIMEOUT_FACTOR
+        return min(max(timeout, self.MIN_TIMEOUT), max_timeout)
+
+    def allow_request(self, now=None):
+        """ Whether the tracker may be queried now """
+        if self.state == CLOSED:
+            return True
+        now = now or time.time()
+        if self.state == OPEN:
+            if now - self.opened_at < self.OPEN_TIMEOUT:
+                return False
+            self.state = HALF_OPEN
+            self.probe_started_at = None
+        # half-open, let a single probe through (another one if it got lost)
+        if self.probe_started_at is not None \
+                and now - self.probe_started_at < self.OPEN_TIMEOUT:
+            return False
+        self.probe_started_at = now
+        return True
+
+    def record_success(self, latency):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            LOG(u'Circuit of tracker %s closed' % self.name)
+        self.state = CLOSED
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self, now=None):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED
+            and self.consecutive_failures >= self.FAILURE_THRESHOLD
+        ):
+            WARN(u'Circuit of tracker %s opened after %s failures' % (
+                self.name, self.consecutive_failures,
+            ))
+            self.state = OPEN
+            self.opened_at = now or time.time()
+            self.probe_started_at = None
+
+    def to_dict(self):
+        return dict(
+            state=self.state,
+            error_rate=self.error_rate,
+            p50=self.latency(50),
+            p99=self.latency(99),
+            consecutive_failures=self.consecutive_failures,
+        )
+
+
+class UntrackedHealth(object):
+    """ Health of fetches kept out of the circuit, waits full timeout """
+
+    def timeout(self, max_timeout):
+        return max_timeout
+
+    def allow_request(self, now=None):
+        return True
+
+    def record_success(self, latency):
+        pass
+
+    def record_failure(self, now=None):
+        pass
+
+
+UNTRACKED = UntrackedHealth()
+
+# tracker id -> TrackerHealth
+TRACKERS = {}
+
+
+def get_health(tracker):
+    health = TRACKERS.get(tracker.id)
+    if health is None:
+        health = TRACKERS[tracker.id] = TrackerHealth(tracker.name)
+    return health
@@ -4,6 +4,7 @@ import requests
 
 from .base import FetcherBadDataError
 from .bugzilla import BugzillaFetcher
+from .limiter import limited
 from intranet3.log import INFO_LOG, DEBUG_LOG
 
 
@@ -25,12 +26,15 @@ class IgozillaFetcher(BugzillaFetcher):
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
         }
-        response = requests.post(
-            self.tracker.url.encode('utf-8') + '/query.cgi',
-            form_data,
-            headers=headers,
-            verify=False,
-        )
+        url = self.tracker.url.encode('utf-8') + '/query.cgi'
+        with limited(url, self.get_timeout()) as timeout:
+            response = requests.post(
+                url,
+                form_data,
+                headers=headers,
+                verify=False,
+                timeout=timeout,
+            )
         if not response.cookies:
             raise FetcherBadDataError(
                 'Authentication error on tracker %s, check login and password.'
@@ -1,4 +1,5 @@
 import json
+import time
 import urllib2
 
 from dateutil.parser import parse as dateparse
@@ -15,19 +16,18 @@ from intranet3.asyncfetchers.bug import (
     BaseScrumProducer,
     ToDictMixin,
 )
+from intranet3.asyncfetchers.metadata import METADATA, TrackerMetadata
 from intranet3.asyncfetchers.request import RPC
 from intranet3.log import ERROR_LOG, INFO_LOG
 from intranet3.models import User
-from intranet3 import memcache
 
 LOG = INFO_LOG(__name__)
 ERROR = ERROR_LOG(__name__)
 
-STORY_POINTS_KEY = 'tracker:{}:story_points_field_id'  # % tracker.id
-
-
 
 class BlockedOrDependson(ToDictMixin):
+    FIELDS = ('id', 'status', 'desc', 'resolved', 'url', 'owner')
+
     def __init__(self, key, bug_id, status, description, tracker):
         self.id = bug_id
         self.status = status
@@ -127,6 +127,9 @@ class JiraQueryBuilder(object):
     def neq(self, field, data):
         self._add_oper(field, data, '!=')
 
+    def gte(self, field, data):
+        self._add_oper(field, data, '>=')
+
     def in_(self, field, data):
         params = []
         for item in data:
@@ -153,6 +156,13 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
     BUG_PRODUCER_CLASS = JiraBugProducer
 
     STORY_POINTS_FIELD_NAME = 'Story Points'
+    MULTI_PROJECT_SPRINT = True
+    SUPPORTS_MIRROR = True
+
+    # issues per search page (Jira may cap it, see maxResults in response)
+    SEARCH_PAGE_SIZE = 100
+    # search pages fetched at the same time
+    SEARCH_CONCURRENCY = 4
 
     FIELDS = ['summary', 'reporter', 'assignee', 'priority', 'status',
               'resolution', 'project', 'components', 'duedate', 'created',
@@ -162,26 +172,21 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
         super(JiraFetcher, self).__init__(*args, **kwargs)
         self.story_points_fields = None
 
-    def query_story_points_field_id(self):
+    def load_metadata(self):
         rpc = self.get_rpc()
         rpc.url = '{}/rest/api/2/field'.format(self.tracker.url)
         rpc.start()
         response = rpc.get_result()
         self.check_if_failed(response)
-        fields = response.json()
-
-        for field in fields:
-            if field['name'] == self.STORY_POINTS_FIELD_NAME:
-                return field['id']
-        return ''
+        # field name -> field id
+        fields = dict(
+            (field['name'], field['id']) for field in response.json()
+        )
+        return TrackerMetadata(custom_fields=fields)
 
     def get_story_points_field_id(self):
-        story_points_key = STORY_POINTS_KEY.format(self.tracker.id)
-        story_points_field_id = memcache.get(story_points_key)
-        if story_points_field_id is None:
-            story_points_field_id = self.query_story_points_field_id()
-            memcache.set(story_points_key, story_points_field_id)
-        return story_points_field_id
+        metadata = METADATA.get(self.tracker, self.load_metadata)
+        return metadata.custom_fields.get(self.STORY_POINTS_FIELD_NAME, '')
 
     def before_fetch(self):
         self.story_points_fields = self.get_story_points_field_id()
@@ -217,6 +222,9 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
         project_id=None,
         label=None,
         sprint_name=None,
+        updated_since=None,
+        project_ids=None,
+        component_ids=None,
     ):
         query = JiraQueryBuilder(self.get_fields_list())
 
@@ -232,9 +240,15 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
         if project_id:
             query.eq('project', project_id)
 
+        if project_ids:
+            query.in_('project', project_ids)
+
         if component_id:
             query.eq('component', component_id)
 
+        if component_ids:
+            query.in_('component', component_ids)
+
         if version:
             query.in_('affectedVersion', version)
 
@@ -244,16 +258,58 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
         if sprint_name:
             query.eq('sprint', sprint_name)
 
+        if updated_since:
+            query.gte('updated', updated_since.strftime('%Y/%m/%d %H:%M'))
+
         return query.get_url(self.tracker.url)
 
-    def parse(self, data):
+    def page_url(self, url, start_at, max_results):
+        return '%s&startAt=%s&maxResults=%s' % (url, start_at, max_results)
+
+    def consume(self, rpc):
+        """
+        Fetches all pages of search from rpc.url,
+        first page tells how many issues there are, remaining pages are
+        fetched SEARCH_CONCURRENCY at a time
+        """
+        url = rpc.url
+        first_page = self.fetch(self.page_url(url, 0, self.SEARCH_PAGE_SIZE))
+        total, page_size, issues = self.read_page(self.start_rpc(first_page))
+        self._parsed_data.extend(issues)
+
+        starts = range(page_size, total, page_size) if page_size else []
+        for i in xrange(0, len(starts), self.SEARCH_CONCURRENCY):
+            rpcs = [
+                self.start_rpc(self.fetch(self.page_url(url, start, page_size)))
+                for start in starts[i:i + self.SEARCH_CONCURRENCY]
+            ]
+            for page in rpcs:
+                self._parsed_data.extend(self.read_page(page)[2])
+
+        self.finish_consume()
+
+    def read_page(self, rpc):
+        """ Returns (total, maxResults, issues) of search page """
+        response = rpc.get_result()
+        self.check_if_failed(response)
+        started = time.time()
+        data = self._load(response.text)
+        self.observe_response(response, started)
+        return (
+            data.get('total', 0),
+            data.get('maxResults', self.SEARCH_PAGE_SIZE),
+            data['issues'],
+        )
+
+    def _load(self, data):
         try:
-            data = json.loads(data)
+            return json.loads(data)
         except ValueError as e:
             ERROR('Error while parsing jira response:\n%s' % e)
             raise FetchException(e)
 
-        return data['issues']
+    def parse(self, data):
+        return self._load(data)['issues']
 
     def fetch_user_tickets(self, resolved=False):
         url = self.query(resolved=resolved, assignee=self.login)
@@ -278,6 +334,14 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
         rpc = self.fetch(url)
         self.consume(rpc)
 
+    def fetch_updated_tickets(self, since):
+        if since is None:
+            url = self.query(resolved=False)
+        else:
+            url = self.query(updated_since=since)
+        rpc = self.fetch(url)
+        self.consume(rpc)
+
     def fetch_scrum(self, sprint_name, project_id, component_id=None):
         url = self.query(
             sprint_name=sprint_name,
@@ -286,3 +350,13 @@ class JiraFetcher(BasicAuthMixin, BaseFetcher):
         )
         rpc = self.fetch(url)
         self.consume(rpc)
+
+    def fetch_sprint(self, sprint_name, selectors):
+        project_ids, component_ids = self.split_selectors(selectors)
+        url = self.query(
+            sprint_name=sprint_name,
+            project_ids=project_ids,
+            component_ids=component_ids,
+        )
+        rpc = self.fetch(url)
+        self.consume(rpc)
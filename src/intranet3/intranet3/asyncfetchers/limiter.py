@@ -0,0 +1,168 @@
+"""
+Per-host concurrency limiter for tracker traffic.
+
+Every request to a tracker (see RPC.start) takes a slot of the limiter of
+its host first. At most `max_concurrency` requests run against a host
+at the same time, the rest wait in FIFO queue. Waiting is bounded by
+the deadline of the request, whatever is left of it after the wait
+is the timeout of the request itself. Streamed responses hold the slot
+until their body is read or they are closed.
+
+Limiters live in process memory, like all gevent greenlets they guard.
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from urlparse import urlparse
+
+from gevent.event import Event
+
+from intranet3 import config
+from intranet3.log import WARN_LOG
+
+WARN = WARN_LOG(__name__)
+
+
+class QueueTimeout(Exception):
+    """ Deadline passed before a slot was free """
+
+
+class HostLimiter(object):
+
+    MAX_CONCURRENCY = 8
+
+    def __init__(self, host, max_concurrency=MAX_CONCURRENCY):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._waiters = deque()  # of gevent Events, FIFO
+
+        # stats
+        self.requests = 0
+        self.queued = 0  # requests that had to wait
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self.wait_time = 0.0  # sum of seconds spent in queue
+        self.max_wait_time = 0.0
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def acquire(self, deadline=None):
+        """
+        Takes a slot, waits at most till `deadline` (unix timestamp),
+        returns seconds spent waiting
+        """
+        self.requests += 1
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return 0.0
+
+        started = time.time()
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - started, 0)
+        event = Event()
+        self._waiters.append(event)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+        event.wait(timeout)
+        # slot is handed over by release() setting the event,
+        # it may happen right after the timeout as well
+        if not event.is_set():
+            self._waiters.remove(event)
+            self.timeouts += 1
+            WARN(u'Request to %s was waiting for %s seconds in vain' % (
+                self.host, timeout,
+            ))
+            raise QueueTimeout(
+                u'Too many requests to %s in progress' % self.host
+            )
+
+        waited = time.time() - started
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        return waited
+
+    def release(self):
+        if self._waiters:
+            # the slot passes to the first waiter, active stays the same
+            self._waiters.popleft().set()
+        else:
+            self.active -= 1
+
+    @contextmanager
+    def slot(self, deadline=None):
+        self.acquire(deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def to_dict(self):
+        return dict(
+            host=self.host,
+            max_concurrency=self.max_concurrency,
+            active=self.active,
+            queue_depth=self.queue_depth,
+            max_queue_depth=self.max_queue_depth,
+            requests=self.requests,
+            queued=self.queued,
+            timeouts=self.timeouts,
+            avg_wait_time=self.wait_time / self.queued if self.queued else 0.0,
+            max_wait_time=self.max_wait_time,
+        )
+
+
+# host -> HostLimiter
+LIMITERS = {}
+
+
+def get_limiter(url):
+    host = urlparse(url or '').netloc
+    limiter = LIMITERS.get(host)
+    if limiter is None:
+        max_concurrency = int((config or {}).get(
+            'TRACKER_MAX_CONCURRENCY', HostLimiter.MAX_CONCURRENCY,
+        ))
+        limiter = LIMITERS[host] = HostLimiter(host, max_concurrency)
+    return limiter
+
+
+def take_slot(url, timeout=None):
+    """
+    Takes a slot of url's host, returns (release, time left from `timeout`
+    seconds or None), release gives the slot back and may be called repeatedly
+    """
+    deadline = time.time() + timeout if timeout is not None else None
+    limiter = get_limiter(url)
+    limiter.acquire(deadline)
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            limiter.release()
+
+    if deadline is None:
+        return release, None
+    return release, max(deadline - time.time(), 0.001)
+
+
+@contextmanager
+def limited(url, timeout=None):
+    """
+    Runs the block in a slot of url's host, yields the time left
+    from `timeout` seconds (None without timeout)
+    """
+    release, timeout = take_slot(url, timeout)
+    try:
+        yield timeout
+    finally:
+        release()
+
+
+def stats():
+    return [limiter.to_dict() for host, limiter in sorted(LIMITERS.items())]
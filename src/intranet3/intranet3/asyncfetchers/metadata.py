@@ -0,0 +1,131 @@
+"""
+Shared tracker metadata cache.
+
+Users, projects, components, milestones and custom fields of a tracker
+change rarely but were fetched again by every fetcher instance.
+`METADATA.get` serves them from process memory, hydrated from memcache
+(shared by all processes) or loaded from the tracker on the first use only.
+Entries older than SOFT_TIMEOUT are still served while a background greenlet
+refreshes them, so fetchers make just the actual issue queries.
+"""
+import hashlib
+import time
+
+from intranet3 import memcache
+from intranet3.log import INFO_LOG, EXCEPTION_LOG
+
+from . import cache
+from .greenlet import Greenlet
+
+LOG = INFO_LOG(__name__)
+EXCEPTION = EXCEPTION_LOG(__name__)
+
+# bump when fields of TrackerMetadata change, old entries are ignored then
+SCHEMA_VERSION = 1
+METADATA_KEY = 'tracker-metadata-v{version}-{tracker_id}{scope}'
+
+
+class TrackerMetadata(object):
+    """ Typed metadata of a tracker, every field is a mapping """
+    FIELDS = __slots__ = (
+        'users', 'projects', 'components', 'milestones', 'custom_fields',
+        'fields',  # tracker specific settings (like jira field ids)
+    )
+
+    def __init__(self, **kwargs):
+        for name in self.FIELDS:
+            setattr(self, name, kwargs.pop(name, None) or {})
+        if kwargs:
+            raise TypeError('Unknown metadata fields: %s' % ', '.join(kwargs))
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+
+class MetadataCache(object):
+    """ Process-local view of tracker metadata stored in memcache """
+
+    SOFT_TIMEOUT = 10 * 60
+    HARD_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self):
+        self._entries = {}  # key -> cache.CacheEntry with TrackerMetadata
+        self._refreshing = {}  # key -> refreshing greenlet
+
+    @staticmethod
+    def key(tracker, scope=None):
+        if scope:
+            # scope may be any login, keep the key memcache safe
+            scope = '-' + hashlib.sha1(scope.encode('utf-8')).hexdigest()
+        return METADATA_KEY.format(
+            version=SCHEMA_VERSION,
+            tracker_id=tracker.id,
+            scope=scope or '',
+        )
+
+    def get(self, tracker, loader, scope=None):
+        """
+        Returns TrackerMetadata of given tracker, `loader()` is called
+        (returning TrackerMetadata) only if nothing is cached yet.
+        `scope` separates metadata that depends on the user (like projects
+        visible to given login).
+        """
+        key = self.key(tracker, scope)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._hydrate(key)
+        if entry is None:
+            entry = self._load(key, loader)
+        elif entry.is_stale(self.SOFT_TIMEOUT):
+            self._refresh(key, loader)
+        return entry.data
+
+    def invalidate(self, tracker, scope=None):
+        key = self.key(tracker, scope)
+        self._entries.pop(key, None)
+        memcache.delete(key)
+
+    def clear(self):
+        """ Forgets process-local entries (memcache is left intact) """
+        self._entries.clear()
+
+    def _hydrate(self, key):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        entry.data = TrackerMetadata(**entry.data)
+        self._entries[key] = entry
+        return entry
+
+    def _load(self, key, loader):
+        metadata = loader()
+        entry = cache.set(key, metadata.to_dict(), self.HARD_TIMEOUT)
+        entry.data = metadata
+        self._entries[key] = entry
+        return entry
+
+    def _refresh(self, key, loader):
+        if key in self._refreshing:
+            return
+        greenlet = Greenlet(self._do_refresh, key, loader)
+        self._refreshing[key] = greenlet
+        greenlet.start()
+
+    def _do_refresh(self, key, loader):
+        try:
+            # other process may have refreshed it already
+            entry = self._hydrate(key)
+            if entry is None or entry.is_stale(self.SOFT_TIMEOUT):
+                started = time.time()
+                self._load(key, loader)
+                LOG(u'Refreshed tracker metadata %s in %.2fs' % (
+                    key, time.time() - started,
+                ))
+        except Exception:
+            # stale entry is still served, next get will try again
+            EXCEPTION(u'Error while refreshing tracker metadata %s' % key)
+        finally:
+            self._refreshing.pop(key, None)
+
+
+METADATA = MetadataCache()
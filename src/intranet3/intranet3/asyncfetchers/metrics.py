@@ -0,0 +1,187 @@
+"""
+Fetcher metrics, aggregated in process memory.
+
+Every fetch reports (per tracker and fetch method) how it was answered
+(cache hit, stale hit, miss, joined in-flight fetch, open circuit),
+errors and histograms of fetch time, bytes received, parse time,
+producer time and number of bugs. `METRICS` renders them as a dict
+(for JSON) or in Prometheus text format, see cron view FetcherMetrics.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# upper bounds of histogram buckets
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+COUNT_BUCKETS = (0, 10, 50, 100, 500, 1000, 5000)
+
+HISTOGRAMS = {
+    'fetch_seconds': SECONDS_BUCKETS,
+    'parse_seconds': SECONDS_BUCKETS,
+    'produce_seconds': SECONDS_BUCKETS,
+    'response_bytes': BYTES_BUCKETS,
+    'bugs': COUNT_BUCKETS,
+}
+
+# counters, errors are counted as error:<exception class name>
+CACHE_HIT = 'cache_hit'
+CACHE_STALE = 'cache_stale'
+CACHE_MISS = 'cache_miss'
+COALESCED = 'coalesced'
+UNAVAILABLE = 'unavailable'
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def cumulative(self):
+        """ Yields (upper bound, cumulative count), bound is '+Inf' last """
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            buckets=[[bound, count] for bound, count in self.cumulative()],
+        )
+
+
+class FetchMetrics(object):
+    """ Metrics of one (tracker, fetch method) pair """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.histograms = dict(
+            (name, Histogram(buckets))
+            for name, buckets in HISTOGRAMS.iteritems()
+        )
+
+    def to_dict(self):
+        return dict(
+            counters=dict(self.counters),
+            histograms=dict(
+                (name, histogram.to_dict())
+                for name, histogram in self.histograms.iteritems()
+            ),
+        )
+
+
+class MetricsRegistry(object):
+
+    PREFIX = 'intranet_fetcher_'
+
+    def __init__(self):
+        self._metrics = {}  # (tracker name, method) -> FetchMetrics
+
+    def _get(self, tracker, method):
+        key = (tracker.name, method or 'unknown')
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            metrics = self._metrics[key] = FetchMetrics()
+        return metrics
+
+    def inc(self, tracker, method, counter):
+        self._get(tracker, method).counters[counter] += 1
+
+    def error(self, tracker, method, exc):
+        self.inc(tracker, method, 'error:%s' % exc.__class__.__name__)
+
+    def observe(self, tracker, method, histogram, value):
+        self._get(tracker, method).histograms[histogram].observe(value)
+
+    @contextmanager
+    def timer(self, tracker, method, histogram):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(tracker, method, histogram, time.time() - started)
+
+    def clear(self):
+        self._metrics = {}
+
+    def to_dict(self):
+        result = {}
+        for (tracker, method), metrics in sorted(self._metrics.iteritems()):
+            result.setdefault(tracker, {})[method] = metrics.to_dict()
+        return result
+
+    def to_prometheus(self):
+        families = {}  # metric name -> (type, lines)
+
+        def add(name, type_, line):
+            families.setdefault(name, (type_, []))[1].append(line)
+
+        for (tracker, method), metrics in sorted(self._metrics.iteritems()):
+            labels = u'tracker="%s",method="%s"' % (
+                _escape(tracker), _escape(method),
+            )
+            for counter, value in sorted(metrics.counters.iteritems()):
+                if counter.startswith('error:'):
+                    name = self.PREFIX + 'errors_total'
+                    add(name, 'counter', u'%s{%s,error="%s"} %s' % (
+                        name, labels, counter[len('error:'):], value,
+                    ))
+                else:
+                    name = '%s%s_total' % (self.PREFIX, counter)
+                    add(name, 'counter', u'%s{%s} %s' % (name, labels, value))
+            for histogram_name, histogram in metrics.histograms.iteritems():
+                if not histogram.count:
+                    continue
+                name = self.PREFIX + histogram_name
+                for bound, count in histogram.cumulative():
+                    add(name, 'histogram', u'%s_bucket{%s,le="%s"} %s' % (
+                        name, labels, bound, count,
+                    ))
+                add(name, 'histogram', u'%s_sum{%s} %s' % (
+                    name, labels, histogram.sum,
+                ))
+                add(name, 'histogram', u'%s_count{%s} %s' % (
+                    name, labels, histogram.count,
+                ))
+
+        result = []
+        for name, (type_, lines) in sorted(families.iteritems()):
+            result.append(u'# TYPE %s %s' % (name, type_))
+            result.extend(lines)
+        return u'\n'.join(result) + u'\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def response_size(response):
+    """
+    Bytes received, streamed bodies without Content-Length
+    count what was read of them so far
+    """
+    length = response.headers.get('content-length')
+    if length and length.isdigit():
+        return int(length)
+    streamed = getattr(response, 'streamed_bytes', None)
+    if streamed is not None:
+        return streamed
+    content = getattr(response, '_content', False)
+    return len(content) if content else 0
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,145 @@
+"""
+Local bug mirror.
+
+`sync_tracker` pulls tickets changed since the last watermark from a tracker
+(all open tickets on the first synchronization) and stores them in
+`bug_snapshot` table, `MirrorFetcher` answers fetcher queries (except scrum
+ones) from that table without calling the tracker.
+"""
+import datetime
+
+from intranet3.models import DBSession, BugSnapshot, BugSyncState
+from intranet3.log import INFO_LOG, DEBUG_LOG
+
+LOG = INFO_LOG(__name__)
+DEBUG = DEBUG_LOG(__name__)
+
+# tracker clocks may differ from ours, always refetch a bit more
+WATERMARK_OVERLAP = datetime.timedelta(minutes=10)
+# seconds, first synchronization may pull thousands of tickets
+SYNC_TIMEOUT = 15 * 60
+
+
+def _login(user, reverse_mapping):
+    """ Tracker login of bug owner/reporter produced by bug producer """
+    if user is None:
+        return None
+    if user.id is not None:
+        return reverse_mapping.get(user.id)
+    return (user.name or '').lower()
+
+
+def sync_tracker(fetcher):
+    """
+    Synchronizes tracker of given fetcher with the local mirror,
+    returns number of stored bugs
+    """
+    tracker = fetcher.tracker
+    started = datetime.datetime.now()
+    state = BugSyncState.query.get(tracker.id)
+    if state is None:
+        since = None
+        LOG(u'Synchronizing all open bugs of tracker %s' % tracker.name)
+    else:
+        since = state.watermark - WATERMARK_OVERLAP
+        LOG(u'Synchronizing bugs of tracker %s changed since %s' % (
+            tracker.name, since,
+        ))
+
+    # sync runs in background, users' fetches don't depend on its outcome
+    fetcher.timeout = SYNC_TIMEOUT
+    fetcher.track_health = False
+    fetcher.fetch_updated_tickets(since)
+    parsed_data = fetcher.get_raw_result()
+
+    reverse_mapping = dict(
+        (user.id, login) for login, user in fetcher.login_mapping.iteritems()
+    )
+    count = 0
+    for bug_desc, bug in fetcher.produce(parsed_data):
+        bug_desc = dict(bug_desc)
+        bug_desc.pop('tracker', None)  # unfuddle keeps model here
+        changeddate = bug.changeddate
+        if changeddate is not None and changeddate.tzinfo is not None:
+            changeddate = changeddate.replace(tzinfo=None)
+        DBSession.merge(BugSnapshot(
+            tracker_id=tracker.id,
+            bug_id=bug.id,
+            project_id=bug.project_id,
+            owner=_login(bug.owner, reverse_mapping),
+            reporter=_login(bug.reporter, reverse_mapping),
+            status=bug.status or '',
+            changeddate=changeddate,
+            data=bug_desc,
+            synced_ts=started,
+        ))
+        count += 1
+
+    if state is None:
+        state = BugSyncState(tracker_id=tracker.id)
+        DBSession.add(state)
+    state.watermark = started
+    state.synced_ts = started
+    state.extra_data = dict(fetcher._extra_data)
+
+    LOG(u'Synchronized %s bugs of tracker %s' % (count, tracker.name))
+    return count
+
+
+class MirrorFetcher(object):
+    """
+    Fetcher-like object that reads bugs from local mirror.
+    It wraps regular fetcher to reuse its login handling and bug producer.
+    """
+
+    def __init__(self, fetcher, state):
+        self.fetcher = fetcher
+        self.tracker = fetcher.tracker
+        self.state = state
+        self._query = None
+        self.fetched_at = state.synced_ts
+
+    @classmethod
+    def get_state(cls, tracker):
+        return BugSyncState.query.get(tracker.id)
+
+    def _base_query(self, resolved):
+        statuses = self.fetcher.RESOLVED_STATUSES if resolved \
+            else self.fetcher.UNRESOLVED_STATUSES
+        query = BugSnapshot.query \
+            .filter(BugSnapshot.tracker_id == self.tracker.id)
+        if not statuses:
+            # tracker doesn't report such bugs, status is never NULL
+            return query.filter(BugSnapshot.status == None)
+        return query.filter(BugSnapshot.status.in_(statuses))
+
+    def _user_filter(self, query, logins, resolved):
+        if resolved:
+            return query.filter(
+                BugSnapshot.owner.in_(logins) | BugSnapshot.reporter.in_(logins)
+            )
+        return query.filter(BugSnapshot.owner.in_(logins))
+
+    def fetch_user_tickets(self, resolved=False):
+        query = self._base_query(resolved)
+        self._query = self._user_filter(
+            query, [self.fetcher.login.lower()], resolved,
+        )
+
+    def fetch_all_tickets(self, resolved=False):
+        query = self._base_query(resolved)
+        logins = self.fetcher.login_mapping.keys()
+        self._query = self._user_filter(query, logins, resolved) \
+            if logins else query.filter(BugSnapshot.owner == None)
+
+    def fetch_project_tickets(self, project_id, resolved=False):
+        query = self._base_query(resolved)
+        self._query = query.filter(BugSnapshot.project_id == project_id)
+
+    def get_raw_result(self):
+        return [snapshot.data for snapshot in self._query]
+
+    def get_result(self):
+        parsed_data = self.get_raw_result()
+        produced = self.fetcher.produce(parsed_data, self.state.extra_data or {})
+        return [bug for bug_desc, bug in produced]
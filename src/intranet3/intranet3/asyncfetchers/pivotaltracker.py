@@ -1,4 +1,5 @@
 import json
+import time
 
 import requests
 from requests.auth import HTTPBasicAuth
@@ -11,6 +12,8 @@ from intranet3.log import EXCEPTION_LOG, INFO_LOG
 
 from .base import BaseFetcher, FetcherBadDataError
 from .bug import BaseBugProducer
+from .limiter import limited
+from .metadata import METADATA, TrackerMetadata
 from .request import RPC
 
 LOG = INFO_LOG(__name__)
@@ -23,6 +26,7 @@ ISSUE_STATE_UNRESOLVED = ['started', 'unstarted', 'unscheduled', 'accepted']
 class PivotalTrackerBugProducer(BaseBugProducer):
 
     def parse(self, tracker, login_mapping, raw_data):
+        raw_data = dict(raw_data)
         raw_data.update(dict(
             opendate=dateutil.parser.parse(raw_data['opendate']),
             changeddate=dateutil.parser.parse(raw_data['changeddate']),
@@ -37,12 +41,14 @@ class PivotalTrackerTokenFetcher(BaseFetcher):
     TOKEN_URL = 'https://www.pivotaltracker.com/services/v3/tokens/active'
     BUG_PRODUCER_CLASS = PivotalTrackerBugProducer
 
-    def __init__(self, tracker, credentials, user, login_mapping):
+    def __init__(self, tracker, credentials, user, login_mapping,
+                 timeout=BaseFetcher.MAX_TIMEOUT):
         super(PivotalTrackerTokenFetcher, self).__init__(
             tracker,
             credentials,
             user,
             login_mapping,
+            timeout=timeout,
         )
         try:
             email, login = credentials.login.split(';')
@@ -57,11 +63,13 @@ class PivotalTrackerTokenFetcher(BaseFetcher):
         ])
 
     def get_auth(self):
-        response = requests.get(
-            self.TOKEN_URL,
-            auth=HTTPBasicAuth(self.email, self.password),
-            verify=False,
-        )
+        with limited(self.TOKEN_URL, self.get_timeout()) as timeout:
+            response = requests.get(
+                self.TOKEN_URL,
+                auth=HTTPBasicAuth(self.email, self.password),
+                verify=False,
+                timeout=timeout,
+            )
         try:
             data = ET.fromstring(response.content)
             token = data.find('guid').text
@@ -80,20 +88,31 @@ class PivotalTrackerTokenFetcher(BaseFetcher):
 class PivotalTrackerFetcher(PivotalTrackerTokenFetcher):
     api_url = 'services/v5/projects'
     default_fields = 'owned_by,requested_by,estimate,:default'
-
-    def __init__(self, *args, **kwargs):
-        super(PivotalTrackerFetcher, self).__init__(*args, **kwargs)
-        self._project_ids = None
+    UNRESOLVED_STATUSES = tuple(ISSUE_STATE_UNRESOLVED)
+    RESOLVED_STATUSES = tuple(ISSUE_STATE_RESOLVED)
+    MULTI_PROJECT_SPRINT = True
+    SUPPORTS_MIRROR = True
+    # API is served over https only (local stand-ins turn it off)
+    FORCE_HTTPS = True
 
     def get_project_ids(self):
+        # projects visible to the user, shared by fetchers of the same login
+        metadata = METADATA.get(
+            self.tracker, self.load_metadata, scope=self.login,
+        )
+        return metadata.projects.keys()
+
+    def load_metadata(self):
         rpc = self.get_rpc()
         rpc.url = self.prepare_url()
         rpc.start()
         response = rpc.get_result()
-        return self.parse_project(response.content)
+        return TrackerMetadata(projects=self.parse_project(response.content))
 
     def prepare_url(self, project_id='', endpoint='', params={}):
-        tracker_url = self.tracker.url.replace('http://', 'https://')
+        tracker_url = self.tracker.url
+        if self.FORCE_HTTPS:
+            tracker_url = tracker_url.replace('http://', 'https://')
         url = make_path(tracker_url, self.api_url, project_id, endpoint)
         if params:
             url += '?'
@@ -128,17 +147,19 @@ class PivotalTrackerFetcher(PivotalTrackerTokenFetcher):
         url = '%s %s' % (url_and, url_space)
         return url
 
-    def fetch(self, endpoint, params={}):
+    def fetch(self, endpoint, params={}, project_ids=None):
         rpcs = []
-        project_ids = self.get_project_ids()
-        for project_id in project_ids:
+        visible_ids = self.get_project_ids()
+        if project_ids is not None:
+            visible_ids = [i for i in visible_ids if str(i) in project_ids]
+        for project_id in visible_ids:
             url = self.prepare_url(project_id, endpoint, params)
             rpcs.append(RPC(url=url))
         return rpcs
 
     def parse_project(self, data):
         project_json = json.loads(data)
-        return [p['id'] for p in project_json]
+        return dict((p['id'], p['name']) for p in project_json)
 
     def fetch_user_tickets(self, resolved=False):
         if resolved:
@@ -198,15 +219,42 @@ class PivotalTrackerFetcher(PivotalTrackerTokenFetcher):
         rpcs = self.fetch('stories', params=params)
         self.consume(rpcs)
 
-    def fetch_scrum(self, sprint_name, project_id=None, component_id=None):
-        params = {
+    def fetch_updated_tickets(self, since):
+        if since is None:
+            params = {
+                'fields': self.default_fields,
+                'filter': self._get_filters(states=ISSUE_STATE_UNRESOLVED),
+            }
+        else:
+            params = {
+                'fields': self.default_fields,
+                # milliseconds since epoch
+                'updated_after': str(int(time.mktime(since.timetuple()) * 1000)),
+            }
+        rpcs = self.fetch('stories', params=params)
+        self.consume(rpcs)
+
+    def _scrum_params(self, sprint_name):
+        return {
             'fields': self.default_fields,
             'filter': self._get_filters(
                 label=sprint_name,
                 include_done=True,
             )
         }
-        rpcs = self.fetch('stories', params=params)
+
+    def fetch_scrum(self, sprint_name, project_id=None, component_id=None):
+        rpcs = self.fetch('stories', params=self._scrum_params(sprint_name))
+        self.consume(rpcs)
+
+    def fetch_sprint(self, sprint_name, selectors):
+        # project selector is pivotal project id
+        project_ids, components = self.split_selectors(selectors)
+        rpcs = self.fetch(
+            'stories',
+            params=self._scrum_params(sprint_name),
+            project_ids=project_ids,
+        )
         self.consume(rpcs)
 
     def parse(self, data):
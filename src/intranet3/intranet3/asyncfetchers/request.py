@@ -1,36 +1,231 @@
+import time
+import hashlib
+from collections import deque
+from contextlib import contextmanager
+from urlparse import urlparse
+
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 
 import requests
 
+from intranet3.log import DEBUG_LOG
+
 from .greenlet import Greenlet
+from .limiter import take_slot
+
+DEBUG = DEBUG_LOG(__name__)
+
+
+class SessionPool(object):
+    """
+    Process-wide pool of keep-alive ``requests.Session`` objects.
+
+    Sessions are grouped by key (tracker host + credentials digest) so
+    a borrowed session never carries auth state of another user.
+    Every key holds at most ``max_size`` idle sessions, sessions idle longer
+    than ``max_idle`` seconds are closed on next acquire/release.
+
+    All operations are free of blocking calls, so with gevent they are
+    atomic and no locking is needed.
+    """
+
+    MAX_SIZE = 4  # idle sessions per key
+    MAX_KEYS = 256
+    MAX_IDLE = 60  # seconds
+
+    def __init__(self, max_size=MAX_SIZE, max_idle=MAX_IDLE, max_keys=MAX_KEYS):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_keys = max_keys
+        self._idle = {}  # key -> deque of (session, released_at)
+
+    @staticmethod
+    def make_key(url, login, password):
+        """ Credentials are kept only as a digest """
+        host = urlparse(url or '').netloc
+        credentials = u'%s\0%s' % (login, password)
+        digest = hashlib.sha1(credentials.encode('utf-8')).hexdigest()
+        return host, digest
+
+    def _create(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def acquire(self, key):
+        now = time.time()
+        self.evict(now)
+        idle = self._idle.get(key)
+        if idle:
+            session, _ = idle.pop()
+            return session
+        DEBUG(u'Creating new session for %s' % (key[0], ))
+        return self._create()
+
+    def release(self, key, session):
+        now = time.time()
+        idle = self._idle.get(key)
+        if idle is None:
+            if len(self._idle) >= self.max_keys:
+                self.evict(now, force=True)
+            idle = self._idle[key] = deque()
+        if len(idle) >= self.max_size:
+            session.close()
+            return
+        idle.append((session, now))
+
+    def evict(self, now=None, force=False):
+        """
+        Close sessions idle for more than max_idle seconds,
+        with force=True the least recently used key is dropped as well
+        """
+        now = now or time.time()
+        oldest_key, oldest_ts = None, None
+        for key, idle in self._idle.items():
+            while idle and now - idle[0][1] > self.max_idle:
+                session, _ = idle.popleft()
+                session.close()
+            if not idle:
+                del self._idle[key]
+            elif oldest_ts is None or idle[-1][1] < oldest_ts:
+                oldest_key, oldest_ts = key, idle[-1][1]
+
+        if force and oldest_key is not None:
+            for session, _ in self._idle.pop(oldest_key):
+                session.close()
+
+    def clear(self):
+        for idle in self._idle.itervalues():
+            for session, _ in idle:
+                session.close()
+        self._idle = {}
+
+
+SESSIONS = SessionPool()
+
+
+def hold_slot(response, release):
+    """
+    Streamed response keeps the host slot until its body is read
+    (iter_content backs iter_lines, content and json too) or it is closed,
+    bytes passed through are counted in streamed_bytes
+    """
+    iter_content = response.iter_content
+    close = response.close
+    response.streamed_bytes = 0
+
+    def iter_content_(*args, **kwargs):
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                response.streamed_bytes += len(chunk)
+                yield chunk
+        finally:
+            release()
+
+    def close_():
+        try:
+            close()
+        finally:
+            release()
+
+    response.iter_content = iter_content_
+    response.close = close_
+    return response
 
 
 class RPC(object):
-    def __init__(self, url=None, method='GET', **kwargs):
+    def __init__(self, url=None, method='GET', session_key=None, **kwargs):
         method = method.upper()
 
         self.method = method
         self.url = url
         self.kwargs = kwargs
 
-        self.s = requests.Session()
+        self._session = None
+        self._session_key = None
         self._greenlet = None
+        self.timeout = None  # seconds, passed to requests
+        if session_key is not None:
+            self.borrow(session_key)
+
+    def borrow(self, session_key):
+        """ Take session from the pool, it is given back in get_result """
+        if self._session is None:
+            self._session_key = session_key
+            self._session = SESSIONS.acquire(session_key)
+        return self
+
+    @property
+    def s(self):
+        if self._session is None:
+            # not pooled, will be closed along with this RPC
+            self._session = requests.Session()
+        return self._session
 
     def basic_auth(self, login, password):
         self.s.auth = HTTPBasicAuth(login, password)
 
     def start(self):
-        self._greenlet = Greenlet.spawn(
-            self.s.request,
-            self.method,
-            self.url,
-            verify=False,
-            **self.kwargs
-        )
+        self._greenlet = Greenlet.spawn(self._request)
         return self
 
+    def _request(self):
+        # waiting for a free slot of the host eats from the request timeout
+        release, timeout = take_slot(self.url, self.timeout)
+        try:
+            response = self.s.request(
+                self.method,
+                self.url,
+                verify=False,
+                timeout=timeout,
+                **self.kwargs
+            )
+        except:
+            release()
+            raise
+        if self.kwargs.get('stream'):
+            # body is still to be downloaded, consumer closes the response
+            return hold_slot(response, release)
+        release()
+        return response
+
+    def release(self):
+        if self._session is not None and self._session_key is not None:
+            SESSIONS.release(self._session_key, self._session)
+        self._session = None
+        self._session_key = None
+
     def get_result(self):
         self._greenlet.join()
+        self.release()
         self._greenlet.reraise_exc()
 
         return self._greenlet.value
+
+    def close(self):
+        """
+        Waits for started request and closes its response,
+        so a streamed body that was not read gives the host slot back.
+        Errors of the request are ignored.
+        """
+        if self._greenlet is None:
+            return
+        try:
+            response = self.get_result()
+        except Exception:
+            return
+        if response is not None:
+            response.close()
+
+
+@contextmanager
+def closing_rpcs(rpcs):
+    """ Closes responses of all rpcs when the block is left, even by error """
+    try:
+        yield rpcs
+    finally:
+        for rpc in rpcs:
+            rpc.close()
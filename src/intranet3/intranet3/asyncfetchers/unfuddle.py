@@ -16,6 +16,7 @@ from .base import (
     FetchException,
 )
 from .bug import BaseBugProducer, BaseScrumProducer
+from .metadata import METADATA, TrackerMetadata
 from .request import RPC
 from .utils import parse_whiteboard
 
@@ -53,21 +54,28 @@ class UnfuddleMetadataFetcher(BasicAuthMixin, BaseFetcher):
     we have to create new login mapping by fetching all users from unfuddle
     and then use it in self.parse
     """
-    unfuddle_data = None
-    UNFUDDLE_DATA_KEY = 'unfuddle_data'
-    UNFUDDLE_DATA_TIMEOUT = 60*3
     DATA_API = '/api/v1/initializer.json'
 
     def before_fetch(self):
-        url = self.tracker.url + self.DATA_API
-        rpc = RPC(url=url)
-        self.apply_auth(rpc)
-        rpc.start()
-        self._unfuddle_data_rpc = rpc
+        # first fetcher of the tracker loads metadata, others use the cache
+        self.unfuddle_data
 
     @reify
     def unfuddle_data(self):
-        response = self._unfuddle_data_rpc.get_result()
+        # initializer lists what the user can see, share it per login only
+        metadata = METADATA.get(
+            self.tracker, self.load_metadata, scope=self.login,
+        )
+        data = metadata.to_dict()
+        data['whiteboard_field_numbers'] = \
+            metadata.fields['whiteboard_field_numbers']
+        return data
+
+    def load_metadata(self):
+        rpc = self.get_rpc()
+        rpc.url = self.tracker.url + self.DATA_API
+        rpc.start()
+        response = rpc.get_result()
 
         try:
             jdata = json.loads(response.content)
@@ -75,27 +83,21 @@ class UnfuddleMetadataFetcher(BasicAuthMixin, BaseFetcher):
             ERROR('Error while parsing unfuddle response: \n%s' % e)
             raise FetchException(e)
 
-        users = self._get_users(jdata.get('people', []))
-        projects = self._get_projects(jdata.get('projects', []))
-        whiteboard_field_numbers = self._get_whiteboard_number(
-            jdata.get('projects', [])
-        )
-        components = self._get_components(jdata.get('components', []))
-        milestones = self._get_milestones(jdata.get('milestones', []))
-        custom_fields = self._get_custom_fields(
-            jdata.get('custom_field_values', [])
+        return TrackerMetadata(
+            users=self._get_users(jdata.get('people', [])),
+            projects=self._get_projects(jdata.get('projects', [])),
+            components=self._get_components(jdata.get('components', [])),
+            milestones=self._get_milestones(jdata.get('milestones', [])),
+            custom_fields=self._get_custom_fields(
+                jdata.get('custom_field_values', [])
+            ),
+            fields={
+                'whiteboard_field_numbers': self._get_whiteboard_number(
+                    jdata.get('projects', [])
+                ),
+            },
         )
 
-        data = {
-            'users': users,
-            'projects': projects,
-            'components': components,
-            'milestones': milestones,
-            'custom_fields': custom_fields,
-            'whiteboard_field_numbers': whiteboard_field_numbers,
-        }
-        return data
-
     def _get_whiteboard_number(self, projects):
         result = {}
         for project in projects:
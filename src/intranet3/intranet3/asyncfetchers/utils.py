@@ -1,3 +1,11 @@
+import time
+import datetime
+
+
+def to_utc(date):
+    """ Converts naive local datetime to naive UTC datetime """
+    return datetime.datetime.utcfromtimestamp(time.mktime(date.timetuple()))
+
 
 def parse_whiteboard(wb):
     wb = wb.strip().replace('[', ' ').replace(']', ' ')
@@ -25,6 +25,15 @@ missing_hours_notification = URLCronTask(
     '/cron/remind/missing_hours',
 )
 mailer = MailCheckerTask()
+bug_mirror_sync = URLCronTask(
+    u'Bug mirror synchronization',
+    '/cron/bugs/sync_mirror',
+)
+
+bug_cache_warmer = URLCronTask(
+    u'Bug cache warming',
+    '/cron/bugs/warm_cache',
+)
 
 ## Reports
 report_with_today_hours = URLCronTask(
@@ -94,6 +103,8 @@ cron_tasks = (
 
 timer_tasks = (
     (mailer, 60),  # every 60 second
+    (bug_mirror_sync, 5 * 60),  # every 5 minutes
+    (bug_cache_warmer, 2 * 60),  # every 2 minutes, see WarmCache.INTERVAL
 )
 
 
@@ -10,6 +10,7 @@ _ = TranslationStringFactory('intranet3')
 
 TRACKER_TYPES = OrderedDict()
 TRACKER_TYPES["bugzilla"] = u"Bugzilla"
+TRACKER_TYPES["bugzilla_rpc"] = u"Bugzilla (JSON-RPC)"
 TRACKER_TYPES["trac"] = u"Trac"
 TRACKER_TYPES["igozilla"] = u"Igozilla"
 TRACKER_TYPES["rockzilla"] = u"SteepRockZilla"
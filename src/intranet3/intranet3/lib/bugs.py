@@ -2,11 +2,13 @@ from __future__ import with_statement
 from time import sleep, time
 
 from intranet3.decorators import log_time
-from intranet3.models import DBSession, TrackerCredentials, Tracker, Project, User
-from intranet3.asyncfetchers import get_fetcher, FetcherBaseException, FetcherTimeout, FetcherBadDataError
+from intranet3.models import DBSession, TrackerCredentials, Tracker, Project, User, TimeEntry
+from intranet3.models.project import SelectorMapping
+from intranet3.asyncfetchers import get_fetcher, FetcherBaseException, FetcherTimeout, FetcherBadDataError, MirrorFetcher
 from intranet3.log import INFO_LOG, WARN_LOG, ERROR_LOG
 from intranet3.utils import flash
-from intranet3 import memcache
+from intranet3 import memcache, config
+from intranet3 import helpers as h
 
 LOG = INFO_LOG(__name__)
 WARN = WARN_LOG(__name__)
@@ -15,12 +17,33 @@ ERROR = ERROR_LOG(__name__)
 
 class Bugs(object):
 
-    def __init__(self, request, user=None):
+    def __init__(self, request, user=None, mirror=None, refresh_ahead=None):
         """
         If no user is provided,  we will fetch bugs using current user credentials
+        If mirror is True (default is BUG_MIRROR setting) bugs are read from
+        local bug mirror for already synchronized trackers
+        refresh_ahead (seconds) is passed to fetchers, see BaseFetcher
         """
         self.request = request
         self.user = user or request.user
+        if mirror is None:
+            mirror = config.get('BUG_MIRROR', 'false').lower() in h.positive_values
+        self.mirror = mirror
+        self.refresh_ahead = refresh_ahead
+        # datetime of the oldest tracker response used, for "as of" notes
+        self.fetched_at = None
+
+    def _note_freshness(self, fetcher):
+        fetched_at = getattr(fetcher, 'fetched_at', None)
+        if fetched_at is None:
+            return
+        if self.fetched_at is None or fetched_at < self.fetched_at:
+            self.fetched_at = fetched_at
+
+    def _get_fetcher(self, tracker, credentials, user, login_mapping, mirror=False):
+        fetcher = get_fetcher(tracker, credentials, user, login_mapping, mirror=mirror)
+        fetcher.refresh_ahead = self.refresh_ahead
+        return fetcher
 
     @log_time
     def _get_bugs(self, fetcher_callback, full_mapping=True):
@@ -29,13 +52,17 @@ class Bugs(object):
                            .filter(Tracker.id==TrackerCredentials.tracker_id) \
                            .filter(User.id==TrackerCredentials.user_id)\
                            .filter(TrackerCredentials.user_id==self.user.id).all()
+        if full_mapping:
+            mappings = TrackerCredentials.get_logins_mappings(
+                [tracker for tracker, credentials, user in creds_q]
+            )
 
         for tracker, credentials, user in creds_q:
             if full_mapping:
-                mapping = TrackerCredentials.get_logins_mapping(tracker)
+                mapping = mappings[tracker.id]
             else:
                 mapping = {credentials.login.lower(): self.user}
-            fetcher = get_fetcher(tracker, credentials, user, mapping)
+            fetcher = self._get_fetcher(tracker, credentials, user, mapping, mirror=self.mirror)
             fetchers.append(fetcher)
             fetcher_callback(fetcher) # initialize query
         bugs = []
@@ -44,6 +71,7 @@ class Bugs(object):
             try:
                 fbugs = fetcher.get_result()
                 bugs.extend(fbugs)
+                self._note_freshness(fetcher)
             except FetcherTimeout as e:
                 flash(
                     'Fetchers for trackers %s timed-out' % fetcher.tracker.name,
@@ -105,8 +133,11 @@ class Bugs(object):
             return []
 
         login_mapping = TrackerCredentials.get_logins_mapping(tracker)
-        fetcher = get_fetcher(tracker, credentials, self.user, login_mapping)
-        fetcher.fetch_bugs_for_query(*project.get_selector_tuple(), resolved=resolved)
+        fetcher = self._get_fetcher(tracker, credentials, self.user, login_mapping, mirror=self.mirror)
+        if isinstance(fetcher, MirrorFetcher):
+            fetcher.fetch_project_tickets(project.id, resolved=resolved)
+        else:
+            fetcher.fetch_bugs_for_query(*project.get_selector_tuple(), resolved=resolved)
 
         bugs = []
 
@@ -114,6 +145,7 @@ class Bugs(object):
             for bug in fetcher.get_result():
                 bug.project = project
                 bugs.append(bug)
+            self._note_freshness(fetcher)
         except FetcherTimeout as e:
             flash(
                 'Fetchers for trackers %s timed-out' % fetcher.tracker.name,
@@ -131,6 +163,7 @@ class Bugs(object):
         return bugs
 
     def get_sprint(self, sprint):
+        # bug mirror doesn't know about sprints, always fetch live
         project_ids = sprint.bugs_project_ids
 
         entries = DBSession.query(Project, Tracker, TrackerCredentials, User) \
@@ -139,14 +172,12 @@ class Bugs(object):
                    .filter(TrackerCredentials.tracker_id==Project.tracker_id) \
                    .filter(TrackerCredentials.user_id==User.id)\
                    .filter(TrackerCredentials.user_id==self.user.id).all()
+        mappings = TrackerCredentials.get_logins_mappings(
+            [tracker for project, tracker, creds, user in entries]
+        )
 
-        fetchers = []
-        for project, tracker, creds, user in entries:
-            fetcher = get_fetcher(tracker, creds, user, tracker.logins_mapping)
-            fetcher.fetch_scrum(sprint.name, project.project_selector, project.component_selector)
-            fetchers.append(fetcher)
-            if tracker.type in ('bugzilla', 'rockzilla', 'igozilla'):
-                break
+        fetchers = self._plan_sprint_fetchers(sprint, entries, mappings)
+        sprint_project_ids = set(project_ids)
 
         start = time()
         bugs = []
@@ -169,8 +200,10 @@ class Bugs(object):
                     klass='error',
                     )
                 continue
+            if getattr(fetcher, 'MULTI_PROJECT_SPRINT', False):
+                fbugs = self._demultiplex(fetcher.tracker, fbugs, sprint_project_ids)
             bugs.extend(fbugs)
-
+            self._note_freshness(fetcher)
 
         projects = [bug.project_id for bug in bugs]
         projects = dict((project.id, project) for project in Project.query.filter(Project.id.in_(projects)))
@@ -182,62 +215,72 @@ class Bugs(object):
         bugs = self.add_time(bugs, sprint=sprint)
         return bugs
 
+    def _plan_sprint_fetchers(self, sprint, entries, mappings):
+        """
+        Groups sprint projects by tracker, trackers that can query many
+        projects at once (MULTI_PROJECT_SPRINT) get one combined query,
+        others one query per project.
+        Bugs are mapped back to projects by selector mapping of the tracker.
+        """
+        by_tracker = {}
+        for entry in entries:
+            project, tracker, creds, user = entry
+            by_tracker.setdefault(tracker.id, []).append(entry)
+
+        fetchers = []
+        for tracker_id, tracker_entries in by_tracker.iteritems():
+            for project, tracker, creds, user in tracker_entries:
+                fetcher = self._get_fetcher(tracker, creds, user, mappings[tracker_id])
+                fetchers.append(fetcher)
+                if getattr(fetcher, 'MULTI_PROJECT_SPRINT', False):
+                    selectors = tuple(sorted(set(
+                        (p.project_selector, p.component_selector)
+                        for p, t, c, u in tracker_entries
+                    )))
+                    fetcher.fetch_sprint(sprint.name, selectors)
+                    break
+                fetcher.fetch_scrum(sprint.name, project.project_selector, project.component_selector)
+        return fetchers
+
+    @staticmethod
+    def _demultiplex(tracker, bugs, project_ids):
+        """
+        Maps bugs of combined sprint query to projects,
+        bugs of projects outside of the sprint are dropped
+        """
+        matched = SelectorMapping.for_tracker(tracker).match_many(bugs)
+        result = []
+        for bug, project_id in zip(bugs, matched):
+            if project_id in project_ids:
+                bug.project_id = project_id
+                result.append(bug)
+        return result
+
     @classmethod
     def add_time(cls, orig_bugs, sprint=None):
         """
         @param orig_bugs: list of bugs
         Add times to bugs, can be used inside and outside the class.
         """
-        bugs = dict(((bug.id, bug.project_id), bug) for bug in orig_bugs if bug.project)
-        where_condition = '(t.ticket_id = :bug_id_%s AND t.project_id = :project_id_%s)'
-        conditions = []
-        params = {}
-        i = 1
+        bugs = dict(((str(bug.id), bug.project_id), bug) for bug in orig_bugs if bug.project)
 
         for bug in orig_bugs:
             bug.time = 0.0
             bug.sprint_time = 0.0
 
-        for bug_id, project_id in bugs:
-            conditions.append(where_condition % (i, i))
-            params['bug_id_%s' % i] = bug_id
-            params['project_id_%s' % i] = project_id
-            i += 1
-
-        if not conditions:
-            return orig_bugs # short circuit to avoid useless (and incorrect) SQL query
-        condition = ' OR '.join(conditions)
-        sql = """
-        SELECT t.ticket_id as "ticket_id", t.project_id as "project_id", SUM(t.time) as "time"
-        FROM time_entry t
-        WHERE t.deleted = FALSE AND (%s)
-        GROUP BY t.ticket_id, t.project_id
-        """ % (condition, )
-        query = DBSession.query('ticket_id', 'project_id', 'time').from_statement(sql).params(**params)
-
-        for bug_id, project_id, time in query:
-            bug = bugs[(bug_id, project_id)]
+        if not bugs:
+            return orig_bugs # short circuit to avoid useless query
+        start = end = None
+        if sprint:
+            start, end = sprint.start, sprint.end
+        times = TimeEntry.get_ticket_times(bugs.keys(), start, end)
+
+        for key, (time, sprint_time) in times.iteritems():
+            bug = bugs[key]
             bug.time = time
             points = bug.scrum.points or 0.0
             velocity = ((points / time) * 8.0) if time else 0.0
             bug.scrum.velocity = velocity
-
-
-        if sprint:
-            params['sprint_start'] = sprint.start
-            params['sprint_end'] = sprint.end
-            sql = """
-            SELECT t.ticket_id as "ticket_id", t.project_id as "project_id", SUM(t.time) as "time"
-            FROM time_entry t
-            WHERE t.deleted = FALSE AND (%s) AND t.date >= :sprint_start AND t.date <= :sprint_end
-            GROUP BY t.ticket_id, t.project_id
-            """ % (condition, )
-            query = DBSession.query('ticket_id', 'project_id', 'time').from_statement(sql).params(**params)
-
-            for bug in orig_bugs:
-                bug.sprint_time = 0.0
-
-            for bug_id, project_id, time in query:
-                bugs[(bug_id, project_id)].sprint_time = time
+            bug.sprint_time = sprint_time
 
         return orig_bugs
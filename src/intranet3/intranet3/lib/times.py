@@ -1,10 +1,9 @@
 import datetime
 import copy
+from collections import OrderedDict, namedtuple
 
-import xlwt
 from jinja2 import escape
 from pyramid.httpexceptions import HTTPForbidden, HTTPBadRequest
-from pyramid.response import Response
 from sqlalchemy.sql import or_, and_
 
 from intranet3.utils.filters import comma_number
@@ -13,6 +12,7 @@ from intranet3.log import INFO_LOG, WARN_LOG, ERROR_LOG, DEBUG_LOG, EXCEPTION_LO
 from intranet3.helpers import previous_month
 from intranet3.forms.times import TimeEntryForm
 from intranet3.models import DBSession
+from intranet3.utils import export
 
 LOG = INFO_LOG(__name__)
 WARN = WARN_LOG(__name__)
@@ -87,12 +87,48 @@ class ProtectTimeEntriesMixin(object):
             self.v['user'] = User.query.get(self.request.GET.get('user_id'))
 
 
+# client, project, user or tracker of report entries
+Dimension = namedtuple('Dimension', 'id name')
+
+
+def _dimension(*columns):
+    return dict(
+        (id_, Dimension(id_, name)) for id_, name in DBSession.query(*columns)
+    )
+
+
+def report_entries(uber_query):
+    """
+    Yields rows of uber query as (client, project, ticket id, user, tracker,
+    description, date, time) tuples, entities are Dimension tuples
+    fetched once and shared by all rows
+    """
+    clients = _dimension(Client.id, Client.name)
+    trackers = _dimension(Tracker.id, Tracker.name)
+    users = _dimension(User.id, User.name)
+    projects = dict(
+        (id_, (clients.get(client_id), Dimension(id_, name), trackers.get(tracker_id)))
+        for id_, name, client_id, tracker_id in DBSession.query(
+            Project.id, Project.name, Project.client_id, Project.tracker_id,
+        )
+    )
+    for project_id, ticket_id, user_id, desc, date, time in export.stream(uber_query):
+        client, project, tracker = projects[project_id]
+        yield client, project, ticket_id, users[user_id], tracker, desc, date, time
+
+
 class TimesReportMixin(object):
+    """
+    Uber queries select only columns of time entries,
+    rows are resolved with `report_entries`
+    """
+    COLUMNS = (
+        TimeEntry.project_id, TimeEntry.ticket_id, TimeEntry.user_id,
+        TimeEntry.description, TimeEntry.date, TimeEntry.time,
+    )
+
     def _prepare_uber_query_for_sprint(self, sprint, bugs, ticket_choice):
-        uber_query = DBSession.query(
-            Client, Project, TimeEntry.ticket_id, User, Tracker,
-            TimeEntry.description, TimeEntry.date, TimeEntry.time
-        )
+        uber_query = DBSession.query(*self.COLUMNS)
         uber_query = uber_query.filter(TimeEntry.user_id==User.id) \
                                .filter(TimeEntry.project_id==sprint.project_id) \
                                .filter(TimeEntry.project_id==Project.id) \
@@ -129,10 +165,7 @@ class TimesReportMixin(object):
         return uber_query
 
     def _prepare_uber_query(self, start_date, end_date, projects, users, ticket_choice, bug_id=None):
-        uber_query = DBSession.query(
-            Client, Project, TimeEntry.ticket_id, User, Tracker,
-            TimeEntry.description, TimeEntry.date, TimeEntry.time
-        )
+        uber_query = DBSession.query(*self.COLUMNS)
         uber_query = uber_query.filter(TimeEntry.user_id==User.id)\
                                .filter(TimeEntry.project_id==Project.id)\
                                .filter(Project.tracker_id==Tracker.id)\
@@ -180,6 +213,9 @@ class TimesReportMixin(object):
 
 class Row(list):
     row_counter = 0
+    TIME = 7  # column summed in grouped rows
+    # grouped entries are kept as subrows
+    KEEP_SUBROWS = True
     ##  Client, Project, TimeEntry.ticket_id, User
     ## possibilities:
     ## 1 1 1 1
@@ -223,58 +259,42 @@ class Row(list):
         return self
 
     @classmethod
-    def _group(cls, a_entries, groupby):
-        entries = a_entries[:]
-
-        while entries:
-            subrow = [entries.pop()]
-            poss = []
-
-            for i, entry in enumerate(entries):
-                if cls._isthesame(subrow[0], entry, groupby):
-                    poss.append(i)
-
-            for i in sorted(poss, reverse=True):
-                subrow.append(entries.pop(i))
-            yield subrow
-
-    @classmethod
-    def _isthesame(cls, row1, row2, groupby):
-        if (not groupby[0] or row1[0] == row2[0]) and \
-           (not groupby[1] or row1[1] == row2[1]) and \
-           (not groupby[2] or row1[2] == row2[2]) and \
-           (not groupby[3] or row1[3] == row2[3]):
-            return True
-
-        return False
+    def _group(cls, entries, groupby):
+        """
+        Groups entries in a single pass by columns with groupby flag set,
+        yields (first entry, grouped entries, indexes of columns with
+        different values, time sum) in order of first entries of groups.
+        Grouped entries are empty for single entry groups
+        and without KEEP_SUBROWS.
+        """
+        keys = [i for i, flag in enumerate(groupby) if flag]
+        groups = OrderedDict()
+        for entry in entries:
+            key = tuple(entry[i] for i in keys)
+            group = groups.get(key)
+            if group is None:
+                subrows = [entry] if cls.KEEP_SUBROWS else None
+                groups[key] = [entry, subrows, set(), entry[cls.TIME], 1]
+                continue
+            first, subrows, multiple = group[:3]
+            for i, value in enumerate(entry):
+                if i not in multiple and value != first[i]:
+                    multiple.add(i)
+            if subrows is not None:
+                subrows.append(entry)
+            group[3] += entry[cls.TIME]
+            group[4] += 1
+        for first, subrows, multiple, time, count in groups.itervalues():
+            yield first, subrows if count > 1 and subrows else [], multiple, time
 
     @classmethod
-    def create_row(cls, entries, groupby):
-        row = list(entries[0])
-        if len(entries) == 1:
-            return cls(row, [])
-
-        def multiple_entries(i, rows):
-            """Checks if grouped rows has the same fields
-            """
-            fields = set([ row[i] for row in rows])
-            return True if len(fields) > 1 else False
-
-        for i, entry in enumerate(row):
-            if multiple_entries(i, entries):
-                row[i] = 'Multiple entries'
-
-        #for i, gb in enumerate(groupby):
-        #    if not gb:
-        #        row[i] = 'Multiple entries'
-
-        #if not groupby[2]:
-        #    row[4] = 'Multiple entries'
-        #    row[5] = 'Multiple entries'
+    def create_row(cls, first, subrows, multiple, time):
+        row = list(first)
+        for i in multiple:
+            row[i] = 'Multiple entries'
 
-        asum = sum([arow[7] for arow in entries])
-        row[7] = asum
-        return cls(row, entries)
+        row[cls.TIME] = time
+        return cls(row, subrows)
 
     @staticmethod
     def _mos(obj, attr_or_callable):
@@ -290,17 +310,18 @@ class Row(list):
             acallable = attr_or_callable
             return acallable(obj)
 
+    @classmethod
+    def iter_rows(cls, entries, groupby, bigger_than=0):
+        """ Yields rows of groups with time sum bigger than bigger_than """
+        for first, subrows, multiple, time in cls._group(entries, groupby):
+            row = cls.create_row(first, subrows, multiple, time)
+            if row[-1] > bigger_than:
+                yield row
+
     @classmethod
     def from_ordered_data(cls, entries, groupby, bigger_than=0):
-        rows = []
-        sum_all = 0
-        for entry in cls._group(entries, groupby):
-            row = cls.create_row(entry, groupby)
-            asum = row[-1]
-            if asum > bigger_than:
-                rows.append(row)
-                sum_all += asum
-        return rows, sum_all
+        rows = list(cls.iter_rows(entries, groupby, bigger_than))
+        return rows, sum(row[-1] for row in rows)
 
 
 class HTMLRow(Row):
@@ -359,52 +380,33 @@ class HTMLRow(Row):
         return row
 
 class ExcelRow(Row):
+    KEEP_SUBROWS = False
+
     def _print_row(self):
-        date_xf = xlwt.easyxf(num_format_str='DD/MM/YYYY')
         row = [
-            (self._mos(self[0], 'name'),),
-            (self._mos(self[1], 'name'),),
-            (self[2],),
-            (self._mos(self[3], 'name'),),
-            (self[5],),
-            (self._mos(self[6], lambda x : x.strftime('%d.%m.%Y')),date_xf),
-            (comma_number(self[7]),),
+            self._mos(self[0], 'name'),
+            self._mos(self[1], 'name'),
+            self[2],
+            self._mos(self[3], 'name'),
+            self[5],
+            self._mos(self[6], lambda x : x.strftime('%d.%m.%Y')),
+            comma_number(self[7]),
         ]
         return row
 
 
 def dump_entries_to_excel(entries, group_by, bigger_than):
-    wbk = xlwt.Workbook()
-    sheet = wbk.add_sheet('Hours')
-
-    heading_xf = xlwt.easyxf('font: bold on; align: wrap on, vert centre, horiz center')
+    """
+    Response with grouped entries as xlsx, entries can be streamed,
+    first entry of every group is kept until all of them are read,
+    so memory grows with the number of groups, not entries
+    """
     headings = ('Client', 'Project', 'Ticket id', 'Employee', 'Description', 'Date', 'Time')
-    headings_width = (x*256 for x in (20, 30, 10, 40, 100, 12, 10))
-    for colx, value in enumerate(headings):
-        sheet.write(0, colx, value, heading_xf)
-    for i, width in enumerate(headings_width):
-        sheet.col(i).width = width
-
-
-    sheet.set_panes_frozen(True)
-    sheet.set_horz_split_pos(1)
-    sheet.set_remove_splits(True)
-
-    rows, asum = ExcelRow.from_ordered_data(entries, group_by, bigger_than)
-    for j, row in enumerate(rows):
-        row = row.pprint_row()
-        for i, cell in enumerate(row):
-            sheet.write(j+1, i, *cell)
-
-    file_path = '/tmp/tmp.xls'
-    wbk.save(file_path)
-
-    file = open(file_path, 'rb')
-    response = Response(
-        content_type='application/vnd.ms-excel',
-        app_iter = file,
-        )
-    response.headers['Cache-Control'] = 'no-cache'
-    response.content_disposition = 'attachment; filename="report-%s.xls"' % datetime.datetime.now().strftime('%d-%m-%Y--%H-%M-%S')
-
-    return file, response
+    rows = ExcelRow.iter_rows(entries, group_by, bigger_than)
+    return export.xlsx_response(
+        export.report_name(),
+        'Hours',
+        headings,
+        (row.pprint_row() for row in rows),
+        widths=(20, 30, 10, 40, 100, 12, 10),
+    )
@@ -37,6 +37,7 @@ from config import ApplicationConfig
 from employees import Late, Absence, WrongTime
 from holiday import Holiday
 from presence import PresenceEntry
-from times import TimeEntry
+from times import TimeEntry, TimeRollup
 from sprint import Sprint, SprintBoard
 from team import Team, TeamMember
+from bug import BugSnapshot, BugSyncState
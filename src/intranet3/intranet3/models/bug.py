@@ -0,0 +1,39 @@
+import datetime
+
+from sqlalchemy import Column, ForeignKey
+from sqlalchemy.types import String, Integer, DateTime, PickleType
+
+from intranet3.models import Base
+
+
+class BugSnapshot(Base):
+    """
+    Local mirror of a tracker bug.
+    `data` holds parsed tracker data (as returned by fetcher.parse),
+    so bugs can be recreated by fetcher's bug producer without tracker call.
+    """
+    __tablename__ = 'bug_snapshot'
+
+    tracker_id = Column(Integer, ForeignKey('tracker.id'), primary_key=True, nullable=False)
+    bug_id = Column(String, primary_key=True, nullable=False)
+
+    project_id = Column(Integer, ForeignKey('project.id'), nullable=True, index=True)
+    owner = Column(String, nullable=True, index=True)  # tracker login, lowercase
+    reporter = Column(String, nullable=True)  # tracker login, lowercase
+    status = Column(String, nullable=False, default='', index=True)
+    changeddate = Column(DateTime, nullable=True, index=True)
+
+    data = Column(PickleType, nullable=False)
+    synced_ts = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+
+class BugSyncState(Base):
+    """ Watermark of the last incremental synchronization of a tracker """
+    __tablename__ = 'bug_sync_state'
+
+    tracker_id = Column(Integer, ForeignKey('tracker.id'), primary_key=True, nullable=False)
+    watermark = Column(DateTime, nullable=False)
+    synced_ts = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+    # fetcher._extra_data needed by bug producer (like jira story points field)
+    extra_data = Column(PickleType, nullable=True)
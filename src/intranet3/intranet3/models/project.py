@@ -1,6 +1,8 @@
 import re
+import time
 
 from pprint import pformat
+import transaction
 from sqlalchemy import Column, ForeignKey, orm
 from sqlalchemy.types import String, Integer, Boolean, Text
 from sqlalchemy.schema import UniqueConstraint
@@ -17,6 +19,7 @@ DEBUG = DEBUG_LOG(__name__)
 WARN = WARN_LOG(__name__)
 
 SELECTOR_CACHE_KEY = 'SELECTORS_FOR_TRACKER_%s'
+SELECTOR_VERSION_KEY = 'SELECTORS_VERSION_FOR_TRACKER_%s'
 
 STATUS = [
     ('1', 'Initialization'),
@@ -49,6 +52,7 @@ class Project(Base):
 
     BUG_LIST_URL_CONTRUCTORS = {
         'bugzilla': bugzilla_bug_list,
+        'bugzilla_rpc': bugzilla_bug_list,
         'rockzilla': bugzilla_bug_list,
         'igozilla': bugzilla_bug_list,
         'trac': lambda *args: '#',
@@ -163,9 +167,19 @@ class Project(Base):
             return self.client.coordinator
 
 
+def _new_version():
+    return int(time.time() * 1000)
+
+
 class SelectorMapping(object):
     """ Simple storage for cached project selectors """
 
+    # process-local index, tracker_id -> (version, mapping, built at)
+    _index = {}
+    # seconds, mappings are rebuilt at least this often, so changes made
+    # without invalidate_for (e.g. by scripts) show up as well
+    INDEX_TTL = 300
+
     def __init__(self, tracker):
         """
         Creates a selector mapping for given tracker
@@ -202,7 +216,39 @@ class SelectorMapping(object):
             tracker.id, pformat(self.by_ticket_id), pformat(self.by_component))
         )
 
+    @classmethod
+    def for_tracker(cls, tracker):
+        """
+        Returns mapping for tracker kept in process memory,
+        it is rebuilt when version stored in memcache changes
+        or after INDEX_TTL seconds
+        """
+        version = cls.get_version(tracker.id)
+        indexed = cls._index.get(tracker.id)
+        now = time.time()
+        # without memcache there is no version to compare, always rebuild
+        if indexed is not None and version is not None:
+            indexed_version, mapping, built_at = indexed
+            if indexed_version == version and now - built_at < cls.INDEX_TTL:
+                return mapping
+        mapping = cls(tracker)
+        cls._index[tracker.id] = (version, mapping, now)
+        return mapping
+
+    @staticmethod
+    def get_version(tracker_id):
+        key = SELECTOR_VERSION_KEY % tracker_id
+        version = memcache.get(key)
+        if version is None:
+            # versions are timestamps, so a version evicted from memcache
+            # doesn't come back with a value some process already indexed
+            memcache.add(key, _new_version(), 0)
+            version = memcache.get(key)
+        return version
+
     def clone(self, mapping):
+        self.projects = mapping.projects
+        self.by_ticket_id = mapping.by_ticket_id
         self.default = mapping.default
         self.by_project = mapping.by_project
         self.by_component = mapping.by_component
@@ -308,9 +354,34 @@ class SelectorMapping(object):
 
         WARN(u'map_to_project: Mapping to project/component/tracker %s/%s/%s failed' % (project, component, self.tracker.name))
 
+    def match_many(self, bugs):
+        """ Returns list of project ids for given bugs """
+        match = self.match
+        return [
+            match(bug.id, bug.project_name, bug.component_name, bug.version)
+            for bug in bugs
+        ]
+
+    @classmethod
+    def invalidate_for(cls, tracker_id):
+        """
+        Drops mapping of tracker now and once again after the current
+        transaction commits, so mappings other processes build
+        from rows read before the commit are not kept
+        """
+        cls._bump_version(tracker_id)
+
+        def after_commit(success):
+            if success:
+                cls._bump_version(tracker_id)
+        transaction.get().addAfterCommitHook(after_commit)
+
     @staticmethod
-    def invalidate_for(tracker_id):
+    def _bump_version(tracker_id):
         memcache.delete(SELECTOR_CACHE_KEY % tracker_id)
+        version_key = SELECTOR_VERSION_KEY % tracker_id
+        version = memcache.get(version_key) or 0
+        memcache.set(version_key, max(_new_version(), version + 1), 0)
         DEBUG(u'Invalidated selector mapping cache for tracker %s' % (tracker_id, ))
 
     @classmethod
@@ -1,9 +1,12 @@
 import datetime
+from itertools import chain, product
 
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, event, func, cast
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, attributes
 from sqlalchemy.types import DateTime, Date, String, Integer, Float, Boolean
 
-from intranet3.models import Base
+from intranet3.models import Base, DBSession
 
 
 class TimeEntry(Base):
@@ -29,6 +32,45 @@ class TimeEntry(Base):
     deleted = Column(Boolean, nullable=False, default=False, index=True)
     frozen = Column(Boolean, nullable=False, default=False, index=True)
     
+    @classmethod
+    def get_ticket_times(cls, tickets, start=None, end=None):
+        """
+        Sums time of (ticket id, project id) pairs,
+        returns (ticket id as string, project id) -> (all time, time between
+        start and end dates inclusive, 0.0 without dates).
+        Pairs are passed as two arrays joined with time rollup,
+        so the statement is the same for any number of tickets.
+        """
+        tickets = set((str(ticket_id), project_id) for ticket_id, project_id in tickets)
+        if not tickets:
+            return {}
+        ticket_ids, project_ids = zip(*tickets)
+        ticket_id_type = cls.__table__.c.ticket_id.type.compile(
+            dialect=postgresql.dialect()
+        )
+        entries = DBSession.query('ticket_id', 'project_id', 'time', 'window_time').from_statement("""
+            SELECT
+                t.ticket_id as "ticket_id", t.project_id as "project_id",
+                SUM(t.time) as "time",
+                SUM(CASE WHEN t.date >= :start AND t.date <= :end THEN t.time ELSE 0 END) as "window_time"
+            FROM time_rollup t
+            JOIN (
+                SELECT
+                    unnest(CAST(:ticket_ids AS %s[])) as ticket_id,
+                    unnest(CAST(:project_ids AS INTEGER[])) as project_id
+            ) b ON t.ticket_id = b.ticket_id AND t.project_id = b.project_id
+            GROUP BY t.ticket_id, t.project_id
+        """ % ticket_id_type).params(
+            ticket_ids=list(ticket_ids),
+            project_ids=list(project_ids),
+            start=start,
+            end=end,
+        )
+        return dict(
+            ((str(ticket_id), project_id), (time, window_time or 0.0))
+            for ticket_id, project_id, time, window_time in entries
+        )
+
     def to_dict(self):
         entry = {
             'id': self.id,
@@ -48,3 +90,180 @@ class TimeEntry(Base):
                 }
             })
         return entry
+
+
+class TimeRollup(Base):
+    """
+    Non-deleted hours of time entries summed by
+    (project, ticket, user, date), reports read it instead of time entries.
+    Rows of every (user, date) with changed time entries are recomputed
+    when a session flushes, see `refresh`.
+    """
+    __tablename__ = 'time_rollup'
+
+    id = Column(Integer, primary_key=True)
+
+    project_id = Column(Integer, ForeignKey('project.id'), nullable=False, index=True)
+    ticket_id = Column(Integer, nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    date = Column(Date, nullable=False, index=True)
+
+    time = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_time_rollup_user_id_date', 'user_id', 'date'),
+        # one row per key, entries without ticket included
+        Index(
+            'ix_time_rollup_key',
+            'project_id', func.coalesce(cast(ticket_id, String), ''), 'user_id', 'date',
+            unique=True,
+        ),
+    )
+
+    # first key of advisory locks taken for users whose rows are recomputed
+    LOCK_ID = 2201
+    # time entry attributes stored in rollup
+    ATTRIBUTES = ('project_id', 'ticket_id', 'user_id', 'date', 'time', 'deleted')
+
+    @classmethod
+    def changed_keys(cls, session):
+        """
+        Returns (user id, date) pairs of time entries added, changed
+        or deleted in session, old and new values of changed entries
+        """
+        keys = {}
+        dirty = [
+            obj for obj in session.dirty
+            if isinstance(obj, TimeEntry) and any(
+                attributes.get_history(obj, name).has_changes()
+                for name in cls.ATTRIBUTES
+            )
+        ]
+        for obj in chain(session.new, dirty, session.deleted):
+            if not isinstance(obj, TimeEntry):
+                continue
+            user_ids = attributes.get_history(obj, 'user_id').sum()
+            dates = [
+                date.date() if isinstance(date, datetime.datetime) else date
+                for date in attributes.get_history(obj, 'date').sum()
+            ]
+            for key in product(user_ids, dates):
+                if None not in key:
+                    keys[key] = None
+        return sorted(keys)
+
+    @classmethod
+    def refresh(cls, session, keys):
+        """
+        Recomputes rows of (user id, date) pairs from time entries.
+        Users are locked until the transaction ends,
+        so concurrent changes of the same user never overwrite each other.
+        """
+        if not keys:
+            return
+        user_ids, dates = zip(*keys)
+        params = dict(
+            lock_id=cls.LOCK_ID,
+            user_ids=list(user_ids),
+            dates=list(dates),
+        )
+        keys_sql = """
+            SELECT
+                unnest(CAST(:user_ids AS INTEGER[])) as user_id,
+                unnest(CAST(:dates AS DATE[])) as date
+        """
+        session.execute("""
+            SELECT pg_advisory_xact_lock(:lock_id, u.user_id)
+            FROM (
+                SELECT DISTINCT unnest(CAST(:user_ids AS INTEGER[])) as user_id
+                ORDER BY user_id
+            ) u
+        """, params).fetchall()
+        session.execute("""
+            DELETE FROM time_rollup r
+            USING (%s) k
+            WHERE r.user_id = k.user_id AND r.date = k.date
+        """ % keys_sql, params)
+        session.execute("""
+            INSERT INTO time_rollup (project_id, ticket_id, user_id, date, time)
+            SELECT t.project_id, t.ticket_id, t.user_id, t.date, SUM(t.time)
+            FROM time_entry t
+            JOIN (%s) k ON t.user_id = k.user_id AND t.date = k.date
+            WHERE t.deleted = FALSE
+            GROUP BY t.project_id, t.ticket_id, t.user_id, t.date
+        """ % keys_sql, params)
+
+    @classmethod
+    def _period(cls, alias, start, end):
+        conditions = []
+        if start:
+            conditions.append('%s.date >= :start' % alias)
+        if end:
+            conditions.append('%s.date <= :end' % alias)
+        return ' AND '.join(conditions) or 'TRUE'
+
+    @classmethod
+    def rebuild(cls, start=None, end=None):
+        """
+        Recomputes all rows between start and end dates inclusive.
+        The table is locked until the transaction ends,
+        so flushes of time entries wait instead of writing stale rows.
+        """
+        params = dict(start=start, end=end)
+        DBSession.execute('LOCK TABLE time_rollup IN EXCLUSIVE MODE')
+        DBSession.execute(
+            'DELETE FROM time_rollup r WHERE %s' % cls._period('r', start, end),
+            params,
+        )
+        DBSession.execute("""
+            INSERT INTO time_rollup (project_id, ticket_id, user_id, date, time)
+            SELECT t.project_id, t.ticket_id, t.user_id, t.date, SUM(t.time)
+            FROM time_entry t
+            WHERE t.deleted = FALSE AND %s
+            GROUP BY t.project_id, t.ticket_id, t.user_id, t.date
+        """ % cls._period('t', start, end), params)
+
+    @classmethod
+    def verify(cls, start=None, end=None):
+        """
+        Compares rows between start and end dates with time entries,
+        returns [(project id, ticket id, user id, date, rollup time, entries time)]
+        of keys that differ, missing time is None
+        """
+        return DBSession.query(
+            'project_id', 'ticket_id', 'user_id', 'date', 'rollup_time', 'entries_time',
+        ).from_statement("""
+            SELECT
+                COALESCE(r.project_id, e.project_id) as "project_id",
+                COALESCE(r.ticket_id, e.ticket_id) as "ticket_id",
+                COALESCE(r.user_id, e.user_id) as "user_id",
+                COALESCE(r.date, e.date) as "date",
+                r.time as "rollup_time",
+                e.time as "entries_time"
+            FROM (
+                SELECT r.project_id, r.ticket_id, r.user_id, r.date, SUM(r.time) as time
+                FROM time_rollup r
+                WHERE %s
+                GROUP BY r.project_id, r.ticket_id, r.user_id, r.date
+            ) r
+            FULL OUTER JOIN (
+                SELECT t.project_id, t.ticket_id, t.user_id, t.date, SUM(t.time) as time
+                FROM time_entry t
+                WHERE t.deleted = FALSE AND %s
+                GROUP BY t.project_id, t.ticket_id, t.user_id, t.date
+            ) e ON r.project_id = e.project_id
+               AND r.ticket_id IS NOT DISTINCT FROM e.ticket_id
+               AND r.user_id = e.user_id
+               AND r.date = e.date
+            WHERE r.time IS NULL OR e.time IS NULL OR abs(r.time - e.time) > 0.0001
+            ORDER BY 4, 3, 1, 2
+        """ % (cls._period('r', start, end), cls._period('t', start, end))).params(
+            start=start,
+            end=end,
+        ).all()
+
+
+# every session, not only DBSession (tests and scripts use their own)
+@event.listens_for(Session, 'after_flush')
+def _refresh_time_rollup(session, flush_context):
+    TimeRollup.refresh(session, TimeRollup.changed_keys(session))
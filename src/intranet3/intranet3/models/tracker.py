@@ -1,10 +1,21 @@
-from sqlalchemy import orm, Column, ForeignKey
+import time
+import weakref
+from itertools import chain
+
+from sqlalchemy import orm, Column, ForeignKey, event
+from sqlalchemy.orm import Session
 from sqlalchemy.types import Enum, String, Integer
 from pyramid.decorator import reify
 
+from intranet3 import memcache
 from intranet3.utils.encryption import encrypt, decrypt
 from intranet3.models import Base, User, DBSession
 from intranet3.helpers import serialize_url
+from intranet3.log import DEBUG_LOG
+
+DEBUG = DEBUG_LOG(__name__)
+
+CREDENTIALS_VERSION_KEY = 'TRACKER_CREDENTIALS_VERSION'
 
 bugzilla_ticket_url = lambda tracker_url, ticket_id: '%s/show_bug.cgi?id=%s' % (tracker_url, ticket_id)
 trac_ticket_url = lambda tracker_url, ticket_id: '%s/ticket/%s' % (tracker_url, ticket_id)
@@ -72,6 +83,7 @@ class Tracker(Base):
         'trac': trac_ticket_url,
         'cookie_trac': trac_ticket_url,
         'bugzilla': bugzilla_ticket_url,
+        'bugzilla_rpc': bugzilla_ticket_url,
         'igozilla': bugzilla_ticket_url,
         'rockzilla': bugzilla_ticket_url,
         'bitbucket': bitbucket_ticket_url,
@@ -85,6 +97,7 @@ class Tracker(Base):
         'trac': trac_new_ticket_url,
         'cookie_trac': trac_new_ticket_url,
         'bugzilla': bugzilla_new_ticket_url,
+        'bugzilla_rpc': bugzilla_new_ticket_url,
         'igozilla': bugzilla_new_ticket_url,
         'rockzilla': bugzilla_new_ticket_url,
         'bitbucket': bitbucket_new_ticket_url,
@@ -97,7 +110,7 @@ class Tracker(Base):
 
     id = Column(Integer, primary_key=True, nullable=False, index=True)
 
-    type = Column(Enum("bugzilla", "trac", "cookie_trac", "igozilla", "bitbucket", "rockzilla", "pivotaltracker", "harvest", 'unfuddle', 'github', name='tracker_type_enum'), nullable=False)
+    type = Column(Enum("bugzilla", "trac", "cookie_trac", "igozilla", "bitbucket", "rockzilla", "pivotaltracker", "harvest", 'unfuddle', 'github', 'jira', 'bugzilla_rpc', name='tracker_type_enum'), nullable=False)
     name = Column(String, nullable=False, unique=True)
     url = Column(String, nullable=False, unique=True)
     mailer = Column(String, nullable=True, unique=True)
@@ -134,10 +147,17 @@ class TrackerCredentials(Base):
     login = Column(String, nullable=False)
     password = Column(String, nullable=False)
 
+    # process-local cache, tracker_id -> {user_id: (login, password)},
+    # dropped when version stored in memcache changes
+    _cache = {}
+    _cache_version = None
+    # encrypted -> decrypted password, decrypt is a pure python XOR
+    _decrypted = {}
+
     def __getattribute__(self, name):
         value = super(TrackerCredentials, self).__getattribute__(name)
         if name == 'password' and value:
-            value = decrypt(value)
+            value = TrackerCredentials._decrypt(value)
         return value
 
     def __setattr__(self, name, value):
@@ -146,16 +166,110 @@ class TrackerCredentials(Base):
         super(TrackerCredentials, self).__setattr__(name, value)
 
     @classmethod
-    def get_logins_mapping(cls, tracker):
+    def _decrypt(cls, value):
+        decrypted = cls._decrypted.get(value)
+        if decrypted is None:
+            decrypted = cls._decrypted[value] = decrypt(value)
+        return decrypted
+
+    @classmethod
+    def _check_cache_version(cls):
+        version = memcache.get(CREDENTIALS_VERSION_KEY)
+        if version is None:
+            memcache.add(CREDENTIALS_VERSION_KEY, int(time.time() * 1000), 0)
+            version = memcache.get(CREDENTIALS_VERSION_KEY)
+        if version != cls._cache_version:
+            cls._cache = {}
+            cls._decrypted = {}
+            cls._cache_version = version
+
+    @classmethod
+    def invalidate_cache(cls):
+        version = memcache.get(CREDENTIALS_VERSION_KEY) or 0
+        memcache.set(
+            CREDENTIALS_VERSION_KEY,
+            max(int(time.time() * 1000), version + 1),
+            0,
+        )
+        DEBUG(u'Invalidated tracker credentials cache')
+
+    @classmethod
+    def get_all_credentials(cls, tracker_ids):
         """
-        Returns dict user login -> user object for given tracker
+        Returns dict tracker_id -> {user_id: (login, decrypted password)},
+        credentials are cached in process memory
         """
-        creds_query = DBSession.query(cls, User)\
-                               .filter(cls.tracker_id==tracker.id)\
-                               .filter(cls.user_id==User.id)
+        cls._check_cache_version()
+        cache = cls._cache
+        missing = [
+            tracker_id for tracker_id in set(tracker_ids)
+            if tracker_id not in cache
+        ]
+        if missing:
+            loaded = dict((tracker_id, {}) for tracker_id in missing)
+            creds_query = DBSession.query(
+                cls.tracker_id, cls.user_id, cls.login, cls.password,
+            ).filter(cls.tracker_id.in_(missing))
+            for tracker_id, user_id, login, password in creds_query:
+                loaded[tracker_id][user_id] = (
+                    login, cls._decrypt(password) if password else password,
+                )
+            cache.update(loaded)
+        return dict((tracker_id, cache[tracker_id]) for tracker_id in tracker_ids)
 
+    @classmethod
+    def get_logins_mappings(cls, trackers):
+        """
+        Returns dict tracker_id -> (dict user login -> user object),
+        users of all given trackers are loaded with a single query
+        """
+        credentials = cls.get_all_credentials([tracker.id for tracker in trackers])
+        user_ids = set(chain(*credentials.itervalues()))
+        users = dict(
+            (user.id, user)
+            for user in User.query.filter(User.id.in_(user_ids))
+        ) if user_ids else {}
         return dict(
-            (credentials.login.lower(), user) for credentials, user in creds_query
+            (tracker_id, dict(
+                (login.lower(), users[user_id])
+                for user_id, (login, password) in creds.iteritems()
+                if user_id in users
+            ))
+            for tracker_id, creds in credentials.iteritems()
         )
 
+    @classmethod
+    def get_logins_mapping(cls, tracker):
+        """
+        Returns dict user login -> user object for given tracker
+        """
+        return cls.get_logins_mappings([tracker])[tracker.id]
+
+
+# sessions that changed credentials, cache is invalidated when they flush
+# and once again after commit, so no process keeps data read in between
+_credentials_changed = weakref.WeakSet()
+
+
+# every session, not only DBSession (tests and scripts use their own)
+@event.listens_for(Session, 'before_flush')
+def _track_credentials_changes(session, *args):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, TrackerCredentials):
+            _credentials_changed.add(session)
+            TrackerCredentials.invalidate_cache()
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_credentials_cache(session):
+    if session in _credentials_changed:
+        _credentials_changed.discard(session)
+        TrackerCredentials.invalidate_cache()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_credentials_changes(session):
+    _credentials_changed.discard(session)
+
 
@@ -198,3 +198,66 @@ def create_config(env):
     DBSession.add(config)
     transaction.commit()
 
+
+
+def benchmark_fetchers(env):
+    """
+    Benchmarks fetchers against local tracker stand-ins,
+    optional arguments: scale, latency (seconds), concurrency.
+    Nothing is stored, fixtures are rolled back.
+    """
+    from gevent import monkey
+    monkey.patch_all()  # as the app server does, for concurrent requests
+    from intranet3.testing.benchmark import run, format_report
+
+    args = sys.argv[3:]
+    scale = int(args[0]) if len(args) > 0 else 500
+    latency = float(args[1]) if len(args) > 1 else 0.05
+    concurrency = int(args[2]) if len(args) > 2 else 1
+    try:
+        report = run(
+            env['request'],
+            scale=scale,
+            latency=latency,
+            concurrency=concurrency,
+        )
+    finally:
+        transaction.abort()
+    print format_report(report)
+
+
+def _time_rollup_period():
+    import datetime
+    dates = [
+        datetime.datetime.strptime(arg, '%Y-%m-%d').date()
+        for arg in sys.argv[3:5]
+    ]
+    return tuple(dates + [None] * (2 - len(dates)))
+
+
+def backfill_time_rollup(env):
+    """
+    Recomputes time rollup from time entries,
+    optional arguments: start and end date (YYYY-MM-DD).
+    """
+    from intranet3.models import TimeRollup
+    start, end = _time_rollup_period()
+    TimeRollup.rebuild(start, end)
+    transaction.commit()
+    print 'Done'
+
+
+def verify_time_rollup(env):
+    """
+    Lists time rollup rows that differ from time entries,
+    optional arguments: start and end date (YYYY-MM-DD).
+    """
+    from intranet3.models import TimeRollup
+    start, end = _time_rollup_period()
+    differences = TimeRollup.verify(start, end)
+    transaction.abort()
+    for project_id, ticket_id, user_id, date, rollup_time, entries_time in differences:
+        print u'%s user %s project %s ticket %s: rollup %s, entries %s' % (
+            date, user_id, project_id, ticket_id, rollup_time, entries_time,
+        )
+    print u'%s differences' % len(differences)
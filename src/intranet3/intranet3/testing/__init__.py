@@ -30,6 +30,8 @@ else:
     settings = None
 
 from intranet3 import models as intranet_models
+from intranet3.asyncfetchers import get_fetcher
+from intranet3.asyncfetchers.metadata import METADATA
 from intranet3.testing import mocks
 from intranet3.testing.factory import FactoryMixin
 
@@ -67,6 +69,7 @@ class IntranetBaseTest(unittest.TestCase):
         self._transaction = connection.begin()
         intranet_models.DBSession_ = Session(connection)
         intranet3.memcache.clear()
+        METADATA.clear()
 
     def tearDown(self):
         intranet_models.DBSession_.close()
@@ -96,6 +99,45 @@ class IntranetTest(IntranetBaseTest):
         testing.tearDown()
 
 
+class StandInTestMixin(object):
+    """
+    Drives fetchers against a tracker stand-in (see testing.trackers),
+    to be mixed with FactoryMixin and IntranetTest
+    """
+    TRACKER_TYPE = 'bugzilla'
+    LOGIN = 'userx'
+
+    stand_in = None
+
+    def start_stand_in(self, stand_in):
+        """
+        Starts the stand-in and creates its tracker
+        and a user with credentials for it
+        """
+        self.stand_in = stand_in.start()
+        self.tracker = self.create_tracker(type=self.TRACKER_TYPE)
+        self.tracker.url = self.stand_in.url
+        self.user = self.create_user()
+        self.creds = self.add_creds(self.user, self.tracker, self.LOGIN)
+        return self.stand_in
+
+    def tearDown(self):
+        if self.stand_in is not None:
+            self.stand_in.stop()
+        super(StandInTestMixin, self).tearDown()
+
+    def get_fetcher(self, **kwargs):
+        mapping = intranet_models.TrackerCredentials.get_logins_mapping(
+            self.tracker,
+        )
+        return get_fetcher(
+            self.tracker, self.creds, self.user, mapping, **kwargs
+        )
+
+    def requested_paths(self):
+        return [path for path, params in self.stand_in.requests]
+
+
 class IntranetWebTest(IntranetBaseTest):
 
     def tearDown(self):
@@ -0,0 +1,256 @@
+"""
+End-to-end fetcher benchmark against local tracker stand-ins.
+
+    bin/script parts/etc/config.ini benchmark_fetchers [scale [latency [concurrency]]]
+
+Starts a stand-in of every supported tracker serving `scale` synthetic
+tickets, creates users, trackers, projects and a sprint pointing at them
+(the caller rolls the transaction back) and drives Bugs.get_user,
+Bugs.get_all and Bugs.get_sprint through real fetchers.
+Reports throughput, latency percentiles, tracker requests and peak memory.
+"""
+import datetime
+import resource
+import time
+from contextlib import contextmanager, nested
+
+import gevent
+from mock import patch
+
+from intranet3 import models as m
+from intranet3.asyncfetchers import cache
+from intranet3.asyncfetchers.health import percentile
+from intranet3.asyncfetchers.pivotaltracker import (
+    PivotalTrackerFetcher,
+    PivotalTrackerTokenFetcher,
+)
+from intranet3.lib.bugs import Bugs
+from intranet3.testing import trackers as t
+from intranet3.testing.factory import FactoryMixin
+
+SPRINT = 'sprint_x'
+LOGINS = ('userx', 'usery', 'userz')  # first one runs the queries
+
+
+class _Factory(FactoryMixin):
+    pass
+
+
+def start_stand_ins(scale, latency=0, error_rate=0.0):
+    """ Returns tracker type -> started stand-in """
+    options = dict(latency=latency, error_rate=error_rate, seed=scale)
+    milestone = {'number': 1, 'title': SPRINT}
+    stand_ins = dict(
+        bugzilla=t.BugzillaStandIn(
+            t.synthetic_bugzilla_bugs(
+                scale, LOGINS, ('PRODUCT_A', 'PRODUCT_B'), SPRINT,
+            ),
+            **options
+        ),
+        jira=t.JiraStandIn(
+            t.synthetic_jira_issues(scale, LOGINS, ('JA', 'JB'), SPRINT),
+            **options
+        ),
+        github=t.GithubStandIn(
+            t.synthetic_github_issues(scale, LOGINS, milestone),
+            milestones=[milestone],
+            **options
+        ),
+        pivotaltracker=t.PivotalStandIn(
+            projects=[{'id': 101, 'name': 'PA'}, {'id': 102, 'name': 'PB'}],
+            stories=t.synthetic_pivotal_stories(
+                scale, LOGINS, (101, 102), SPRINT,
+            ),
+            **options
+        ),
+        trac=t.TracStandIn(
+            t.synthetic_trac_tickets(scale, LOGINS, ('CLIENT_A', 'CLIENT_B')),
+            **options
+        ),
+        unfuddle=t.UnfuddleStandIn(
+            people=[
+                {'id': i, 'username': login}
+                for i, login in enumerate(LOGINS, 1)
+            ],
+            projects=[{'id': 201, 'title': 'UA'}],
+            milestones=[{'id': 301, 'project_id': 201, 'title': SPRINT}],
+            tickets=t.synthetic_unfuddle_tickets(
+                scale, range(1, len(LOGINS) + 1), (201, ), 301,
+            ),
+            **options
+        ),
+    )
+    for stand_in in stand_ins.itervalues():
+        stand_in.start()
+    return stand_ins
+
+
+# tracker type -> (login format, [(project selector, component selector)])
+PROJECTS = dict(
+    bugzilla=('{0}', [('PRODUCT_A', None), ('PRODUCT_B', None)]),
+    jira=('{0}', [('JA', None), ('JB', None)]),
+    github=('{0}', [('owner_x', 'repo_x')]),
+    pivotaltracker=('{0}@example.com;{0}', [('101', None), ('102', None)]),
+    trac=('{0}', [('CLIENT_A', None), ('CLIENT_B', None)]),
+    unfuddle=('{0}', [('UA', None)]),
+)
+
+# trackers without sprints
+NO_SCRUM = ('trac', )
+
+
+def create_fixtures(stand_ins):
+    """ Returns (user running queries, sprint with projects of all trackers) """
+    factory = _Factory()
+    users = [
+        factory.create_user(name='benchmark_%s' % login) for login in LOGINS
+    ]
+    client = factory.create_client(name='benchmark_client')
+    sprint_project_ids = []
+    for tracker_type, stand_in in sorted(stand_ins.iteritems()):
+        tracker = factory.create_tracker(
+            name='benchmark_%s' % tracker_type, type=tracker_type,
+        )
+        tracker.url = stand_in.url
+        login_format, selectors = PROJECTS[tracker_type]
+        for user, login in zip(users, LOGINS):
+            factory.add_creds(user, tracker, login_format.format(login))
+        for project_selector, component_selector in selectors:
+            project = factory.create_project(
+                name='benchmark %s %s' % (tracker_type, project_selector),
+                user=users[0],
+                client=client,
+                tracker=tracker,
+                project_selector=project_selector,
+                component_selector=component_selector,
+            )
+            if tracker_type not in NO_SCRUM:
+                sprint_project_ids.append(project.id)
+
+    today = datetime.date.today()
+    sprint = m.Sprint(
+        name=SPRINT,
+        client_id=client.id,
+        project_id=sprint_project_ids[0],
+        bugs_project_ids=sprint_project_ids,
+        start=today - datetime.timedelta(days=7),
+        end=today + datetime.timedelta(days=7),
+    )
+    m.DBSession.add(sprint)
+    m.DBSession.flush()
+    return users[0], sprint
+
+
+@contextmanager
+def local_trackers(stand_ins, cold):
+    """
+    Points fetchers with hardcoded urls at stand-ins,
+    with cold=True every fetch misses the cache
+    """
+    patches = [
+        patch.object(
+            PivotalTrackerTokenFetcher, 'TOKEN_URL',
+            stand_ins['pivotaltracker'].token_url,
+        ),
+        patch.object(PivotalTrackerFetcher, 'FORCE_HTTPS', False),
+    ]
+    if cold:
+        patches.append(patch.object(cache, 'get', lambda key: None))
+    with nested(*patches):
+        yield
+
+
+def measure(operation, repeat, concurrency):
+    """ Runs operation repeat times in each of concurrency greenlets """
+    latencies = []
+    counts = []
+
+    def worker():
+        for i in xrange(repeat):
+            started = time.time()
+            counts.append(len(operation()))
+            latencies.append(time.time() - started)
+
+    started = time.time()
+    gevent.joinall(
+        [gevent.spawn(worker) for i in xrange(concurrency)],
+        raise_error=True,
+    )
+    elapsed = time.time() - started
+    return dict(
+        calls=len(latencies),
+        bugs=max(counts),
+        throughput=len(latencies) / elapsed,
+        p50=percentile(latencies, 50),
+        p90=percentile(latencies, 90),
+        p99=percentile(latencies, 99),
+        max=max(latencies),
+    )
+
+
+def peak_memory():
+    """ Peak resident memory of the process in kilobytes """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(request, scale=500, latency=0.05, error_rate=0.0, repeat=5,
+        concurrency=1, cold=True):
+    stand_ins = start_stand_ins(scale, latency, error_rate)
+    memory_before = peak_memory()
+    try:
+        user, sprint = create_fixtures(stand_ins)
+        operations = (
+            ('get_user', lambda: Bugs(request, user, mirror=False).get_user()),
+            ('get_all', lambda: Bugs(request, user, mirror=False).get_all()),
+            ('get_sprint', lambda: Bugs(request, user, mirror=False).get_sprint(sprint)),
+        )
+        results = []
+        with local_trackers(stand_ins, cold):
+            for name, operation in operations:
+                for stand_in in stand_ins.itervalues():
+                    stand_in.requests = []
+                result = measure(operation, repeat, concurrency)
+                result['name'] = name
+                result['requests'] = dict(
+                    (tracker_type, len(stand_in.requests))
+                    for tracker_type, stand_in in stand_ins.iteritems()
+                )
+                results.append(result)
+    finally:
+        for stand_in in stand_ins.itervalues():
+            stand_in.stop()
+
+    return dict(
+        scale=scale,
+        latency=latency,
+        error_rate=error_rate,
+        cold=cold,
+        operations=results,
+        peak_memory=peak_memory(),
+        peak_memory_growth=peak_memory() - memory_before,
+    )
+
+
+def format_report(report):
+    lines = [
+        u'scale %(scale)s, latency %(latency)ss, error rate %(error_rate)s, '
+        u'cold cache %(cold)s' % report,
+        u'%-12s %6s %6s %8s %8s %8s %8s %8s  %s' % (
+            'operation', 'calls', 'bugs', 'ops/s', 'p50', 'p90', 'p99', 'max',
+            'requests',
+        ),
+    ]
+    for result in report['operations']:
+        requests = u', '.join(
+            u'%s=%s' % item for item in sorted(result['requests'].iteritems())
+        )
+        lines.append(
+            u'%-12s %6s %6s %8.2f %8.3f %8.3f %8.3f %8.3f  %s' % (
+                result['name'], result['calls'], result['bugs'],
+                result['throughput'], result['p50'], result['p90'],
+                result['p99'], result['max'], requests,
+            )
+        )
+    lines.append(u'peak memory %(peak_memory)s kB (+%(peak_memory_growth)s kB)'
+                 % report)
+    return u'\n'.join(lines)
@@ -61,10 +61,10 @@ class FactoryMixin(object):
         self.cid += 1
         return client
 
-    def create_tracker(self, name="", **kwargs):
+    def create_tracker(self, name="", type="bugzilla", **kwargs):
         name = name or "tracker_%s" % self.tid
         tracker = models.Tracker(
-            type="bugzilla",
+            type=type,
             name=name,
             url="http://%s.name" % name,
             mailer='tracker_mailer@example.com',
@@ -0,0 +1,732 @@
+"""
+Local HTTP stand-ins for bug trackers, used to drive fetchers in tests
+and benchmarks (see testing.benchmark).
+
+Every stand-in can add latency to its responses and fail a share of
+requests, `synthetic_*` functions generate payloads of any size.
+"""
+import csv
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib
+import urlparse
+from cStringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from xml.sax.saxutils import escape
+
+
+BUGZILLA_COLUMNS = (
+    'bug_id', 'bug_severity', 'assigned_to', 'version', 'bug_status',
+    'resolution', 'product', 'op_sys', 'short_desc', 'reporter', 'opendate',
+    'changeddate', 'component', 'deadline', 'priority', 'status_whiteboard',
+)
+
+
+def bugzilla_bug(bug_id, **kwargs):
+    """ Bugzilla bug with sane defaults """
+    bug = dict(
+        bug_id=str(bug_id),
+        bug_severity='normal',
+        assigned_to='nobody',
+        version='unspecified',
+        bug_status='NEW',
+        resolution='',
+        product='PRODUCT_X',
+        op_sys='All',
+        short_desc='Bug %s' % bug_id,
+        reporter='nobody',
+        opendate='2014-05-01 10:00:00',
+        changeddate='2014-05-01 10:00:00',
+        component='COMPONENT_X',
+        deadline='',
+        priority='P3',
+        status_whiteboard='',
+        blocked=[],
+        dependson=[],
+    )
+    bug.update(kwargs)
+    return bug
+
+
+JIRA_STORY_POINTS_FIELD = 'customfield_10002'
+
+
+def jira_issue(key, **fields):
+    """ Jira issue (as returned by search API) with sane defaults """
+    issue_fields = {
+        'summary': 'Issue %s' % key,
+        'reporter': {'name': 'nobody'},
+        'assignee': None,
+        'priority': {'name': 'Major'},
+        'status': {'name': 'Open'},
+        'resolution': None,
+        'project': {'name': 'PROJECT_X'},
+        'components': [],
+        'duedate': None,
+        'created': '2014-05-01T10:00:00.000+0200',
+        'updated': '2014-05-01T10:00:00.000+0200',
+        'labels': [],
+        'subtasks': [],
+        'issuelinks': [],
+        JIRA_STORY_POINTS_FIELD: None,
+    }
+    issue_fields.update(fields)
+    return {'id': key.split('-')[-1], 'key': key, 'fields': issue_fields}
+
+
+def github_issue(number, **kwargs):
+    """ GitHub issue with sane defaults """
+    issue = dict(
+        id=1000 + number,
+        number=number,
+        title='Issue %s' % number,
+        user={'login': 'nobody'},
+        assignee=None,
+        state='open',
+        html_url='https://github.com/owner_x/repo_x/issues/%s' % number,
+        created_at='2014-05-01T10:00:00Z',
+        updated_at='2014-05-01T10:00:00Z',
+        labels=[],
+        milestone=None,
+    )
+    issue.update(kwargs)
+    return issue
+
+
+def pivotal_story(story_id, project_id, **kwargs):
+    """ Pivotal Tracker story with sane defaults """
+    story = dict(
+        id=story_id,
+        project_id=project_id,
+        name='Story %s' % story_id,
+        requested_by={'name': 'nobody'},
+        owned_by=None,
+        current_state='started',
+        created_at='2014-05-01T10:00:00Z',
+        updated_at='2014-05-01T10:00:00Z',
+        estimate=None,
+        labels=[],
+        url='https://www.pivotaltracker.com/story/show/%s' % story_id,
+    )
+    story.update(kwargs)
+    return story
+
+
+TRAC_COLUMNS = (
+    'id', 'summary', 'status', 'type', 'priority', 'severity', 'milestone',
+    'component', 'reporter', 'owner', 'client_name', 'time', 'changetime',
+    'blockedby', 'dependencies', 'blocking',
+)
+
+
+def trac_ticket(ticket_id, **kwargs):
+    """ Trac ticket with sane defaults """
+    ticket = dict((column, '') for column in TRAC_COLUMNS)
+    ticket.update(
+        id=str(ticket_id),
+        summary='Ticket %s' % ticket_id,
+        status='new',
+        type='defect',
+        priority='major',
+        component='COMPONENT_X',
+        reporter='nobody',
+        owner='nobody',
+        client_name='CLIENT_X',
+        time='2014-05-01 10:00:00',
+        changetime='2014-05-01 10:00:00',
+    )
+    ticket.update(kwargs)
+    return ticket
+
+
+def unfuddle_ticket(number, project_id, **kwargs):
+    """ Unfuddle ticket (as in dynamic ticket report) with sane defaults """
+    ticket = dict(
+        number=number,
+        summary='Ticket %s' % number,
+        project_id=project_id,
+        reporter_id=None,
+        assignee_id=None,
+        component_id=None,
+        milestone_id=None,
+        priority='3',
+        status='new',
+        created_at='2014-05-01T10:00:00Z',
+        updated_at='2014-05-01T10:00:00Z',
+    )
+    ticket.update(kwargs)
+    return ticket
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _params(self):
+        query = urlparse.urlparse(self.path).query
+        if self.command == 'POST':
+            length = int(self.headers.getheader('content-length') or 0)
+            query = self.rfile.read(length)
+            content_type = self.headers.getheader('content-type') or ''
+            if content_type.startswith('application/json'):
+                return json.loads(query)
+        return urlparse.parse_qs(query, keep_blank_values=True)
+
+    def _reply(self, body, content_type='text/plain', status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self):
+        path = urlparse.urlparse(self.path).path
+        params = self._params()
+        stand_in = self.server.stand_in
+        stand_in.requests.append((path, params))
+        handler = stand_in.route(path)
+        if handler is None:
+            return self._reply('not found', status=404)
+        if stand_in.simulate():
+            return self._reply('simulated failure', status=503)
+        self._reply(*getattr(stand_in, handler)(params, self))
+
+    do_GET = do_POST = _dispatch
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TrackerStandIn(object):
+    """ Base for tracker stand-ins, serves ROUTES on a random local port """
+
+    # path -> name of method(params, request) returning (body, type)
+    # or (body, type, status, headers)
+    ROUTES = {}
+
+    def __init__(self, latency=0, error_rate=0.0, seed=None):
+        self.requests = []
+        self.latency = latency  # seconds (+-50%) added to every response
+        self.error_rate = error_rate  # share of requests answered with 503
+        self._random = random.Random(seed)
+        self._server = None
+
+    def route(self, path):
+        return self.ROUTES.get(path)
+
+    def simulate(self):
+        """ Sleeps for simulated latency, returns True if request fails """
+        if self.latency:
+            time.sleep(self.latency * self._random.uniform(0.5, 1.5))
+        return self._random.random() < self.error_rate
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stand_in = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class BugzillaStandIn(TrackerStandIn):
+    """
+    Bugzilla serving buglist.cgi CSV (with status, product and chfieldfrom
+    filters)
+    and show_bug.cgi XML for dependencies,
+    with json_rpc=True also jsonrpc.cgi Bug.search and Bug.get
+    """
+
+    ROUTES = {
+        '/buglist.cgi': 'buglist',
+        '/show_bug.cgi': 'show_bug',
+        '/jsonrpc.cgi': 'jsonrpc',
+    }
+
+    # Bug.search field -> bugzilla_bug key
+    RPC_FIELDS = {
+        'id': 'bug_id',
+        'severity': 'bug_severity',
+        'assigned_to': 'assigned_to',
+        'version': 'version',
+        'status': 'bug_status',
+        'resolution': 'resolution',
+        'product': 'product',
+        'op_sys': 'op_sys',
+        'summary': 'short_desc',
+        'creator': 'reporter',
+        'creation_time': 'opendate',
+        'last_change_time': 'changeddate',
+        'component': 'component',
+        'deadline': 'deadline',
+        'priority': 'priority',
+        'whiteboard': 'status_whiteboard',
+        'blocks': 'blocked',
+        'depends_on': 'dependson',
+    }
+
+    def __init__(self, bugs=(), json_rpc=False, **kwargs):
+        super(BugzillaStandIn, self).__init__(**kwargs)
+        self.bugs = list(bugs)
+        self.json_rpc = json_rpc
+
+    def route(self, path):
+        if path == '/jsonrpc.cgi' and not self.json_rpc:
+            return None
+        return super(BugzillaStandIn, self).route(path)
+
+    def rpc_bug(self, bug, fields=None):
+        """ bugzilla_bug as returned by Bug.search (times are UTC) """
+        result = {}
+        for field, key in self.RPC_FIELDS.iteritems():
+            if fields and field not in fields:
+                continue
+            value = bug[key]
+            if field in ('id', ):
+                value = int(value)
+            elif field in ('blocks', 'depends_on'):
+                value = [int(bug_id) for bug_id in value]
+            elif field in ('creation_time', 'last_change_time'):
+                value = value.replace(' ', 'T') + 'Z'
+            elif value == '':
+                value = None
+            result[field] = value
+        return result
+
+    def jsonrpc(self, params, request):
+        method = params['method']
+        query = params['params'][0]
+        if method == 'Bug.search':
+            result = dict(bugs=self.search(query))
+        elif method == 'Bug.get':
+            ids = set(str(bug_id) for bug_id in query['ids'])
+            result = dict(bugs=[
+                self.rpc_bug(bug, query.get('include_fields'))
+                for bug in self.bugs if bug['bug_id'] in ids
+            ])
+        else:
+            error = dict(code=-32601, message='Method not found')
+            return json.dumps(dict(error=error, id=params['id'])), \
+                'application/json'
+        return json.dumps(dict(result=result, error=None, id=params['id'])), \
+            'application/json'
+
+    def search(self, query):
+        def values(name):
+            value = query.get(name)
+            if value is None or isinstance(value, list):
+                return value
+            return [value]
+
+        filters = [
+            (self.RPC_FIELDS[field], values(field))
+            for field in ('id', 'status', 'product', 'component',
+                          'assigned_to', 'creator')
+        ]
+        since = query.get('last_change_time', '').replace('T', ' ')[:19]
+        whiteboard = query.get('whiteboard')
+        bugs = []
+        for bug in self.bugs:
+            if any(
+                allowed is not None and
+                bug[key] not in [str(value) for value in allowed]
+                for key, allowed in filters
+            ):
+                continue
+            if since and bug['changeddate'] < since:
+                continue
+            if whiteboard and whiteboard not in bug['status_whiteboard']:
+                continue
+            bugs.append(bug)
+        offset = query.get('offset', 0)
+        limit = query.get('limit') or len(bugs)
+        return [
+            self.rpc_bug(bug, query.get('include_fields'))
+            for bug in bugs[offset:offset + limit]
+        ]
+
+    def buglist(self, params, request):
+        statuses = params.get('bug_status')
+        products = params.get('product')
+        since = params.get('chfieldfrom', [''])[0]
+        output = StringIO()
+        writer = csv.DictWriter(
+            output, BUGZILLA_COLUMNS, extrasaction='ignore',
+        )
+        writer.writerow(dict(zip(BUGZILLA_COLUMNS, BUGZILLA_COLUMNS)))
+        for bug in self.bugs:
+            if statuses and bug['bug_status'] not in statuses:
+                continue
+            if products and bug['product'] not in products:
+                continue
+            if since and bug['changeddate'][:len(since)] < since:
+                continue
+            writer.writerow(bug)
+        return output.getvalue(), 'text/csv'
+
+    def show_bug(self, params, request):
+        ids = set(params.get('id', []))
+        result = ['<?xml version="1.0" standalone="yes"?>', '<bugzilla>']
+        for bug in self.bugs:
+            if bug['bug_id'] not in ids:
+                continue
+            result.append('<bug>')
+            result.append('<bug_id>%s</bug_id>' % bug['bug_id'])
+            result.append('<bug_status>%s</bug_status>' % bug['bug_status'])
+            result.append(
+                '<short_desc>%s</short_desc>' % escape(bug['short_desc'])
+            )
+            for blocked in bug['blocked']:
+                result.append('<blocked>%s</blocked>' % blocked)
+            for dependson in bug['dependson']:
+                result.append('<dependson>%s</dependson>' % dependson)
+            result.append('</bug>')
+        result.append('</bugzilla>')
+        return '\n'.join(result), 'text/xml'
+
+
+class JiraStandIn(TrackerStandIn):
+    """
+    Jira serving paginated /rest/api/2/search (jql is not interpreted,
+    all issues match) and /rest/api/2/field
+    """
+
+    ROUTES = {
+        '/rest/api/2/search': 'search',
+        '/rest/api/2/field': 'field',
+    }
+
+    def __init__(self, issues=(), max_results=50, **kwargs):
+        super(JiraStandIn, self).__init__(**kwargs)
+        self.issues = list(issues)
+        self.max_results = max_results  # server side page size cap
+
+    def search(self, params, request):
+        start_at = int(params.get('startAt', ['0'])[0])
+        max_results = min(
+            int(params.get('maxResults', [self.max_results])[0]),
+            self.max_results,
+        )
+        result = dict(
+            startAt=start_at,
+            maxResults=max_results,
+            total=len(self.issues),
+            issues=self.issues[start_at:start_at + max_results],
+        )
+        return json.dumps(result), 'application/json'
+
+    def field(self, params, request):
+        fields = [
+            {'id': 'summary', 'name': 'Summary'},
+            {'id': JIRA_STORY_POINTS_FIELD, 'name': 'Story Points'},
+        ]
+        return json.dumps(fields), 'application/json'
+
+
+class GithubStandIn(TrackerStandIn):
+    """
+    GitHub API serving issues (filtered by state and milestone)
+    and milestones, paginated with Link header and answering 304
+    to requests with matching If-None-Match
+    """
+
+    ISSUES = re.compile(r'^(/repos/[^/]+/[^/]+)?/issues$')
+    MILESTONES = re.compile(r'^/repos/[^/]+/[^/]+/milestones$')
+
+    def __init__(self, issues=(), milestones=(), max_per_page=100,
+                 **kwargs):
+        super(GithubStandIn, self).__init__(**kwargs)
+        self.issues = list(issues)
+        self.milestones = list(milestones)
+        self.max_per_page = max_per_page
+        self.not_modified = 0  # number of 304 responses
+
+    @property
+    def url(self):
+        # github tracker urls end with a slash
+        return super(GithubStandIn, self).url + '/'
+
+    def route(self, path):
+        if self.ISSUES.match(path):
+            return 'list_issues'
+        if self.MILESTONES.match(path):
+            return 'list_milestones'
+
+    def list_issues(self, params, request):
+        state = params.get('state', ['open'])[0]
+        milestone = params.get('milestone', [None])[0]
+        issues = [
+            issue for issue in self.issues
+            if state in ('all', issue['state'])
+            and (milestone is None or (
+                issue['milestone']
+                and str(issue['milestone']['number']) == milestone
+            ))
+        ]
+        return self._page(issues, params, request)
+
+    def list_milestones(self, params, request):
+        return self._page(self.milestones, params, request)
+
+    def _page(self, items, params, request):
+        per_page = min(int(params.get('per_page', ['30'])[0]), self.max_per_page)
+        page = int(params.get('page', ['1'])[0])
+        body = json.dumps(items[(page - 1) * per_page:page * per_page])
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = {'ETag': etag}
+
+        last_page = max((len(items) + per_page - 1) // per_page, 1)
+        path = urlparse.urlparse(request.path).path
+        links = []
+        for rel, number in (('next', page + 1), ('last', last_page)):
+            if page < last_page:
+                query = dict((k, v[0]) for k, v in params.iteritems())
+                query['page'] = number
+                links.append('<%s%s?%s>; rel="%s"' % (
+                    self.url.rstrip('/'), path, urllib.urlencode(query), rel,
+                ))
+        if links:
+            headers['Link'] = ', '.join(links)
+
+        if request.headers.getheader('if-none-match') == etag:
+            self.not_modified += 1
+            return '', 'application/json', 304, headers
+        return body, 'application/json', 200, headers
+
+
+class PivotalStandIn(TrackerStandIn):
+    """
+    Pivotal Tracker serving v3 token, v5 projects and their stories
+    (filter is not interpreted, all stories of a project match)
+    """
+
+    TOKEN_PATH = '/services/v3/tokens/active'
+    STORIES = re.compile(r'^/services/v5/projects/(\d+)/stories$')
+
+    def __init__(self, projects=(), stories=(), **kwargs):
+        super(PivotalStandIn, self).__init__(**kwargs)
+        self.projects = list(projects)  # of {'id': .., 'name': ..}
+        self.stories = list(stories)
+
+    @property
+    def token_url(self):
+        return self.url + self.TOKEN_PATH
+
+    def route(self, path):
+        if path == self.TOKEN_PATH:
+            return 'token'
+        if path == '/services/v5/projects':
+            return 'list_projects'
+        if self.STORIES.match(path):
+            return 'list_stories'
+
+    def token(self, params, request):
+        return '<token><guid>token_x</guid></token>', 'application/xml'
+
+    def list_projects(self, params, request):
+        return json.dumps(self.projects), 'application/json'
+
+    def list_stories(self, params, request):
+        path = urlparse.urlparse(request.path).path
+        project_id = int(self.STORIES.match(path).group(1))
+        stories = [s for s in self.stories if s['project_id'] == project_id]
+        return json.dumps(stories), 'application/json'
+
+
+class TracStandIn(TrackerStandIn):
+    """ Trac serving /query CSV (with status and owner filters) """
+
+    ROUTES = {
+        '/query': 'query',
+    }
+
+    def __init__(self, tickets=(), **kwargs):
+        super(TracStandIn, self).__init__(**kwargs)
+        self.tickets = list(tickets)
+
+    def query(self, params, request):
+        statuses = params.get('status')
+        owners = params.get('owner')
+        columns = params.get('col') or TRAC_COLUMNS
+        output = StringIO()
+        output.write('\xef\xbb\xbf')  # trac writes BOM
+        writer = csv.DictWriter(output, columns, extrasaction='ignore')
+        writer.writerow(dict(zip(columns, columns)))
+        for ticket in self.tickets:
+            if statuses and ticket['status'] not in statuses:
+                continue
+            if owners and ticket['owner'] not in owners:
+                continue
+            writer.writerow(ticket)
+        return output.getvalue(), 'text/csv'
+
+
+class UnfuddleStandIn(TrackerStandIn):
+    """
+    Unfuddle serving initializer.json and dynamic ticket reports
+    (conditions are not interpreted, except for project in path)
+    """
+
+    REPORT = re.compile(
+        r'^/api/v1/(projects/(\d+)/)?ticket_reports/dynamic.json$'
+    )
+
+    def __init__(self, people=(), projects=(), milestones=(), tickets=(),
+                 **kwargs):
+        super(UnfuddleStandIn, self).__init__(**kwargs)
+        self.people = list(people)  # of {'id': .., 'username': ..}
+        self.projects = list(projects)  # of {'id': .., 'title': ..}
+        self.milestones = list(milestones)
+        self.tickets = list(tickets)
+
+    def route(self, path):
+        if path == '/api/v1/initializer.json':
+            return 'initializer'
+        if self.REPORT.match(path):
+            return 'report'
+
+    def initializer(self, params, request):
+        projects = []
+        for project in self.projects:
+            project = dict(project)
+            for number in range(1, 4):
+                project.setdefault('ticket_field%s_active' % number, False)
+                project.setdefault('ticket_field%s_title' % number, '')
+            projects.append(project)
+        data = dict(
+            people=self.people,
+            projects=projects,
+            components=[],
+            milestones=self.milestones,
+            custom_field_values=[],
+        )
+        return json.dumps(data), 'application/json'
+
+    def report(self, params, request):
+        path = urlparse.urlparse(request.path).path
+        project_id = self.REPORT.match(path).group(2)
+        tickets = [
+            ticket for ticket in self.tickets
+            if project_id is None or str(ticket['project_id']) == project_id
+        ]
+        data = dict(groups=[dict(tickets=tickets)])
+        return json.dumps(data), 'application/json'
+
+
+# synthetic payloads, tickets are spread over given logins and projects
+# round robin, every third one is in the sprint
+
+def _pick(values, i):
+    return values[i % len(values)]
+
+
+def synthetic_bugzilla_bugs(count, logins, products, sprint):
+    statuses = ('NEW', 'ASSIGNED', 'REOPENED', 'RESOLVED')
+    return [
+        bugzilla_bug(
+            i,
+            assigned_to=_pick(logins, i),
+            reporter=_pick(logins, i + 1),
+            product=_pick(products, i),
+            bug_status=_pick(statuses, i),
+            status_whiteboard='s=%s p=%s' % (sprint, i % 8) if i % 3 == 0
+            else '',
+            dependson=[str(i - 1)] if i % 10 == 0 else [],
+        )
+        for i in xrange(1, count + 1)
+    ]
+
+
+def synthetic_jira_issues(count, logins, projects, sprint):
+    statuses = ('Open', 'Development', 'Code Review', 'Testing')
+    return [
+        jira_issue(
+            '%s-%s' % (_pick(projects, i), i),
+            assignee={'name': _pick(logins, i)},
+            reporter={'name': _pick(logins, i + 1)},
+            status={'name': _pick(statuses, i)},
+            project={'name': _pick(projects, i)},
+            labels=[sprint] if i % 3 == 0 else [],
+            **{JIRA_STORY_POINTS_FIELD: i % 8}
+        )
+        for i in xrange(1, count + 1)
+    ]
+
+
+def synthetic_github_issues(count, logins, milestone):
+    return [
+        github_issue(
+            i,
+            assignee={'login': _pick(logins, i)},
+            user={'login': _pick(logins, i + 1)},
+            state='closed' if i % 4 == 0 else 'open',
+            milestone=milestone if i % 3 == 0 else None,
+            labels=[{'name': 'p=%s' % (i % 8)}],
+        )
+        for i in xrange(1, count + 1)
+    ]
+
+
+def synthetic_pivotal_stories(count, names, project_ids, sprint):
+    states = ('started', 'unstarted', 'finished', 'accepted')
+    return [
+        pivotal_story(
+            i,
+            _pick(project_ids, i),
+            owned_by={'name': _pick(names, i)},
+            requested_by={'name': _pick(names, i + 1)},
+            current_state=_pick(states, i),
+            estimate=i % 8,
+            labels=[{'name': sprint}] if i % 3 == 0 else [],
+        )
+        for i in xrange(1, count + 1)
+    ]
+
+
+def synthetic_trac_tickets(count, logins, clients):
+    statuses = ('new', 'assigned', 'reopened', 'resolved')
+    return [
+        trac_ticket(
+            i,
+            owner=_pick(logins, i),
+            reporter=_pick(logins, i + 1),
+            client_name=_pick(clients, i),
+            status=_pick(statuses, i),
+        )
+        for i in xrange(1, count + 1)
+    ]
+
+
+def synthetic_unfuddle_tickets(count, people_ids, project_ids, milestone_id):
+    statuses = ('new', 'accepted', 'reassigned', 'resolved')
+    return [
+        unfuddle_ticket(
+            i,
+            _pick(project_ids, i),
+            assignee_id=_pick(people_ids, i),
+            reporter_id=_pick(people_ids, i + 1),
+            status=_pick(statuses, i),
+            milestone_id=milestone_id if i % 3 == 0 else None,
+        )
+        for i in xrange(1, count + 1)
+    ]
@@ -0,0 +1,23 @@
+from intranet3.testing import FactoryMixin, IntranetTest
+from intranet3.testing.benchmark import run, format_report
+
+
+class BenchmarkTest(FactoryMixin, IntranetTest):
+
+    def test_run(self):
+        report = run(self.request, scale=12, latency=0, repeat=1)
+
+        results = dict(
+            (result['name'], result) for result in report['operations']
+        )
+        self.assertEqual(
+            sorted(results), ['get_all', 'get_sprint', 'get_user'],
+        )
+        for result in results.itervalues():
+            self.assertEqual(result['calls'], 1)
+            self.assertTrue(result['bugs'] > 0)
+
+        # every tracker was asked for user's bugs, trac has no sprints
+        self.assertTrue(all(results['get_user']['requests'].values()))
+        self.assertEqual(results['get_sprint']['requests']['trac'], 0)
+        self.assertIn('get_sprint', format_report(report))
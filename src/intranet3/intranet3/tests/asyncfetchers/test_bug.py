@@ -0,0 +1,40 @@
+from collections import namedtuple
+import unittest
+
+from intranet3.asyncfetchers.bug import Bug, Scrum, BaseBugProducer
+
+
+Tracker = namedtuple('Tracker', 'type name')
+
+
+class BugTest(unittest.TestCase):
+
+    def test_to_dict(self):
+        bug = Bug(Tracker('bugzilla', 'bz'))
+        bug.id = '1'
+        bug.scrum = Scrum()
+        bug.scrum.points = 3
+
+        result = bug.to_dict()
+        self.assertEqual(result['id'], '1')
+        self.assertEqual(result['owner']['name'], 'unknown')
+        self.assertEqual(
+            result['scrum'], {'points': 3, 'velocity': 0.0, 'color': None},
+        )
+        # never set
+        self.assertNotIn('sprint_time', result)
+
+    def test_slots(self):
+        bug = Bug(Tracker('bugzilla', 'bz'))
+        self.assertRaises(AttributeError, setattr, bug, 'unknown', 1)
+
+    def test_producer_plan(self):
+        class Producer(BaseBugProducer):
+            def get_url(self, tracker, login_mapping, parsed_data):
+                return 'url'
+
+        plan = dict(Producer._plan)
+        self.assertEqual(plan['url'], Producer.get_url)
+        self.assertEqual(plan['priority_number'], Producer.get_priority_number)
+        self.assertIsNone(plan['desc'])
+        self.assertNotIn('scrum', plan)
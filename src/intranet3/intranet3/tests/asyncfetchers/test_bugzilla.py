@@ -0,0 +1,46 @@
+from intranet3.testing import FactoryMixin, IntranetTest, StandInTestMixin
+from intranet3.testing.trackers import BugzillaStandIn, bugzilla_bug
+
+
+class BugzillaDependenciesTest(StandInTestMixin, FactoryMixin, IntranetTest):
+
+    def setUp(self):
+        super(BugzillaDependenciesTest, self).setUp()
+        self.start_stand_in(BugzillaStandIn([
+            bugzilla_bug(1, assigned_to='userx', dependson=['3', '4']),
+            bugzilla_bug(2, assigned_to='userx', blocked=['4']),
+            bugzilla_bug(3, bug_status='RESOLVED'),
+            bugzilla_bug(4, short_desc=u'Blocker'),
+        ]))
+
+    def get_fetcher(self):
+        fetcher = super(BugzillaDependenciesTest, self).get_fetcher()
+        fetcher.DEPENDENCY_CHUNK_SIZE = 1
+        return fetcher
+
+    def show_bug_requests(self):
+        return [
+            params['id'] for path, params in self.stand_in.requests
+            if path == '/show_bug.cgi'
+        ]
+
+    def test_dependencies_in_chunks(self):
+        parsed_data = [{'bug_id': '1'}, {'bug_id': '2'}]
+        self.get_fetcher().after_parsing(parsed_data)
+
+        self.assertEqual(
+            [bug['bug_id'] for bug in parsed_data[0]['dependson']], ['3', '4'],
+        )
+        self.assertEqual(parsed_data[1]['blocked'][0]['description'], u'Blocker')
+        self.assertEqual(
+            self.show_bug_requests(), [['1'], ['2'], ['3'], ['4']],
+        )
+
+    def test_statuses_are_cached(self):
+        self.get_fetcher().after_parsing([{'bug_id': '1'}])
+        self.stand_in.requests = []
+
+        parsed_data = [{'bug_id': '1'}]
+        self.get_fetcher().after_parsing(parsed_data)
+        self.assertEqual(parsed_data[0]['dependson'][1]['status'], 'NEW')
+        self.assertEqual(self.show_bug_requests(), [['1']])
@@ -0,0 +1,80 @@
+from intranet3 import memcache
+from intranet3.asyncfetchers.base import FetchException
+from intranet3.testing import FactoryMixin, IntranetTest, StandInTestMixin
+from intranet3.testing.trackers import BugzillaStandIn, bugzilla_bug
+
+
+class BugzillaRPCFetcherTest(StandInTestMixin, FactoryMixin, IntranetTest):
+
+    TRACKER_TYPE = 'bugzilla_rpc'
+
+    BUGS = [
+        bugzilla_bug(1, assigned_to='userx', dependson=['3', '4']),
+        bugzilla_bug(2, assigned_to='userx', blocked=['4']),
+        bugzilla_bug(3, bug_status='RESOLVED'),
+        bugzilla_bug(4, short_desc=u'Blocker'),
+        bugzilla_bug(5, assigned_to='usery', status_whiteboard='s=sprint_xy'),
+        bugzilla_bug(6, assigned_to='usery', status_whiteboard='s=sprint_x'),
+    ]
+
+    def start(self, json_rpc=True, **kwargs):
+        self.start_stand_in(
+            BugzillaStandIn(self.BUGS, json_rpc=json_rpc, **kwargs)
+        )
+
+    def get_fetcher(self):
+        fetcher = super(BugzillaRPCFetcherTest, self).get_fetcher()
+        fetcher.SEARCH_PAGE_SIZE = 1
+        fetcher.SEARCH_CONCURRENCY = 2
+        return fetcher
+
+    def test_user_tickets(self):
+        self.start()
+        fetcher = self.get_fetcher()
+        fetcher.fetch_user_tickets()
+        bugs = dict((bug.id, bug) for bug in fetcher.get_result())
+
+        self.assertEqual(sorted(bugs), ['1', '2'])
+        self.assertEqual([dep.id for dep in bugs['1'].dependson], ['4'])
+        self.assertEqual(bugs['2'].blocked[0].desc, u'Blocker')
+        self.assertEqual(bugs['1'].changeddate.year, 2014)
+        # 1 + 2 pages of search, statuses of dependencies
+        self.assertEqual(self.requested_paths(), ['/jsonrpc.cgi'] * 4)
+        search = self.stand_in.requests[0][1]['params'][0]
+        self.assertEqual(search['assigned_to'], 'userx')
+        self.assertIn('depends_on', search['include_fields'])
+
+    def test_sprint_whiteboard(self):
+        self.start()
+        fetcher = self.get_fetcher()
+        fetcher.fetch_scrum('sprint_x')
+
+        self.assertEqual([bug.id for bug in fetcher.get_result()], ['6'])
+
+    def test_csv_fallback(self):
+        self.start(json_rpc=False)
+        fetcher = self.get_fetcher()
+        fetcher.fetch_user_tickets()
+        bugs = dict((bug.id, bug) for bug in fetcher.get_result())
+
+        # buglist.cgi stand-in does not filter by user
+        self.assertEqual(bugs['2'].blocked[0].desc, u'Blocker')
+        self.assertEqual(self.requested_paths()[:2], ['/jsonrpc.cgi', '/buglist.cgi'])
+
+        # tracker is not asked for JSON-RPC again
+        self.stand_in.requests = []
+        fetcher = self.get_fetcher()
+        fetcher.fetch_all_tickets()
+        fetcher.get_result()
+        self.assertNotIn('/jsonrpc.cgi', self.requested_paths())
+
+    def test_error_is_not_fallback(self):
+        # every request is answered with 503 text/plain
+        self.start(error_rate=1.0)
+        fetcher = self.get_fetcher()
+        fetcher.fetch_user_tickets()
+
+        self.assertRaises(FetchException, fetcher.get_result)
+        self.assertEqual(self.requested_paths(), ['/jsonrpc.cgi'])
+        key = fetcher.UNSUPPORTED_CACHE_KEY % self.tracker.id
+        self.assertFalse(memcache.get(key))
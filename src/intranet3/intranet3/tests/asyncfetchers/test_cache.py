@@ -0,0 +1,69 @@
+import datetime
+import unittest
+
+from mock import patch
+
+from intranet3 import memcache
+from intranet3.asyncfetchers import cache
+from intranet3.testing import IntranetTest
+
+
+def bug_data(i):
+    return dict(
+        id=str(i),
+        desc=u'bug %s' % i,
+        status='NEW' if i % 2 else 'ASSIGNED',
+        opendate=datetime.datetime(2014, 5, 1, 12, i % 60),
+        blocked=[dict(id='1', status='NEW')] if i % 3 else [],
+    )
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_columns(self):
+        data = [bug_data(i) for i in xrange(100)]
+        data[1].pop('status')
+        data[2]['status'] = None
+        data[3]['status'] = 1
+        data[4]['status'] = True
+
+        decoded = cache.decode(cache.encode(data))
+
+        self.assertEqual(decoded, data)
+        self.assertNotIn('status', decoded[1])
+        self.assertIs(decoded[3]['status'], 1)
+        self.assertIs(decoded[4]['status'], True)
+
+    def test_other_data(self):
+        for data in ([], {'users': {1: 'userx'}}, [1, 2], (1, 2)):
+            self.assertEqual(cache.decode(cache.encode(data)), data)
+
+
+class ChunkedEntryTest(IntranetTest):
+
+    def setUp(self):
+        super(ChunkedEntryTest, self).setUp()
+        self.data = [bug_data(i) for i in xrange(1000)]
+
+    @patch.object(cache, 'CHUNK_SIZE', 1024)
+    def test_chunks(self):
+        cache.set('cache_test', self.data, 60)
+
+        format, fetched_at, token, count, blob = memcache.get('cache_test')
+        self.assertTrue(count > 1)
+        self.assertEqual(cache.get('cache_test').data, self.data)
+
+    @patch.object(cache, 'CHUNK_SIZE', 1024)
+    def test_missing_chunk(self):
+        cache.set('cache_test', self.data, 60)
+        format, fetched_at, token, count, blob = memcache.get('cache_test')
+        memcache.delete(cache._chunk_keys('cache_test', token, count)[-1])
+
+        self.assertIsNone(cache.get('cache_test'))
+
+    def test_old_entry(self):
+        memcache.set('cache_test', (1400000000.0, self.data), 60)
+
+        entry = cache.get('cache_test')
+        self.assertEqual(entry.fetched_at, 1400000000.0)
+        self.assertEqual(entry.data, self.data)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import codecs
+import unittest
+
+from intranet3.asyncfetchers.base import CSVParserMixin
+
+
+class CSVParserMixinTest(unittest.TestCase):
+
+    def test_parse_lines(self):
+        parser = CSVParserMixin()
+        lines = iter([
+            codecs.BOM_UTF8 + 'bug_id,short_desc',
+            '1,"Zażółć, gęślą"',
+            '',
+            '2,Bug',
+        ])
+        result = parser.parse_lines(lines)
+        self.assertEqual(next(result), {
+            'bug_id': u'1', 'short_desc': u'Zażółć, gęślą',
+        })
+        self.assertEqual(list(result), [{'bug_id': u'2', 'short_desc': u'Bug'}])
+
+    def test_parse(self):
+        parser = CSVParserMixin()
+        data = u'bug_id;short_desc\r\n1;Żółw\r\n'
+        parser.delimiter = ';'
+        self.assertEqual(
+            parser.parse(data), [{'bug_id': u'1', 'short_desc': u'Żółw'}],
+        )
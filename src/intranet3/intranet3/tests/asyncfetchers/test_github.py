@@ -0,0 +1,38 @@
+from intranet3.testing import FactoryMixin, IntranetTest, StandInTestMixin
+from intranet3.testing.trackers import GithubStandIn, github_issue
+
+
+class GithubPaginationTest(StandInTestMixin, FactoryMixin, IntranetTest):
+
+    TRACKER_TYPE = 'github'
+
+    def setUp(self):
+        super(GithubPaginationTest, self).setUp()
+        sprint = {'number': 7, 'title': 'Sprint 1'}
+        issues = [github_issue(i, milestone=sprint) for i in range(1, 6)]
+        issues += [
+            github_issue(i, milestone=sprint, state='closed')
+            for i in range(6, 9)
+        ]
+        self.start_stand_in(GithubStandIn(
+            issues,
+            milestones=[{'number': 6, 'title': 'Sprint 0'}, sprint],
+            max_per_page=2,
+        ))
+
+    def test_scrum_all_pages(self):
+        fetcher = self.get_fetcher()
+        fetcher.fetch_scrum('Sprint 1', 'owner_x', 'repo_x')
+        bugs = fetcher.get_result()
+
+        self.assertEqual(
+            sorted(int(bug.id) for bug in bugs), range(1, 9),
+        )
+
+    def test_not_modified(self):
+        url = self.stand_in.url + 'issues?state=open'
+        self.assertEqual(len(self.get_fetcher().fetch_pages([url])), 5)
+        self.assertEqual(self.stand_in.not_modified, 0)
+
+        self.assertEqual(len(self.get_fetcher().fetch_pages([url])), 5)
+        self.assertEqual(self.stand_in.not_modified, 3)
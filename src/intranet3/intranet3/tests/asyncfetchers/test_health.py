@@ -0,0 +1,62 @@
+import unittest
+
+from intranet3.asyncfetchers.health import (
+    TrackerHealth,
+    CLOSED,
+    OPEN,
+    HALF_OPEN,
+)
+
+
+class TrackerHealthTest(unittest.TestCase):
+
+    def test_circuit(self):
+        health = TrackerHealth('tracker')
+        for i in range(TrackerHealth.FAILURE_THRESHOLD - 1):
+            health.record_failure(now=100)
+        self.assertEqual(health.state, CLOSED)
+        self.assertTrue(health.allow_request(now=100))
+
+        health.record_failure(now=100)
+        self.assertEqual(health.state, OPEN)
+        self.assertFalse(health.allow_request(now=101))
+
+        # single probe after OPEN_TIMEOUT
+        probe_time = 100 + TrackerHealth.OPEN_TIMEOUT
+        self.assertTrue(health.allow_request(now=probe_time))
+        self.assertEqual(health.state, HALF_OPEN)
+        self.assertFalse(health.allow_request(now=probe_time))
+
+        # failed probe opens the circuit again
+        health.record_failure(now=probe_time)
+        self.assertEqual(health.state, OPEN)
+        self.assertFalse(health.allow_request(now=probe_time + 1))
+
+        self.assertTrue(health.allow_request(now=probe_time * 2))
+        health.record_success(0.5)
+        self.assertEqual(health.state, CLOSED)
+        self.assertTrue(health.allow_request(now=probe_time * 2))
+
+    def test_timeout(self):
+        health = TrackerHealth('tracker')
+        self.assertEqual(health.timeout(30), 30)
+
+        for i in range(TrackerHealth.MIN_SAMPLES):
+            health.record_success(1)
+        self.assertEqual(health.timeout(30), TrackerHealth.MIN_TIMEOUT)
+
+        for i in range(TrackerHealth.MIN_SAMPLES):
+            health.record_success(10)
+        self.assertEqual(health.timeout(30), 20)
+        self.assertEqual(health.timeout(15), 15)
+
+    def test_error_rate(self):
+        health = TrackerHealth('tracker')
+        self.assertEqual(health.error_rate, 0.0)
+        health.record_success(1)
+        health.record_failure()
+        health.record_success(3)
+        health.record_success(2)
+        self.assertEqual(health.error_rate, 0.25)
+        self.assertEqual(health.latency(50), 2)
+        self.assertEqual(health.latency(99), 3)
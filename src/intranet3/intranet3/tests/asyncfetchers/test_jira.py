@@ -0,0 +1,39 @@
+from intranet3.testing import FactoryMixin, IntranetTest, StandInTestMixin
+from intranet3.testing.trackers import (
+    JiraStandIn,
+    jira_issue,
+    JIRA_STORY_POINTS_FIELD,
+)
+
+
+class JiraSearchTest(StandInTestMixin, FactoryMixin, IntranetTest):
+
+    TRACKER_TYPE = 'jira'
+
+    def setUp(self):
+        super(JiraSearchTest, self).setUp()
+        self.start_stand_in(JiraStandIn(
+            [
+                jira_issue('X-%s' % i, **{JIRA_STORY_POINTS_FIELD: i})
+                for i in range(1, 121)
+            ],
+            max_results=50,
+        ))
+
+    def test_all_pages(self):
+        fetcher = self.get_fetcher()
+        fetcher.fetch_all_tickets()
+        bugs = fetcher.get_result()
+
+        self.assertEqual(len(bugs), 120)
+        points = dict((bug.id, bug.scrum.points) for bug in bugs)
+        self.assertEqual(points['X-120'], 120)
+
+        starts = [
+            params['startAt'][0] for path, params in self.stand_in.requests
+            if path == '/rest/api/2/search'
+        ]
+        self.assertEqual(sorted(starts, key=int), ['0', '50', '100'])
+        self.assertEqual(
+            self.requested_paths().count('/rest/api/2/field'), 1,
+        )
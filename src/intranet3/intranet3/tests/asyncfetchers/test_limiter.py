@@ -0,0 +1,44 @@
+import time
+import unittest
+
+import gevent
+
+from intranet3.asyncfetchers.limiter import HostLimiter, QueueTimeout
+
+
+class HostLimiterTest(unittest.TestCase):
+
+    def test_concurrency(self):
+        limiter = HostLimiter('tracker', max_concurrency=2)
+        running = []
+        peak = []
+
+        def request():
+            with limiter.slot():
+                running.append(1)
+                peak.append(len(running))
+                gevent.sleep(0.01)
+                running.pop()
+
+        gevent.joinall([gevent.spawn(request) for i in range(6)])
+
+        self.assertEqual(max(peak), 2)
+        stats = limiter.to_dict()
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['queued'], 4)
+        self.assertEqual(stats['max_queue_depth'], 4)
+        self.assertEqual(stats['active'], 0)
+        self.assertTrue(stats['max_wait_time'] > 0)
+
+    def test_deadline(self):
+        limiter = HostLimiter('tracker', max_concurrency=1)
+        limiter.acquire()
+
+        self.assertRaises(
+            QueueTimeout, limiter.acquire, deadline=time.time() + 0.01,
+        )
+        self.assertEqual(limiter.queue_depth, 0)
+        self.assertEqual(limiter.timeouts, 1)
+
+        limiter.release()
+        self.assertEqual(limiter.active, 0)
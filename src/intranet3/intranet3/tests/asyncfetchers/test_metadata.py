@@ -0,0 +1,56 @@
+import time
+
+from intranet3 import memcache
+from intranet3.asyncfetchers.metadata import (
+    METADATA,
+    MetadataCache,
+    TrackerMetadata,
+)
+from intranet3.testing import FactoryMixin, IntranetTest
+
+
+class MetadataCacheTest(FactoryMixin, IntranetTest):
+
+    def setUp(self):
+        super(MetadataCacheTest, self).setUp()
+        self.tracker = self.create_tracker()
+        self.loads = 0
+
+    def loader(self):
+        self.loads += 1
+        return TrackerMetadata(users={1: 'userx'}, fields={'load': self.loads})
+
+    def test_loaded_once(self):
+        metadata = METADATA.get(self.tracker, self.loader)
+        self.assertEqual(metadata.users, {1: 'userx'})
+        self.assertEqual(metadata.projects, {})
+
+        METADATA.get(self.tracker, self.loader)
+        self.assertEqual(self.loads, 1)
+
+    def test_hydrated_from_memcache(self):
+        METADATA.get(self.tracker, self.loader)
+
+        other_process = MetadataCache()
+        metadata = other_process.get(self.tracker, self.loader)
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(metadata.users, {1: 'userx'})
+
+    def test_scopes_are_separate(self):
+        METADATA.get(self.tracker, self.loader, scope=u'userx')
+        METADATA.get(self.tracker, self.loader, scope=u'usery')
+        self.assertEqual(self.loads, 2)
+
+    def test_stale_refreshed_in_background(self):
+        metadata = METADATA.get(self.tracker, self.loader)
+        key = METADATA.key(self.tracker)
+        fetched_at = time.time() - 3600
+        memcache.set(key, (fetched_at, metadata.to_dict()))
+        METADATA._entries[key].fetched_at = fetched_at
+
+        metadata = METADATA.get(self.tracker, self.loader)
+        self.assertEqual(metadata.fields['load'], 1)  # stale served
+
+        METADATA._refreshing[key].join()
+        metadata = METADATA.get(self.tracker, self.loader)
+        self.assertEqual(metadata.fields['load'], 2)
@@ -0,0 +1,69 @@
+import unittest
+from io import BytesIO
+
+import mock
+from requests import Response
+
+from intranet3 import models as m
+from intranet3.asyncfetchers import metrics
+from intranet3.asyncfetchers.metrics import Histogram, MetricsRegistry
+from intranet3.asyncfetchers.request import hold_slot
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = m.Tracker(name='tracker_x')
+        self.registry = MetricsRegistry()
+
+    def test_histogram(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(
+            list(histogram.cumulative()), [(1, 2), (10, 3), ('+Inf', 4)],
+        )
+        self.assertEqual(histogram.sum, 56.5)
+
+    def test_to_dict(self):
+        self.registry.inc(self.tracker, 'fetch_scrum', metrics.CACHE_MISS)
+        self.registry.error(self.tracker, 'fetch_scrum', ValueError())
+        self.registry.observe(self.tracker, 'fetch_scrum', 'bugs', 42)
+
+        data = self.registry.to_dict()['tracker_x']['fetch_scrum']
+        self.assertEqual(
+            data['counters'], {'cache_miss': 1, 'error:ValueError': 1},
+        )
+        self.assertEqual(data['histograms']['bugs']['count'], 1)
+
+    def test_prometheus(self):
+        self.registry.inc(self.tracker, 'fetch_user_tickets', metrics.CACHE_HIT)
+        self.registry.observe(
+            self.tracker, 'fetch_user_tickets', 'fetch_seconds', 0.2,
+        )
+        lines = self.registry.to_prometheus().splitlines()
+
+        labels = 'tracker="tracker_x",method="fetch_user_tickets"'
+        self.assertIn('intranet_fetcher_cache_hit_total{%s} 1' % labels, lines)
+        self.assertIn(
+            'intranet_fetcher_fetch_seconds_bucket{%s,le="0.25"} 1' % labels,
+            lines,
+        )
+        self.assertIn(
+            'intranet_fetcher_fetch_seconds_bucket{%s,le="+Inf"} 1' % labels,
+            lines,
+        )
+        self.assertIn(
+            'intranet_fetcher_fetch_seconds_count{%s} 1' % labels, lines,
+        )
+
+    def test_response_size_streamed(self):
+        # chunked body, no Content-Length
+        response = Response()
+        response.raw = BytesIO('x' * 2500)
+        hold_slot(response, mock.Mock())
+
+        self.assertEqual(metrics.response_size(response), 0)
+        for line in response.iter_lines(chunk_size=1024):
+            pass
+        self.assertEqual(metrics.response_size(response), 2500)
@@ -0,0 +1,90 @@
+from intranet3 import models as m
+from intranet3.asyncfetchers import get_fetcher, health, sync_tracker
+from intranet3.asyncfetchers.trac import TracFetcher
+from intranet3.asyncfetchers.mirror import WATERMARK_OVERLAP
+from intranet3.lib.bugs import Bugs
+from intranet3.testing import FactoryMixin, IntranetTest, StandInTestMixin
+from intranet3.testing.trackers import BugzillaStandIn, bugzilla_bug
+from intranet3.views.cron.bugs import SyncMirror
+
+
+class BugMirrorTest(StandInTestMixin, FactoryMixin, IntranetTest):
+
+    def setUp(self):
+        super(BugMirrorTest, self).setUp()
+        self.start_stand_in(BugzillaStandIn([
+            bugzilla_bug(1, assigned_to='userx', dependson=['3']),
+            bugzilla_bug(2, assigned_to='usery'),
+            bugzilla_bug(3, assigned_to='userx', bug_status='RESOLVED'),
+        ]))
+        self.project = self.create_project(
+            tracker=self.tracker,
+            project_selector='PRODUCT_X',
+        )
+
+    def sync(self):
+        return sync_tracker(self.get_fetcher())
+
+    def test_sync(self):
+        # first sync backfills all open bugs, however old
+        self.assertEqual(self.sync(), 2)
+
+        path, params = self.stand_in.requests[0]
+        self.assertEqual(path, '/buglist.cgi')
+        self.assertNotIn('chfieldfrom', params)
+        snapshots = m.BugSnapshot.query.order_by(m.BugSnapshot.bug_id).all()
+        self.assertEqual(
+            [(s.bug_id, s.owner, s.status, s.project_id) for s in snapshots],
+            [
+                ('1', 'userx', 'NEW', self.project.id),
+                ('2', 'usery', 'NEW', self.project.id),
+            ],
+        )
+        self.assertEqual(snapshots[0].data['dependson'][0]['bug_id'], '3')
+        # background sync doesn't count in tracker health
+        self.assertNotIn(self.tracker.id, health.TRACKERS)
+
+    def test_incremental_sync(self):
+        self.sync()
+        state = m.BugSyncState.query.get(self.tracker.id)
+
+        self.stand_in.bugs[1]['bug_status'] = 'RESOLVED'
+        self.stand_in.bugs[1]['changeddate'] = '2099-01-01 10:00:00'
+        self.stand_in.requests = []
+        self.assertEqual(self.sync(), 1)
+
+        path, params = self.stand_in.requests[0]
+        since = state.watermark - WATERMARK_OVERLAP
+        self.assertEqual(path, '/buglist.cgi')
+        self.assertEqual(
+            params['chfieldfrom'], [since.strftime('%Y-%m-%d %H:%M')],
+        )
+        snapshot = m.BugSnapshot.query.get((self.tracker.id, '2'))
+        self.assertEqual(snapshot.status, 'RESOLVED')
+
+    def test_bugs_from_mirror(self):
+        self.sync()
+        self.stand_in.stop()  # no tracker calls from now on
+
+        bugs = Bugs(self.request, self.user, mirror=True).get_user()
+        self.assertEqual([bug.id for bug in bugs], ['1'])
+        self.assertEqual(bugs[0].owner.id, self.user.id)
+        self.assertEqual(bugs[0].dependson, [])
+
+        bugs = Bugs(self.request, self.user, mirror=True).get_project(
+            self.project, credentials=self.creds,
+        )
+        self.assertEqual(sorted(bug.id for bug in bugs), ['1', '2'])
+
+    def test_unsupported_tracker(self):
+        trac = self.create_tracker(type='trac')
+        creds = self.add_creds(self.user, trac, 'userx')
+        mapping = m.TrackerCredentials.get_logins_mapping(trac)
+        fetcher = get_fetcher(trac, creds, self.user, mapping, mirror=True)
+        self.assertIsInstance(fetcher, TracFetcher)
+
+        SyncMirror(None, self.request).action()
+
+        self.assertIsNotNone(m.BugSyncState.query.get(self.tracker.id))
+        self.assertIsNone(m.BugSyncState.query.get(trac.id))
+        self.assertNotIn(trac.id, health.TRACKERS)
@@ -0,0 +1,93 @@
+import unittest
+
+import mock
+
+from intranet3.asyncfetchers.limiter import get_limiter
+from intranet3.asyncfetchers.request import RPC, SessionPool, closing_rpcs
+from intranet3.testing.trackers import TrackerStandIn
+
+
+class SessionPoolTest(unittest.TestCase):
+
+    def test_reuse(self):
+        pool = SessionPool()
+        key = pool.make_key('https://bugs.example.com/', 'login', 'secret')
+        session = pool.acquire(key)
+        pool.release(key, session)
+        self.assertIs(pool.acquire(key), session)
+
+    def test_keys_are_separated(self):
+        pool = SessionPool()
+        key1 = pool.make_key('https://bugs.example.com/', 'login', 'secret')
+        key2 = pool.make_key('https://bugs.example.com/', 'login2', 'secret')
+        self.assertNotEqual(key1, key2)
+        self.assertNotIn('secret', ''.join(key1))
+
+        session = pool.acquire(key1)
+        pool.release(key1, session)
+        self.assertIsNot(pool.acquire(key2), session)
+
+    def test_max_size(self):
+        pool = SessionPool(max_size=1)
+        key = pool.make_key('https://bugs.example.com/', 'login', 'secret')
+        s1, s2 = pool.acquire(key), pool.acquire(key)
+        pool.release(key, s1)
+        pool.release(key, s2)
+        self.assertEqual(len(pool._idle[key]), 1)
+
+    @mock.patch('intranet3.asyncfetchers.request.time')
+    def test_idle_eviction(self, time):
+        pool = SessionPool(max_idle=10)
+        key = pool.make_key('https://bugs.example.com/', 'login', 'secret')
+        time.time.return_value = 100
+        session = pool.acquire(key)
+        pool.release(key, session)
+
+        time.time.return_value = 111
+        self.assertIsNot(pool.acquire(key), session)
+        self.assertNotIn(key, pool._idle)
+
+
+class DataStandIn(TrackerStandIn):
+    ROUTES = {'/data': 'data'}
+
+    def data(self, params, request):
+        return 'x' * 1000, 'text/plain'
+
+
+class RPCSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_in = DataStandIn().start()
+        self.url = self.stand_in.url + '/data'
+        self.limiter = get_limiter(self.url)
+
+    def tearDown(self):
+        self.stand_in.stop()
+
+    def test_released_after_request(self):
+        response = RPC(self.url).start().get_result()
+        self.assertEqual(self.limiter.active, 0)
+        self.assertEqual(len(response.content), 1000)
+
+    def test_streamed_body_holds_slot(self):
+        response = RPC(self.url, stream=True).start().get_result()
+        self.assertEqual(self.limiter.active, 1)
+
+        self.assertEqual(len(response.content), 1000)
+        self.assertEqual(self.limiter.active, 0)
+        response.close()
+        self.assertEqual(self.limiter.active, 0)
+
+    def test_close_releases_slot(self):
+        response = RPC(self.url, stream=True).start().get_result()
+        response.close()
+        self.assertEqual(self.limiter.active, 0)
+
+    def test_closing_rpcs_on_error(self):
+        rpcs = [RPC(self.url, stream=True).start() for i in range(3)]
+        with self.assertRaises(ValueError):
+            with closing_rpcs(rpcs):
+                rpcs[0].get_result()
+                raise ValueError()
+        self.assertEqual(self.limiter.active, 0)
@@ -0,0 +1,74 @@
+import datetime
+
+from intranet3 import models as m
+from intranet3.asyncfetchers.bugzilla import BugzillaFetcher
+from intranet3.lib.bugs import Bugs
+from intranet3.testing import FactoryMixin, IntranetTest, StandInTestMixin
+from intranet3.testing.trackers import BugzillaStandIn, bugzilla_bug
+
+
+class SprintBugsTest(StandInTestMixin, FactoryMixin, IntranetTest):
+
+    def setUp(self):
+        super(SprintBugsTest, self).setUp()
+        self.start_stand_in(BugzillaStandIn([
+            bugzilla_bug(1, product='PRODUCT_X'),
+            bugzilla_bug(2, product='PRODUCT_Y'),
+            bugzilla_bug(3, product='PRODUCT_Y', component='COMPONENT_Y'),
+            bugzilla_bug(4, product='PRODUCT_Z'),
+        ]))
+        self.project_x = self.create_project(
+            tracker=self.tracker, project_selector='PRODUCT_X',
+        )
+        self.project_y = self.create_project(
+            tracker=self.tracker, project_selector='PRODUCT_Y',
+            component_selector='COMPONENT_X',
+        )
+        # same product, not in the sprint
+        self.create_project(
+            tracker=self.tracker, project_selector='PRODUCT_Y',
+            component_selector='COMPONENT_Y',
+        )
+
+    def _buglists(self):
+        return [
+            params for path, params in self.stand_in.requests
+            if path == '/buglist.cgi'
+        ]
+
+    def test_one_query_per_tracker(self):
+        sprint = m.Sprint(
+            name='sprint_x',
+            client_id=self.project_x.client_id,
+            project_id=self.project_x.id,
+            bugs_project_ids=[self.project_x.id, self.project_y.id],
+            start=datetime.date(2014, 5, 1),
+            end=datetime.date(2014, 5, 14),
+        )
+        m.DBSession.add(sprint)
+        m.DBSession.flush()
+
+        bugs = Bugs(self.request, self.user).get_sprint(sprint)
+
+        buglists = self._buglists()
+        self.assertEqual(len(buglists), 1)
+        self.assertEqual(buglists[0]['product'], ['PRODUCT_X', 'PRODUCT_Y'])
+        self.assertEqual(
+            sorted((bug.id, bug.project.id) for bug in bugs),
+            [('1', self.project_x.id), ('2', self.project_y.id)],
+        )
+
+    def test_refresh_ahead(self):
+        Bugs(self.request, self.user, mirror=False).get_all()
+        Bugs(self.request, self.user, mirror=False).get_all()
+        self.assertEqual(len(self._buglists()), 1)
+
+        # entry stays fresh for longer than refresh_ahead, served from cache
+        warmer = Bugs(self.request, self.user, mirror=False, refresh_ahead=60)
+        warmer.get_all()
+        self.assertEqual(len(self._buglists()), 1)
+
+        # entry goes stale within refresh_ahead, fetched again
+        warmer.refresh_ahead = BugzillaFetcher.CACHE_TIMEOUT
+        warmer.get_all()
+        self.assertEqual(len(self._buglists()), 2)
@@ -0,0 +1,84 @@
+import datetime
+import unittest
+
+from intranet3 import models as m
+from intranet3.lib.times import ExcelRow, Row, TimesReportMixin, report_entries
+from intranet3.testing import FactoryMixin, IntranetTest
+
+
+class RowGroupTest(unittest.TestCase):
+
+    def entry(self, client, project, ticket_id, user, description, day, time):
+        return (
+            client, project, ticket_id, user, 'tracker', description,
+            datetime.date(2014, 5, day), time,
+        )
+
+    def setUp(self):
+        self.entries = [
+            self.entry('client_x', 'project_x', 1, 'user_x', 'a', 1, 1.0),
+            self.entry('client_x', 'project_x', 1, 'user_y', 'a', 1, 2.0),
+            self.entry('client_x', 'project_x', 2, 'user_x', 'b', 2, 4.0),
+            self.entry('client_x', 'project_y', 3, 'user_x', 'c', 3, 8.0),
+        ]
+
+    def test_group_by_ticket(self):
+        rows, asum = Row.from_ordered_data(
+            iter(self.entries), (True, True, True, False),
+        )
+        self.assertEqual(asum, 15.0)
+        self.assertEqual([list(row) for row in rows], [
+            ['client_x', 'project_x', 1, 'Multiple entries', 'tracker', 'a',
+             datetime.date(2014, 5, 1), 3.0],
+            list(self.entries[2]),
+            list(self.entries[3]),
+        ])
+        self.assertEqual(rows[0]._subrows, self.entries[:2])
+        self.assertEqual(rows[1]._subrows, [])
+
+    def test_group_by_user_only(self):
+        rows, asum = Row.from_ordered_data(
+            self.entries, (False, False, False, True), bigger_than=2.5,
+        )
+        self.assertEqual(asum, 13.0)
+        self.assertEqual([list(row) for row in rows], [
+            ['client_x', 'Multiple entries', 'Multiple entries', 'user_x',
+             'tracker', 'Multiple entries', 'Multiple entries', 13.0],
+        ])
+
+    def test_iter_rows(self):
+        rows = ExcelRow.iter_rows(
+            iter(self.entries), (True, True, False, False), bigger_than=5.0,
+        )
+        self.assertFalse(isinstance(rows, list))
+        rows = list(rows)
+        self.assertEqual([row[-1] for row in rows], [7.0, 8.0])
+        # excel rows don't keep grouped entries
+        self.assertEqual(rows[0]._subrows, [])
+
+
+class ReportEntriesTest(FactoryMixin, IntranetTest):
+
+    def test_report_entries(self):
+        user = self.create_user(name='user_x')
+        project = self.create_project(user=user, name='project_x')
+        day = datetime.date(2014, 5, 1)
+        for time, deleted in ((1.0, False), (2.0, True)):
+            m.DBSession.add(m.TimeEntry(
+                user_id=user.id, date=day, time=time, description=u'work',
+                ticket_id=1, project_id=project.id, deleted=deleted,
+            ))
+        m.DBSession.flush()
+
+        query = TimesReportMixin()._prepare_uber_query(
+            day, day, [project.id], [], 'all',
+        )
+        entries = list(report_entries(query))
+
+        self.assertEqual(len(entries), 1)
+        client, project_, ticket_id, user_, tracker, desc, date, time = entries[0]
+        self.assertEqual(client.id, project.client_id)
+        self.assertEqual((project_.id, project_.name), (project.id, 'project_x'))
+        self.assertEqual((user_.id, user_.name), (user.id, 'user_x'))
+        self.assertEqual(tracker.id, project.tracker_id)
+        self.assertEqual((ticket_id, desc, date, time), (1, u'work', day, 1.0))
@@ -1,3 +1,5 @@
+import mock
+
 from intranet3 import models
 from intranet3.testing import (
     IntranetTest,
@@ -145,3 +147,59 @@ class SelectorMappingTest(FactoryMixin, IntranetTest):
         self.assertEqual(sm.match(None, 'abc2', ''), None)
         self.assertEqual(sm.match(None, 'abc', '', 'def'), None)
         self.assertEqual(sm.match(None, 'abc', 'def', 'ghi'), None)
+
+    def test_match_many(self):
+        tracker = self.create_tracker()
+        p1 = self.create_project(tracker=tracker, project_selector='a')
+        p2 = self.create_project(
+            tracker=tracker, project_selector='b', component_selector='c',
+        )
+        sm = models.project.SelectorMapping(tracker)
+        bugs = [
+            mock.Mock(id='1', project_name='a', component_name='', version=''),
+            mock.Mock(id='2', project_name='b', component_name='c', version=''),
+            mock.Mock(id='3', project_name='d', component_name='', version=''),
+        ]
+        self.assertEqual(sm.match_many(bugs), [p1.id, p2.id, None])
+
+    def test_for_tracker(self):
+        SelectorMapping = models.project.SelectorMapping
+        tracker = self.create_tracker()
+        p1 = self.create_project(tracker=tracker, project_selector='a')
+
+        sm = SelectorMapping.for_tracker(tracker)
+        self.assertIs(SelectorMapping.for_tracker(tracker), sm)
+        self.assertEqual(sm.match(None, 'a', ''), p1.id)
+
+        p2 = self.create_project(tracker=tracker, project_selector='b')
+        SelectorMapping.invalidate_for(tracker.id)
+
+        sm = SelectorMapping.for_tracker(tracker)
+        self.assertEqual(sm.match(None, 'b', ''), p2.id)
+
+    def test_for_tracker_without_version(self):
+        SelectorMapping = models.project.SelectorMapping
+        tracker = self.create_tracker()
+        self.create_project(tracker=tracker, project_selector='a')
+
+        # memcache unavailable, no version to compare
+        with mock.patch.object(SelectorMapping, 'get_version', return_value=None):
+            sm = SelectorMapping.for_tracker(tracker)
+            p2 = self.create_project(tracker=tracker, project_selector='b')
+            SelectorMapping.invalidate_for(tracker.id)
+            rebuilt = SelectorMapping.for_tracker(tracker)
+        self.assertIsNot(rebuilt, sm)
+        self.assertEqual(rebuilt.match(None, 'b', ''), p2.id)
+
+    def test_for_tracker_expires(self):
+        SelectorMapping = models.project.SelectorMapping
+        tracker = self.create_tracker()
+        self.create_project(tracker=tracker, project_selector='a')
+
+        sm = SelectorMapping.for_tracker(tracker)
+        # project added without invalidate_for, e.g. by a script
+        p2 = self.create_project(tracker=tracker, project_selector='b')
+        with mock.patch.object(SelectorMapping, 'INDEX_TTL', 0):
+            rebuilt = SelectorMapping.for_tracker(tracker)
+        self.assertIsNot(rebuilt, sm)
+        self.assertEqual(rebuilt.match(None, 'b', ''), p2.id)
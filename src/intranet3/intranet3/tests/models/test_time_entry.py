@@ -0,0 +1,106 @@
+import datetime
+
+from intranet3 import models
+from intranet3.testing import (
+    IntranetTest,
+    FactoryMixin,
+)
+
+
+class TicketTimesTest(FactoryMixin, IntranetTest):
+
+    def add_entry(self, ticket_id, project, date, time, deleted=False):
+        entry = models.TimeEntry(
+            user_id=self.user.id,
+            date=date,
+            time=time,
+            description=u'work',
+            ticket_id=ticket_id,
+            project_id=project.id,
+            deleted=deleted,
+        )
+        models.DBSession.add(entry)
+
+    def test_ticket_times(self):
+        self.user = self.create_user()
+        project_x = self.create_project(user=self.user)
+        project_y = self.create_project(user=self.user)
+        self.add_entry(1, project_x, datetime.date(2014, 5, 1), 1.0)
+        self.add_entry(1, project_x, datetime.date(2014, 5, 10), 2.0)
+        self.add_entry(1, project_x, datetime.date(2014, 5, 11), 4.0, deleted=True)
+        self.add_entry(1, project_y, datetime.date(2014, 5, 10), 8.0)
+        self.add_entry(2, project_x, datetime.date(2014, 5, 10), 16.0)
+        models.DBSession.flush()
+
+        times = models.TimeEntry.get_ticket_times(
+            [('1', project_x.id), ('1', project_y.id), ('3', project_x.id)],
+            datetime.date(2014, 5, 5),
+            datetime.date(2014, 5, 14),
+        )
+        self.assertEqual(times, {
+            ('1', project_x.id): (3.0, 2.0),
+            ('1', project_y.id): (8.0, 8.0),
+        })
+
+        times = models.TimeEntry.get_ticket_times([('2', project_x.id)])
+        self.assertEqual(times, {('2', project_x.id): (16.0, 0.0)})
+        self.assertEqual(models.TimeEntry.get_ticket_times([]), {})
+
+
+class TimeRollupTest(FactoryMixin, IntranetTest):
+
+    def rollup(self):
+        rows = models.DBSession.query(models.TimeRollup).all()
+        return sorted(
+            (row.project_id, row.ticket_id, row.user_id, row.date, row.time)
+            for row in rows
+        )
+
+    def test_rollup_follows_entries(self):
+        user = self.create_user()
+        project = self.create_project(user=user)
+        day = datetime.date(2014, 5, 1)
+        next_day = datetime.date(2014, 5, 2)
+        entries = [
+            models.TimeEntry(
+                user_id=user.id, date=day, time=time, description=u'work',
+                ticket_id=1, project_id=project.id,
+            )
+            for time in (1.0, 2.0)
+        ]
+        models.DBSession.add_all(entries)
+        models.DBSession.flush()
+        self.assertEqual(self.rollup(), [(project.id, 1, user.id, day, 3.0)])
+
+        entries[0].time = 4.0
+        entries[1].date = next_day
+        models.DBSession.flush()
+        self.assertEqual(self.rollup(), [
+            (project.id, 1, user.id, day, 4.0),
+            (project.id, 1, user.id, next_day, 2.0),
+        ])
+
+        entries[0].deleted = True
+        models.DBSession.delete(entries[1])
+        models.DBSession.flush()
+        self.assertEqual(self.rollup(), [])
+        self.assertEqual(models.TimeRollup.verify(), [])
+
+    def test_rebuild(self):
+        user = self.create_user()
+        project = self.create_project(user=user)
+        day = datetime.date(2014, 5, 1)
+        models.DBSession.add(models.TimeEntry(
+            user_id=user.id, date=day, time=1.5, description=u'work',
+            project_id=project.id,
+        ))
+        models.DBSession.flush()
+        models.DBSession.execute('DELETE FROM time_rollup')
+
+        self.assertEqual(
+            [tuple(row) for row in models.TimeRollup.verify()],
+            [(project.id, None, user.id, day, None, 1.5)],
+        )
+        models.TimeRollup.rebuild(day, day)
+        self.assertEqual(self.rollup(), [(project.id, None, user.id, day, 1.5)])
+        self.assertEqual(models.TimeRollup.verify(), [])
@@ -0,0 +1,50 @@
+from intranet3 import models
+from intranet3.testing import (
+    IntranetTest,
+    FactoryMixin,
+)
+
+
+class TrackerCredentialsCacheTest(FactoryMixin, IntranetTest):
+
+    def test_logins_mappings(self):
+        TrackerCredentials = models.TrackerCredentials
+        tracker1 = self.create_tracker()
+        tracker2 = self.create_tracker()
+        user1 = self.create_user()
+        user2 = self.create_user()
+        self.add_creds(user1, tracker1, 'UserX', password='secret')
+        self.add_creds(user2, tracker1, 'usery')
+        self.add_creds(user1, tracker2, 'userz')
+
+        mappings = TrackerCredentials.get_logins_mappings([tracker1, tracker2])
+        self.assertEqual(mappings, {
+            tracker1.id: {'userx': user1, 'usery': user2},
+            tracker2.id: {'userz': user1},
+        })
+        credentials = TrackerCredentials.get_all_credentials([tracker1.id])
+        self.assertEqual(credentials[tracker1.id][user1.id], ('UserX', 'secret'))
+
+    def test_invalidated_on_save(self):
+        TrackerCredentials = models.TrackerCredentials
+        tracker = self.create_tracker()
+        user1 = self.create_user()
+        user2 = self.create_user()
+        creds = self.add_creds(user1, tracker, 'userx')
+        self.assertEqual(
+            TrackerCredentials.get_logins_mapping(tracker), {'userx': user1},
+        )
+
+        self.add_creds(user2, tracker, 'usery')
+        creds.login = 'userz'
+        models.DBSession.flush()
+        self.assertEqual(
+            TrackerCredentials.get_logins_mapping(tracker),
+            {'userz': user1, 'usery': user2},
+        )
+
+        models.DBSession.delete(creds)
+        models.DBSession.flush()
+        self.assertEqual(
+            TrackerCredentials.get_logins_mapping(tracker), {'usery': user2},
+        )
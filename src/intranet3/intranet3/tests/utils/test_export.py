@@ -0,0 +1,35 @@
+import datetime
+import os
+import unittest
+import zipfile
+from StringIO import StringIO
+
+from intranet3.utils import export
+
+
+class XlsxExportTest(unittest.TestCase):
+
+    headings = ('Client', 'Time')
+
+    def rows(self):
+        yield (u'client_x', 1.5)
+        yield (u'client_y', datetime.date(2014, 5, 1))
+
+    def read_sheet(self, file_):
+        return zipfile.ZipFile(file_).read('xl/worksheets/sheet1.xml')
+
+    def test_response(self):
+        response = export.xlsx_response('report', 'Hours', self.headings, self.rows())
+        body = ''.join(response.app_iter)
+        response.app_iter.close()
+
+        self.assertEqual(response.content_type, export.XLSX_CONTENT_TYPE)
+        self.assertEqual(response.content_length, len(body))
+        self.assertIn('filename="report.xlsx"', response.content_disposition)
+        self.assertIn('client_y', self.read_sheet(StringIO(body)))
+
+    def test_file_removed(self):
+        with export.xlsx_file('05-2014', 'Hours', self.headings, self.rows()) as path:
+            self.assertTrue(path.endswith('/05-2014.xlsx'))
+            self.assertIn('client_x', self.read_sheet(path))
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
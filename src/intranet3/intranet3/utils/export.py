@@ -0,0 +1,94 @@
+"""
+Spreadsheet exports written row by row.
+
+Rows are written to XLSX with XlsxWriter in constant memory mode (every
+row is flushed to disk when the next one starts) into an anonymous
+temporary file, so concurrent exports never share a path and nothing is
+left behind. Responses stream the file in blocks.
+"""
+import datetime
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import xlsxwriter
+from pyramid.response import Response, FileIter
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# rows fetched from server side cursor at a time
+STREAM_ROWS = 1000
+BLOCK_SIZE = 64 * 1024
+
+
+def stream(query, rows=STREAM_ROWS):
+    """ Iterates query results from server side cursor, rows at a time """
+    return query.execution_options(stream_results=True).yield_per(rows)
+
+
+def write_xlsx(file_, sheet_name, headings, rows, widths=None):
+    """
+    Writes headings and rows (iterables of cell values) to file path or
+    file object, dates are formatted as DD/MM/YYYY, widths are in characters
+    """
+    workbook = xlsxwriter.Workbook(file_, {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        'default_date_format': 'dd/mm/yyyy',
+    })
+    sheet = workbook.add_worksheet(sheet_name)
+    heading_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'align': 'center',
+        'valign': 'vcenter',
+    })
+    for i, width in enumerate(widths or ()):
+        sheet.set_column(i, i, width)
+    sheet.freeze_panes(1, 0)
+
+    sheet.write_row(0, 0, headings, heading_format)
+    for j, row in enumerate(rows, 1):
+        sheet.write_row(j, 0, row)
+    workbook.close()
+
+
+def xlsx_response(name, sheet_name, headings, rows, widths=None):
+    """
+    Response with rows written as name.xlsx attachment,
+    file is removed when response is closed
+    """
+    file_ = tempfile.TemporaryFile()
+    try:
+        write_xlsx(file_, sheet_name, headings, rows, widths)
+        size = file_.tell()
+        file_.seek(0)
+    except Exception:
+        file_.close()
+        raise
+    response = Response(
+        content_type=XLSX_CONTENT_TYPE,
+        app_iter=FileIter(file_, BLOCK_SIZE),
+        content_length=size,
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.content_disposition = 'attachment; filename="%s.xlsx"' % name
+    return response
+
+
+def report_name():
+    return 'report-%s' % datetime.datetime.now().strftime('%d-%m-%Y--%H-%M-%S')
+
+
+@contextmanager
+def xlsx_file(name, sheet_name, headings, rows, widths=None):
+    """
+    Yields path of name.xlsx with rows written in a private
+    temporary directory, removed afterwards (e.g. for mail attachments)
+    """
+    directory = tempfile.mkdtemp(prefix='intranet-export-')
+    try:
+        path = '%s/%s.xlsx' % (directory, name)
+        write_xlsx(path, sheet_name, headings, rows, widths)
+        yield path
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -1,5 +1,6 @@
 import re
 import time
+import datetime
 import json
 
 import markdown
@@ -21,6 +22,16 @@ def parse_user_email(value):
 def parse_datetime_to_miliseconds(value):
     return int(time.mktime(value.timetuple()) * 1000)
 
+def timesince(value, now=None):
+    """ Human readable age of given datetime, like '5 min ago' """
+    now = now or datetime.datetime.now()
+    minutes = int((now - value).total_seconds() // 60)
+    if minutes < 1:
+        return 'just now'
+    if minutes < 60:
+        return '%s min ago' % minutes
+    return '%s h ago' % (minutes // 60)
+
 def timedelta_to_minutes(value):
     """Sum only whole minutes"""
     return int(value.days*24*60) + int(value.seconds / 60)
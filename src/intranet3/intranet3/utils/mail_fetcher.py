@@ -218,6 +218,7 @@ class TimeEntryMailExtractor(object):
     handle_cookie_trac_email = handle_trac_email
     handle_igozilla_email = handle_bugzilla_email
     handle_rockzilla_email = handle_bugzilla_email
+    handle_bugzilla_rpc_email = handle_bugzilla_email
 
     def match_tracker(self, msg):
         sender = decode(msg['From'])
@@ -290,13 +291,11 @@ class MailCheckerTask(object):
         username = config.google_user_email.encode('utf-8')
         password = config.google_user_password.encode('utf-8')
 
-        # TODO
-        logins_mappings = dict(
-            (tracker.id, TrackerCredentials.get_logins_mapping(tracker))
-                for tracker in trackers.itervalues()
+        logins_mappings = TrackerCredentials.get_logins_mappings(
+            trackers.values()
         )
         selector_mappings = dict(
-            (tracker.id, SelectorMapping(tracker))
+            (tracker.id, SelectorMapping.for_tracker(tracker))
                 for tracker in trackers.itervalues()
         )
 
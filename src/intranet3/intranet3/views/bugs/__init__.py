@@ -97,9 +97,10 @@ class MyJson(BaseView):
 
     def get(self):
         resolved = int(self.request.GET.get('resolved', 0))
-        bugs = Bugs(self.request).get_user(resolved)
+        fetcher = Bugs(self.request)
+        bugs = fetcher.get_user(resolved)
         bugs = sorted(bugs, cmp=h.sorting_by_severity)
-        return dict(bugs=bugs)
+        return dict(bugs=bugs, fetched_at=fetcher.fetched_at)
 
 
 @view_config(route_name='bug_report', permission='can_view_task_pivot')
@@ -1,4 +1,11 @@
 # -*- coding: utf-8 -*-
+import datetime
+import json
+import random
+
+import gevent
+import transaction
+from gevent.pool import Pool
 from pyramid.view import view_config
 from pyramid.response import Response
 from pyramid.renderers import render
@@ -6,7 +13,10 @@ from pyramid.renderers import render
 from intranet3 import config
 from intranet3.lib.bugs import Bugs
 from intranet3.log import INFO_LOG, DEBUG_LOG, EXCEPTION_LOG
-from intranet3.models import User, Project
+from intranet3.models import User, Project, Tracker, TrackerCredentials, Sprint, ApplicationConfig
+from intranet3.asyncfetchers import FETCHERS, get_fetcher, sync_tracker
+from intranet3.asyncfetchers import health as health_module, limiter
+from intranet3.asyncfetchers.metrics import METRICS
 from intranet3.utils import mail
 from intranet3.utils.views import CronView
 from intranet3.models import DBSession
@@ -77,3 +87,134 @@ class OldBugsReport(CronView):
         self._send_report(None, config['MANAGER_EMAIL'], bugs)
 
         return Response('ok')
+
+
+@view_config(route_name='cron_bugs_syncmirror', permission='cron')
+class SyncMirror(CronView):
+    """
+    Incrementally synchronizes local bug mirror with all trackers,
+    manager's credentials are preferred
+    """
+
+    def action(self):
+        entries = DBSession.query(Tracker, TrackerCredentials, User) \
+                           .filter(TrackerCredentials.tracker_id == Tracker.id) \
+                           .filter(TrackerCredentials.user_id == User.id) \
+                           .order_by(Tracker.id, User.email != config['MANAGER_EMAIL'])
+
+        synced = set()
+        for tracker, credentials, user in entries:
+            if tracker.id in synced:
+                continue
+            synced.add(tracker.id)
+            fetcher_class = FETCHERS.get(tracker.type)
+            if fetcher_class is None or not fetcher_class.SUPPORTS_MIRROR:
+                DEBUG(u'Tracker %s does not support bug mirror' % tracker.name)
+                continue
+            mapping = TrackerCredentials.get_logins_mapping(tracker)
+            fetcher = get_fetcher(tracker, credentials, user, mapping)
+            try:
+                sync_tracker(fetcher)
+            except Exception as e:
+                EXCEPTION(u'Could not synchronize tracker %s: %s' % (
+                    tracker.name, e,
+                ))
+
+        return Response('ok')
+
+
+@view_config(route_name='cron_bugs_warmcache', permission='cron')
+class WarmCache(CronView):
+    """
+    Refetches the most used bug lists before their cache entries go stale:
+    all bugs of the manager and of the hours per ticket user (bug reports)
+    and bugs of all active sprints (sprint boards).
+    Runs every INTERVAL seconds (see cron timer_tasks), at most CONCURRENCY
+    lists at once, each one delayed by random jitter so trackers don't get
+    all the queries at the same moment.
+    """
+    INTERVAL = 2 * 60
+    CONCURRENCY = 3
+    JITTER = 15  # seconds
+
+    # entries that would go stale before the next run are refetched now
+    REFRESH_AHEAD = INTERVAL + JITTER
+
+    def _users(self):
+        """ Returns (manager, hours per ticket user), both may be None """
+        manager = DBSession.query(User) \
+                           .filter(User.email == config['MANAGER_EMAIL']) \
+                           .first()
+        config_obj = ApplicationConfig.get_current_config()
+        hours_user = None
+        if config_obj and config_obj.hours_ticket_user_id:
+            hours_user = User.query.get(config_obj.hours_ticket_user_id)
+        return manager, hours_user
+
+    def _jobs(self):
+        """ Yields (description, callable) """
+        manager, hours_user = self._users()
+        for user in set([manager, hours_user]) - set([None]):
+            yield u'all bugs of %s' % user.email, \
+                lambda user=user: self._bugs(user).get_all()
+
+        if hours_user is None:
+            return
+        today = datetime.date.today()
+        sprints = Sprint.query.filter(Sprint.start <= today) \
+                              .filter(Sprint.end >= today)
+        for sprint in sprints:
+            yield u'bugs of sprint %s' % sprint.name, \
+                lambda sprint=sprint: self._bugs(hours_user).get_sprint(sprint)
+
+    def _bugs(self, user):
+        # mirrored reads don't touch the fetcher cache, always warm live fetchers
+        return Bugs(
+            self.request, user, mirror=False, refresh_ahead=self.REFRESH_AHEAD,
+        )
+
+    def _run(self, description, job):
+        gevent.sleep(random.uniform(0, self.JITTER))
+        try:
+            bugs = job()
+            DEBUG(u'Warmed cache of %s (%s bugs)' % (description, len(bugs)))
+        except Exception as e:
+            EXCEPTION(u'Could not warm cache of %s: %s' % (description, e))
+        finally:
+            # the greenlet has its own session and transaction
+            transaction.abort()
+            DBSession.remove()
+
+    def action(self):
+        jobs = list(self._jobs())
+        pool = Pool(self.CONCURRENCY)
+        for description, job in jobs:
+            pool.spawn(self._run, description, job)
+        pool.join()
+        LOG(u'Warmed %s bug lists' % len(jobs))
+        return Response('ok')
+
+
+@view_config(route_name='cron_bugs_fetchermetrics', permission='cron')
+class FetcherMetrics(CronView):
+    """
+    Fetcher metrics of this process as JSON (with tracker health
+    and host limiters), ?format=prometheus for Prometheus text format
+    """
+
+    def action(self):
+        if self.request.GET.get('format') == 'prometheus':
+            return Response(
+                METRICS.to_prometheus().encode('utf-8'),
+                content_type='text/plain',
+                charset='utf-8',
+            )
+        data = dict(
+            fetchers=METRICS.to_dict(),
+            trackers=dict(
+                (health.name, health.to_dict())
+                for health in health_module.TRACKERS.itervalues()
+            ),
+            hosts=limiter.stats(),
+        )
+        return Response(json.dumps(data), content_type='application/json')
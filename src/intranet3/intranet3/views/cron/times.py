@@ -2,7 +2,6 @@
 from operator import itemgetter
 import os
 import datetime
-import xlwt
 import copy
 from dateutil.relativedelta import relativedelta
 from collections import defaultdict
@@ -20,6 +19,7 @@ from intranet3.utils.views import CronView
 from intranet3.views.report.wrongtime import AnnuallyReportMixin
 from intranet3.models import TimeEntry, Tracker, Project, Client, User, ApplicationConfig, Holiday, DBSession
 from intranet3.utils import mail
+from intranet3.utils import export
 from intranet3.log import WARN_LOG, ERROR_LOG, DEBUG_LOG, INFO_LOG, EXCEPTION_LOG
 
 LOG = INFO_LOG(__name__)
@@ -43,14 +43,8 @@ class ExcelReport(CronView):
 
     def _format_row(self, a_row):
         row = list(a_row)
-        row[0] = (row[0],)                                         #client
-        row[1] = (row[1],)                                         #project
-        row[2] = (row[2],)                                         #ticketid
-        row[3] = (row[3],)                                         #email
-        row[4] = (unicode(row[4]),)                                #desc
-        date_xf = xlwt.easyxf(num_format_str='DD/MM/YYYY')
-        row[5] = (row[5], date_xf)                                 #date
-        row[6] = (round(row[6], 2),)                               #time
+        row[4] = unicode(row[4])                                   #desc
+        row[6] = round(row[6], 2)                                  #time
         return row
 
     def action(self):
@@ -69,39 +63,22 @@ class ExcelReport(CronView):
                                .filter(TimeEntry.date<=end)\
                                .filter(TimeEntry.deleted==False)
         uber_query = uber_query.order_by(Client.name, Project.name, TimeEntry.ticket_id, User.name)
-        data = uber_query.all()
+        data = export.stream(uber_query)
 
-        wbk = xlwt.Workbook()
-        sheet = wbk.add_sheet('%s.xls' % start.strftime('%m-%Y'))
-
-        heading_xf = xlwt.easyxf('font: bold on; align: wrap on, vert centre, horiz center')
         headings = ('Klient','Projekt', 'Ticket id', 'Pracownik', 'Opis', 'Data', 'Czas')
-        headings_width = (x*256 for x in (20, 30, 10, 40, 100, 12, 10))
-        for colx, value in enumerate(headings):
-            sheet.write(0, colx, value, heading_xf)
-        for i, width in enumerate(headings_width):
-            sheet.col(i).width = width
-
-        sheet.set_panes_frozen(True)
-        sheet.set_horz_split_pos(1)
-        sheet.set_remove_splits(True)
-
-        for j, row in enumerate(data):
-            row = self._format_row(row)
-            for i, cell in enumerate(row):
-                sheet.write(j+1,i,*cell)
-
-        file_path = '/tmp/%s.xls' % start.strftime('%m-%Y')
-        wbk.save(file_path)
+        rows = (self._format_row(row) for row in data)
+        name = start.strftime('%m-%Y')
         topic = '[intranet] Excel with projects hours'
         message = 'Excel with projects hours'
-        with mail.EmailSender() as email_sender:
-            email_sender.send(
-                config['MANAGER_EMAIL'],
-                topic,
-                message,
-                file_path=file_path,
-            )
+        with export.xlsx_file(name, name, headings, rows,
+                              widths=(20, 30, 10, 40, 100, 12, 10)) as file_path:
+            with mail.EmailSender() as email_sender:
+                email_sender.send(
+                    config['MANAGER_EMAIL'],
+                    topic,
+                    message,
+                    file_path=file_path,
+                )
         return Response('ok')
 
 
@@ -144,16 +121,12 @@ class TodayHours(CronView):
     def _today_hours(self, date, projects, omit_users):
         time_entries = DBSession.query('uid', 'user', 'description', 'time',
             'project', 'client', 'ticket_id', 'tracker_id',
-            'total_time').from_statement("""
+            'project_id').from_statement("""
                 SELECT
                     u.id as "uid", u.name as "user", t.description as "description",
                     t.time as "time", p.name as "project", c.name as "client",
                     t.ticket_id as "ticket_id", p.tracker_id as "tracker_id",
-                    (
-                        SELECT SUM(te.time)
-                        FROM time_entry te
-                        WHERE te.ticket_id=t.ticket_id
-                    ) as "total_time"
+                    p.id as "project_id"
                 FROM
                     time_entry as t, project as p, client as c, "user" as u
                 WHERE
@@ -172,13 +145,19 @@ class TodayHours(CronView):
             LOG(s)
             return s
 
+        total_times = TimeEntry.get_ticket_times(
+            (entry.ticket_id, entry.project_id)
+            for entry in time_entries if entry.ticket_id
+        )
+
         output = []
         total_sum = 0
         user_sum = defaultdict(lambda: 0.0)
         user_entries = defaultdict(lambda: [])
         trackers = {}
         for (uid, user, description, time, project, client, ticket_id, tracker_id,
-             total_time) in time_entries:
+             project_id) in time_entries:
+            total_time = total_times.get((str(ticket_id), project_id), (0.0, 0.0))[0]
             # Lazy dict filling
             if not tracker_id in trackers:
                 trackers[tracker_id] = Tracker.query.get(tracker_id)
@@ -390,12 +369,11 @@ class ClientHours(CronView):
                 c.name as client,
                 COALESCE(SUM(t.time), 0) as "time"
             FROM
-                time_entry t,
+                time_rollup t,
                 project p,
                 "user" u,
                 client c
             WHERE
-                t.deleted = FALSE AND
                 t.project_id = p.id AND
                 p.client_id = c.id AND
                 t.user_id = u.id
@@ -484,10 +462,9 @@ class MissedHours(CronView):
                 u.email as "email",
                 MIN(t.date) as "date"
             FROM
-                time_entry t,
+                time_rollup t,
                 "user" u
             WHERE
-                t.deleted = FALSE AND
                 NOT ( u.groups @> '{"freelancer"}' ) AND
                 t.user_id = u.id AND
                 u.is_active = true AND
@@ -533,11 +510,10 @@ class MissedHours(CronView):
                 date_trunc('month', t.date) as "month",
                 COALESCE(SUM(t.time), 0) as "time"
             FROM
-                time_entry t,
+                time_rollup t,
                 "user" u
             WHERE
                 t.user_id = u.id AND
-                t.deleted = FALSE AND
                 NOT ( u.groups @> '{"freelancer"}' ) AND
                 u.is_active = true AND
                 (u.start_full_time_work IS NOT NULL AND t.date >= u.start_full_time_work AND t.date >= :date_start) AND
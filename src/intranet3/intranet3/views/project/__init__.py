@@ -67,6 +67,7 @@ class Edit(BaseView):
         # hack, when user has no permision can_edit_projects (that means that he has only scrum perms)
         # we do not validate the form
         if self.request.method == 'POST' and (not self.request.has_perm('can_edit_projects') or form.validate()):
+            old_tracker_id = project.tracker_id
             project.working_agreement = form.working_agreement.data
             project.definition_of_done = form.definition_of_done.data
             project.definition_of_ready = form.definition_of_ready.data
@@ -93,6 +94,9 @@ class Edit(BaseView):
             self.flash(self._(u"Project saved"))
             LOG(u"Project saved")
             SelectorMapping.invalidate_for(project.tracker_id)
+            if str(old_tracker_id) != str(project.tracker_id):
+                # project moved, the old tracker must not map to it anymore
+                SelectorMapping.invalidate_for(old_tracker_id)
             return HTTPFound(location=self.request.url_for('/project/edit', project_id=project.id))
         return dict(project_id=project.id, form=form)
 
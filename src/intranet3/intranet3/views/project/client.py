@@ -10,7 +10,7 @@ from pyramid.httpexceptions import HTTPBadRequest, HTTPForbidden, HTTPNotFound
 from intranet3.models import Project, Sprint, DBSession
 from intranet3.utils.views import BaseView
 from intranet3.log import INFO_LOG, WARN_LOG, ERROR_LOG, DEBUG_LOG, EXCEPTION_LOG
-from intranet3.lib.times import TimesReportMixin, HTMLRow
+from intranet3.lib.times import TimesReportMixin, HTMLRow, report_entries
 from intranet3.lib.scrum import get_velocity_chart_data
 from intranet3.forms.times import ProjectTimeForm
 from intranet3.forms.scrum import SprintListFilterForm
@@ -59,7 +59,7 @@ class Times(TimesReportMixin, BaseView):
             start_date, end_date, projects, [], ticket_choice,
         )
 
-        entries = uber_query.all()
+        entries = list(report_entries(uber_query))
 
         participation_of_workers = self._get_participation_of_workers(entries)
 
@@ -21,7 +21,7 @@ from intranet3 import helpers as h
 
 from intranet3.log import INFO_LOG, ERROR_LOG
 from intranet3.lib.scrum import SprintWrapper, get_velocity_chart_data
-from intranet3.lib.times import TimesReportMixin, HTMLRow
+from intranet3.lib.times import TimesReportMixin, HTMLRow, report_entries
 from intranet3.lib.bugs import Bugs
 from intranet3.forms.times import ProjectTimeForm
 from intranet3.forms.scrum import SprintListFilterForm
@@ -238,14 +238,13 @@ class Times(ClientProtectionMixin, TimesReportMixin, FetchBugsMixin,
         uber_query = self._prepare_uber_query_for_sprint(
             sprint, bugs, ticket_choice
         )
-        entries = uber_query.all()
-
         if self.request.GET.get('excel'):
             from intranet3.lib.times import dump_entries_to_excel
-            file, response = dump_entries_to_excel(
-                entries, group_by, bigger_than
+            return dump_entries_to_excel(
+                report_entries(uber_query), group_by, bigger_than
             )
-            return response
+
+        entries = list(report_entries(uber_query))
 
         participation_of_workers = self._get_participation_of_workers(entries)
 
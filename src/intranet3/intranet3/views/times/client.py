@@ -3,11 +3,9 @@ import calendar
 import datetime
 from operator import itemgetter
 
-import xlwt
 from sqlalchemy import func
 from pyramid.view import view_config
 from pyramid.httpexceptions import HTTPBadRequest, HTTPFound
-from pyramid.response import Response
 
 from intranet3 import config
 from intranet3.utils.views import BaseView
@@ -15,6 +13,7 @@ from intranet3.forms.times import ClientTimeForm
 from intranet3.log import INFO_LOG
 from intranet3.models import Client, Project, TimeEntry, DBSession
 from intranet3 import helpers as h
+from intranet3.utils import export
 
 LOG = INFO_LOG(__name__)
 
@@ -93,66 +92,33 @@ class Report(BaseView):
 @view_config(route_name='times_client_per_client_per_employee_excel', permission='can_view_time_client_report')
 class PerClientPerEmployeeExcel(BaseView):
     def _to_excel(self, rows):
-        wbk = xlwt.Workbook()
-        sheet = wbk.add_sheet('Hours')
-
-        heading_xf = xlwt.easyxf('font: bold on; align: wrap on, vert centre, horiz center')
         headings = ('Client name', 'Employee', 'Client time', 'Month', 'Month time')
-        for colx, value in enumerate(headings):
-            sheet.write(0, colx, value, heading_xf)
-        #headings_width = (x*256 for x in (20, 20, 40, 12, 10))
-        #for i, width in enumerate(headings_width):
-        #    sheet.col(i).width = width
-
-
-        sheet.set_panes_frozen(True)
-        sheet.set_horz_split_pos(1)
-        sheet.set_remove_splits(True)
-
-        for j, row in enumerate(rows):
-            for i, cell in enumerate(row):
-                sheet.write(j+1, i, cell)
-
-        file_path = '/tmp/tmp.xls'
-        wbk.save(file_path)
-
-        file_ = open(file_path, 'rb')
-
-        return file_
+        return export.xlsx_response(
+            export.report_name(), 'Hours', headings, rows,
+        )
 
     def post(self):
-        rows = DBSession.query('cid', 'cname', 'uid', 'uemail', 'date', 'time').from_statement("""
-        SELECT c.id as cid, c.name as cname, u.id as uid, u.email as uemail, date_trunc('month', t.date) as date, SUM(t.time) as time
-        FROM time_entry t, project p, client c, "user" u
+        rows = DBSession.query('cname', 'uemail', 'date', 'time', 'month_time').from_statement("""
+        SELECT c.name as cname, u.email as uemail, date_trunc('month', t.date) as date, SUM(t.time) as time,
+               SUM(SUM(t.time)) OVER (PARTITION BY u.id, date_trunc('month', t.date)) as month_time
+        FROM time_rollup t, project p, client c, "user" u
         WHERE t.project_id = p.id AND
               p.client_id = c.id AND
-              t.user_id = u.id AND
-              t.deleted = false
+              t.user_id = u.id
         GROUP BY c.id, c.name, u.id, u.email, date_trunc('month', t.date)
         ORDER BY date_trunc('month', t.date)
-        """).all()
-
-        monthly = h.groupby(rows, lambda row: (row[2], row[-2]), lambda row: row[5])
-
-        rows = [(
-            row[1],
-            row[3],
-            row[5],
-            row[4].strftime('%Y-%m-%d'),
-            sum(monthly[row[2], row[-2]]),
-        ) for row in rows]
-
+        """)
 
-        stream = self._to_excel(rows)
+        rows = ((
+            cname,
+            uemail,
+            time,
+            date.strftime('%Y-%m-%d'),
+            month_time,
+        ) for cname, uemail, date, time, month_time in export.stream(rows))
 
-        response = Response(
-            content_type='application/vnd.ms-excel',
-            app_iter=stream,
-        )
-        response.headers['Cache-Control'] = 'no-cache'
-        response.content_disposition = 'attachment; filename="report-%s.xls"' % datetime.datetime.now().strftime('%d-%m-%Y--%H-%M-%S')
 
-        return response
+        return self._to_excel(rows)
 
 
 @view_config(route_name='times_client_current_pivot', permission='can_view_time_client_report')
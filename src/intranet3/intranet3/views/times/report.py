@@ -38,23 +38,26 @@ class Pivot(MonthMixin, BaseView):
         month_start, month_end = self._get_month()
 
         entries = DBSession.query('user_id', 'date', 'time', 'late_count').from_statement("""
-        SELECT t.user_id as "user_id", t.date as "date", (
-            SELECT COALESCE(SUM(h.time), 0.0) FROM
-            time_entry h
-            WHERE h.user_id = t.user_id
-            AND h.date = t.date
-            AND h.deleted = FALSE
-        ) as "time", (
-            SELECT COUNT(*)
-            FROM time_entry s
-            WHERE s.user_id = t.user_id
-            AND s.date = t.date
-            AND DATE(s.modified_ts) > s.date
-        ) as "late_count"
-        FROM time_entry t
-        WHERE t.date >= :month_start
-          AND t.date <= :month_end
-        GROUP BY t.user_id, t.date;
+        SELECT
+            COALESCE(h.user_id, s.user_id) as "user_id",
+            COALESCE(h.date, s.date) as "date",
+            COALESCE(h.time, 0.0) as "time",
+            COALESCE(s.late_count, 0) as "late_count"
+        FROM (
+            SELECT r.user_id, r.date, SUM(r.time) as time
+            FROM time_rollup r
+            WHERE r.date >= :month_start
+              AND r.date <= :month_end
+            GROUP BY r.user_id, r.date
+        ) h
+        FULL OUTER JOIN (
+            SELECT t.user_id, t.date, COUNT(*) as late_count
+            FROM time_entry t
+            WHERE t.date >= :month_start
+              AND t.date <= :month_end
+              AND DATE(t.modified_ts) > t.date
+            GROUP BY t.user_id, t.date
+        ) s ON h.user_id = s.user_id AND h.date = s.date;
         """).params(month_start=month_start, month_end=month_end)
 
         if not self.request.has_perm('can_see_users_times'):
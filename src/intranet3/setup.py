@@ -50,7 +50,7 @@ setup(
         'python-memcached==1.47',
         'pyOpenSSL<=0.13',
         'python-dateutil==1.5',
-        'xlwt<=0.7.4',
+        'XlsxWriter<3',
         'pil==1.1.7',
         'requests==2.1.0',
         'certifi',